@@ -1,9 +1,34 @@
+import dataclasses
 import math
-from collections.abc import Collection
+from collections.abc import Collection, Iterable, Iterator
+
+import numpy as np
 
 from chart_review import defines
 
 
+@dataclasses.dataclass(frozen=True)
+class ConfusionCounts:
+    """
+    Just the counts of a confusion matrix, without the note & label of each cell.
+
+    This is all that's needed for scoring and is much cheaper to build than confusion_matrix().
+    """
+
+    true_pos: int = 0
+    false_neg: int = 0
+    true_neg: int = 0
+    false_pos: int = 0
+
+    def __add__(self, other: "ConfusionCounts") -> "ConfusionCounts":
+        return ConfusionCounts(
+            true_pos=self.true_pos + other.true_pos,
+            false_neg=self.false_neg + other.false_neg,
+            true_neg=self.true_neg + other.true_neg,
+            false_pos=self.false_pos + other.false_pos,
+        )
+
+
 def confusion_matrix(
     annotations: defines.ProjectAnnotations,
     truth: str,
@@ -31,13 +56,7 @@ def confusion_matrix(
     annotator_mentions = annotations.mentions.get(annotator, defines.Mentions())
 
     # Only examine labels that were used by any compared annotators at least once
-    label_set = set()
-    for _v in truth_mentions.values():
-        label_set |= set(_v)
-    for _v in annotator_mentions.values():
-        label_set |= set(_v)
-    if labels:
-        label_set &= labels
+    label_set = compared_labels(annotations, [truth, annotator], labels)
 
     TP = list()  # True Positive
     FP = list()  # False Positive
@@ -67,18 +86,273 @@ def confusion_matrix(
     return {"TP": TP, "FN": FN, "FP": FP, "TN": TN}
 
 
-def score_kappa(matrix: dict) -> float:
+def classify_cells(
+    annotations: defines.ProjectAnnotations,
+    truth: str,
+    annotator: str,
+    note_range: Collection[int],
+    labels: defines.LabelSet | None = None,
+    errors_only: bool = False,
+) -> Iterator[tuple[int, defines.Label, str]]:
+    """
+    Yields the classification (TP, FN, TN, or FP) of each confusion matrix cell, one at a time.
+
+    Cells come out sorted by note and then by label, so they can be streamed out as-is.
+    This is the same information as confusion_matrix, but in a form that's cheap to walk through.
+
+    :param annotations: prepared map of annotators & mentions
+    :param truth: annotator to use as the ground truth
+    :param annotator: another annotator to compare with truth
+    :param note_range: collection of LabelStudio document ID
+    :param labels: (optional) collection of labels to consider examining
+    :param errors_only: whether to only yield FN & FP cells (which skips a lot of work)
+    :return: iterator of (note ID, label, classification)
+    """
+    truth_mentions = annotations.mentions.get(truth, defines.Mentions())
+    annotator_mentions = annotations.mentions.get(annotator, defines.Mentions())
+
+    # Only examine labels that were used by any compared annotators at least once
+    label_set = compared_labels(annotations, [truth, annotator], labels)
+    sorted_labels = sorted(label_set)
+
+    for note_id in sorted(note_range):
+        truth_note_mentions = truth_mentions.get(note_id, set())
+        annotator_note_mentions = annotator_mentions.get(note_id, set())
+
+        if errors_only:
+            # Errors only happen where the annotators disagree, so just look at those labels
+            for label in sorted(label_set & (truth_note_mentions ^ annotator_note_mentions)):
+                yield note_id, label, "FN" if label in truth_note_mentions else "FP"
+            continue
+
+        for label in sorted_labels:
+            truth_positive = label in truth_note_mentions
+            annotator_positive = label in annotator_note_mentions
+
+            if truth_positive and annotator_positive:
+                yield note_id, label, "TP"
+            elif truth_positive:
+                yield note_id, label, "FN"
+            elif annotator_positive:
+                yield note_id, label, "FP"
+            else:
+                yield note_id, label, "TN"
+
+
+def confusion_counts(
+    annotations: defines.ProjectAnnotations,
+    truth: str,
+    annotator: str,
+    note_range: Collection[int],
+    labels: defines.LabelSet | None = None,
+) -> ConfusionCounts:
+    """
+    Like confusion_matrix, but only counts each kind of cell, without recording which is which.
+
+    :param annotations: prepared map of annotators & mentions
+    :param truth: annotator to use as the ground truth
+    :param annotator: another annotator to compare with truth
+    :param note_range: collection of LabelStudio document ID
+    :param labels: (optional) collection of labels to consider examining
+    :return: the counts of each kind of confusion matrix cell
+    """
+    by_label = confusion_counts_by_label(annotations, truth, annotator, note_range, labels=labels)
+    return sum(by_label.values(), ConfusionCounts())
+
+
+def confusion_counts_by_label(
+    annotations: defines.ProjectAnnotations,
+    truth: str,
+    annotator: str,
+    note_range: Collection[int],
+    labels: defines.LabelSet | None = None,
+) -> dict[defines.Label, ConfusionCounts]:
+    """
+    Counts the confusion matrix cells for every label at once, in a single sweep over the notes.
+
+    Counts for a group of labels (like all labels, or a sublabel wildcard) are just the sum of
+    the counts for each label in the group.
+
+    :param annotations: prepared map of annotators & mentions
+    :param truth: annotator to use as the ground truth
+    :param annotator: another annotator to compare with truth
+    :param note_range: collection of LabelStudio document ID
+    :param labels: (optional) collection of labels to consider examining
+    :return: label -> counts, for every given label (or every used label, if none were given).
+        Labels that neither annotator used have counts of all zeros.
+    """
+    label_counts, _ = confusion_counts_with_rollups(
+        annotations, truth, annotator, note_range, labels=labels
+    )
+    return label_counts
+
+
+def confusion_counts_with_rollups(
+    annotations: defines.ProjectAnnotations,
+    truth: str,
+    annotator: str,
+    note_range: Collection[int],
+    labels: defines.LabelSet | None = None,
+    any_positive: bool = False,
+) -> tuple[dict[defines.Label, ConfusionCounts], dict[defines.Label, ConfusionCounts]]:
+    """
+    Like confusion_counts_by_label, but also rolls sublabels up into wildcard aggregates.
+
+    Each sublabel value (like "Cough|Severity|High") rolls up into a wildcard label for its
+    sublabel (like "Cough|Severity|*").
+
+    By default, a wildcard's counts are the sum of its sublabel values' counts, which costs
+    nothing extra. With any_positive, a wildcard is instead scored once per note, as positive if
+    any of its sublabel values are positive. These are tallied in the same sweep as the labels.
+
+    :param annotations: prepared map of annotators & mentions
+    :param truth: annotator to use as the ground truth
+    :param annotator: another annotator to compare with truth
+    :param note_range: collection of LabelStudio document ID
+    :param labels: (optional) collection of labels to consider examining
+    :param any_positive: whether to score wildcards per note rather than by summing sublabels
+    :return: two dicts of label -> counts: one for each label and one for each wildcard label
+    """
+    truth_mentions = annotations.mentions.get(truth, defines.Mentions())
+    annotator_mentions = annotations.mentions.get(annotator, defines.Mentions())
+
+    label_set = compared_labels(annotations, [truth, annotator], labels)
+
+    parents = {}
+    if any_positive:
+        parents = {label: parent for label in label_set if (parent := rollup_label(label))}
+    keys = label_set | set(parents.values())
+
+    # Most cells are negative for both annotators, so we only visit the labels that either
+    # annotator actually mentioned, and then every other cell must be a true negative.
+    tp = dict.fromkeys(keys, 0)
+    fn = dict.fromkeys(keys, 0)
+    fp = dict.fromkeys(keys, 0)
+
+    for note_id in note_range:
+        truth_note_mentions = truth_mentions.get(note_id)
+        annotator_note_mentions = annotator_mentions.get(note_id)
+        if not truth_note_mentions and not annotator_note_mentions:
+            continue
+        truth_note_mentions = label_set.intersection(truth_note_mentions or ())
+        annotator_note_mentions = label_set.intersection(annotator_note_mentions or ())
+        _tally(truth_note_mentions, annotator_note_mentions, tp=tp, fn=fn, fp=fp)
+
+        if parents:
+            _tally(
+                {parents[label] for label in truth_note_mentions if label in parents},
+                {parents[label] for label in annotator_note_mentions if label in parents},
+                tp=tp,
+                fn=fn,
+                fp=fp,
+            )
+
+    note_count = len(note_range)
+    all_counts = {
+        key: ConfusionCounts(
+            true_pos=tp[key],
+            false_neg=fn[key],
+            true_neg=note_count - tp[key] - fn[key] - fp[key],
+            false_pos=fp[key],
+        )
+        for key in keys
+    }
+
+    label_counts = {label: ConfusionCounts() for label in labels or ()}
+    label_counts.update((label, all_counts[label]) for label in label_set)
+
+    if any_positive:
+        rollups = {
+            parent: ConfusionCounts() for label in label_counts if (parent := rollup_label(label))
+        }
+        rollups.update((parent, all_counts[parent]) for parent in parents.values())
+    else:
+        rollups = rollup_counts(label_counts)
+
+    return label_counts, rollups
+
+
+def compared_labels(
+    annotations: defines.ProjectAnnotations,
+    annotators: Iterable[str],
+    labels: defines.LabelSet | None = None,
+) -> defines.LabelSet:
+    """
+    Returns the labels worth examining: those used by any of the annotators at least once.
+
+    :param annotations: prepared map of annotators & mentions
+    :param annotators: the compared annotators
+    :param labels: (optional) collection of labels to limit the result to
+    :return: the used labels (limited to the given labels, if any)
+    """
+    label_set = set()
+    for annotator in annotators:
+        for note_labels in annotations.mentions.get(annotator, defines.Mentions()).values():
+            label_set |= set(note_labels)
+    if labels:
+        label_set &= labels
+    return label_set
+
+
+def _tally(
+    truth_labels: defines.LabelSet,
+    annotator_labels: defines.LabelSet,
+    *,
+    tp: dict[defines.Label, int],
+    fn: dict[defines.Label, int],
+    fp: dict[defines.Label, int],
+) -> None:
+    for label in truth_labels:
+        if label in annotator_labels:
+            tp[label] += 1
+        else:
+            fn[label] += 1
+    for label in annotator_labels - truth_labels:
+        fp[label] += 1
+
+
+def rollup_label(label: defines.Label) -> defines.Label | None:
+    """Returns the wildcard label that a sublabel value rolls up into, if any (like A|B|*)"""
+    if label.sublabel_name:
+        return defines.Label(label.label, label.sublabel_name, "*")
+    return None
+
+
+def rollup_counts(
+    label_counts: dict[defines.Label, ConfusionCounts],
+) -> dict[defines.Label, ConfusionCounts]:
+    """Sums up per-label counts into wildcard labels for each sublabel (see rollup_label)"""
+    rollups = {}
+    for label, counts in label_counts.items():
+        if parent := rollup_label(label):
+            rollups[parent] = rollups.get(parent, ConfusionCounts()) + counts
+    return rollups
+
+
+def _as_counts(matrix: dict | ConfusionCounts) -> ConfusionCounts:
+    if isinstance(matrix, ConfusionCounts):
+        return matrix
+    return ConfusionCounts(
+        true_pos=len(matrix["TP"]),
+        false_neg=len(matrix["FN"]),
+        true_neg=len(matrix["TN"]),
+        false_pos=len(matrix["FP"]),
+    )
+
+
+def score_kappa(matrix: dict | ConfusionCounts) -> float:
     """
     Computes Cohen kappa for pair-wise annotators.
     https://en.wikipedia.org/wiki/Cohen%27s_kappa
 
-    :param matrix: confusion matrix with TN/TP/FN/FP values
+    :param matrix: confusion matrix with TN/TP/FN/FP values (or just their counts)
     :return: Cohen kappa statistic
     """
-    tp = len(matrix["TP"])  # true positive
-    tn = len(matrix["TN"])  # true negative
-    fp = len(matrix["FP"])  # false positive
-    fn = len(matrix["FN"])  # false negative
+    counts = _as_counts(matrix)
+    return _kappa(tp=counts.true_pos, fn=counts.false_neg, tn=counts.true_neg, fp=counts.false_pos)
+
+
+def _kappa(*, tp: int, fn: int, tn: int, fp: int) -> float:
     total = tp + tn + fp + fn
     if not total:
         return math.nan
@@ -90,27 +364,29 @@ def score_kappa(matrix: dict) -> float:
     expected_pos = ((tp + fp) / total) * ((tp + fn) / total)
     expected_neg = ((tn + fp) / total) * ((tn + fn) / total)
     expected = expected_pos + expected_neg
+    if expected == 1:
+        return math.nan  # every cell agreed on a single class, kappa is undefined
 
     return (observed - expected) / (1 - expected)
 
 
-def score_matrix(matrix: dict) -> dict:
+def score_matrix(matrix: dict | ConfusionCounts) -> dict:
     """
     Score F1 and Kappa measures with precision (PPV) and recall (sensitivity).
     F1 deliberately ignores "True Negatives" because TN inflates scoring (AUROC)
     @return: dict with keys {'f1', 'precision', 'recall'} vals are %score
     """
-    true_pos = len(matrix["TP"])
-    true_neg = len(matrix["TN"])
-    false_pos = len(matrix["FP"])
-    false_neg = len(matrix["FN"])
+    return score_counts(**dataclasses.asdict(_as_counts(matrix)))
+
 
+def score_counts(*, true_pos: int, false_neg: int, true_neg: int, false_pos: int) -> dict:
+    """Like score_matrix, but for when you only have the confusion matrix counts."""
     sens = true_pos / (true_pos + false_neg) if (true_pos + false_neg) else math.nan
     spec = true_neg / (true_neg + false_pos) if (true_neg + false_pos) else math.nan
     ppv = true_pos / (true_pos + false_pos) if (true_pos + false_pos) else math.nan
     npv = true_neg / (true_neg + false_neg) if (true_neg + false_neg) else math.nan
     f1 = (2 * ppv * sens) / (ppv + sens) if (ppv + sens) else math.nan
-    kappa = score_kappa(matrix)
+    kappa = _kappa(tp=true_pos, fn=false_neg, tn=true_neg, fp=false_pos)
 
     return {
         "F1": f1,
@@ -126,6 +402,200 @@ def score_matrix(matrix: dict) -> dict:
     }
 
 
+def score_arrays(
+    *, true_pos: np.ndarray, false_neg: np.ndarray, true_neg: np.ndarray, false_pos: np.ndarray
+) -> dict[str, np.ndarray]:
+    """
+    Like score_counts, but scores whole arrays of counts at once (like every label or replicate).
+
+    Undefined scores (like a sensitivity with no positives) come out as NaN, as with score_counts.
+    """
+    tp, fn, tn, fp = (
+        np.asarray(x, dtype=float) for x in (true_pos, false_neg, true_neg, false_pos)
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sens = tp / (tp + fn)
+        spec = tn / (tn + fp)
+        ppv = tp / (tp + fp)
+        npv = tn / (tn + fn)
+        f1 = (2 * ppv * sens) / (ppv + sens)
+
+        total = tp + tn + fp + fn
+        observed = (tp + tn) / total
+        expected_pos = ((tp + fp) / total) * ((tp + fn) / total)
+        expected_neg = ((tn + fp) / total) * ((tn + fn) / total)
+        expected = expected_pos + expected_neg
+        kappa = np.where(expected == 1, np.nan, (observed - expected) / (1 - expected))
+
+    return {"F1": f1, "Sens": sens, "Spec": spec, "PPV": ppv, "NPV": npv, "Kappa": kappa}
+
+
+# Two-sided 95% quantile of the normal distribution, for closed-form confidence intervals
+Z_95 = 1.959963984540054
+
+# The scores that interval_arrays() covers
+INTERVAL_METRICS = ("Sens", "Spec", "PPV", "NPV", "Kappa")
+
+
+def _wilson(successes: np.ndarray, trials: np.ndarray, z: float) -> tuple[np.ndarray, np.ndarray]:
+    """Wilson score interval for a binomial proportion (NaN where there were no trials)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = successes / trials
+        z2_n = z * z / trials
+        center = (ratio + z2_n / 2) / (1 + z2_n)
+        half_width = z / (1 + z2_n) * np.sqrt(ratio * (1 - ratio) / trials + z2_n / trials / 4)
+    return center - half_width, center + half_width
+
+
+def interval_arrays(
+    *,
+    true_pos: np.ndarray,
+    false_neg: np.ndarray,
+    true_neg: np.ndarray,
+    false_pos: np.ndarray,
+    z: float = Z_95,
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    Calculates closed-form confidence intervals for whole arrays of counts at once.
+
+    Sens/Spec/PPV/NPV use the Wilson score interval, which behaves well for small counts
+    and for ratios near 0 or 1. Kappa uses the large-sample variance from
+    Fleiss, Cohen & Everitt (1969), with its interval clipped to [-1, 1].
+
+    Undefined intervals (like a sensitivity with no positives) come out as NaN.
+
+    :return: metric -> (low bounds, high bounds), with an entry per entry in the count arrays
+    """
+    tp, fn, tn, fp = (
+        np.asarray(x, dtype=float) for x in (true_pos, false_neg, true_neg, false_pos)
+    )
+
+    intervals = {
+        "Sens": _wilson(tp, tp + fn, z),
+        "Spec": _wilson(tn, tn + fp, z),
+        "PPV": _wilson(tp, tp + fp, z),
+        "NPV": _wilson(tn, tn + fn, z),
+    }
+
+    kappa = score_arrays(true_pos=tp, false_neg=fn, true_neg=tn, false_pos=fp)["Kappa"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = tp + fn + tn + fp
+        truth_pos, truth_neg = (tp + fn) / total, (tn + fp) / total
+        annotator_pos, annotator_neg = (tp + fp) / total, (tn + fn) / total
+        expected = truth_pos * annotator_pos + truth_neg * annotator_neg
+
+        # Agreement cells
+        variance = (tp / total) * (1 - (truth_pos + annotator_pos) * (1 - kappa)) ** 2
+        variance += (tn / total) * (1 - (truth_neg + annotator_neg) * (1 - kappa)) ** 2
+        # Disagreement cells
+        variance += (1 - kappa) ** 2 * (
+            (fn / total) * (annotator_pos + truth_neg) ** 2
+            + (fp / total) * (annotator_neg + truth_pos) ** 2
+        )
+        variance -= (kappa - expected * (1 - kappa)) ** 2
+        variance /= total * (1 - expected) ** 2
+
+        # Rounding can push a zero variance just below zero
+        half_width = z * np.sqrt(np.maximum(variance, 0))
+    intervals["Kappa"] = (
+        np.clip(kappa - half_width, -1, 1),
+        np.clip(kappa + half_width, -1, 1),
+    )
+
+    return intervals
+
+
+def threshold_sweep(
+    annotations: defines.ProjectAnnotations,
+    truth: str,
+    annotator: str,
+    note_range: Collection[int],
+    labels: defines.LabelSet | None = None,
+) -> dict[defines.Label, list[dict]]:
+    """
+    Scores the annotator against truth at every confidence threshold the annotator used.
+
+    The annotator's scored mentions for each label are sorted once and then swept from the
+    highest score to the lowest, adjusting the confusion matrix counts as each mention flips from
+    negative to positive. Unscored mentions are positive at any threshold.
+
+    :param annotations: prepared map of annotators & mentions
+    :param truth: annotator to use as the ground truth
+    :param annotator: another annotator (one with confidence scores) to compare with truth
+    :param note_range: collection of LabelStudio document ID
+    :param labels: (optional) collection of labels to consider examining
+    :return: label -> list of score_counts() results (plus a "Threshold" key), in ascending
+        threshold order. Labels without any scored mentions are not included.
+    """
+    truth_mentions = annotations.mentions.get(truth, defines.Mentions())
+    annotator_mentions = annotations.mentions.get(annotator, defines.Mentions())
+    annotator_scores = annotations.scores.get(annotator, defines.Scores())
+
+    # Only examine labels that were used by any compared annotators at least once
+    label_set = compared_labels(annotations, [truth, annotator], labels)
+
+    # Gather (score, is truth positive) for each of the annotator's positive mentions
+    truth_counts = dict.fromkeys(label_set, 0)
+    positives = {label: [] for label in label_set}
+    for note_id in note_range:
+        truth_note_mentions = truth_mentions.get(note_id, set()) & label_set
+        note_scores = annotator_scores.get(note_id, {})
+        for label in truth_note_mentions:
+            truth_counts[label] += 1
+        for label in annotator_mentions.get(note_id, set()) & label_set:
+            score = note_scores.get(label, math.inf)
+            positives[label].append((score, label in truth_note_mentions))
+
+    curves = {}
+
+    for label in sorted(label_set):
+        label_positives = sorted(positives[label], key=lambda x: x[0], reverse=True)
+        total_pos = truth_counts[label]
+        total_neg = len(note_range) - total_pos
+        true_pos = false_pos = 0
+        curve = []
+
+        for index, (score, truth_positive) in enumerate(label_positives):
+            if truth_positive:
+                true_pos += 1
+            else:
+                false_pos += 1
+
+            # Only record a point once we've flipped every mention with this exact score
+            next_index = index + 1
+            is_last_of_score = (
+                next_index == len(label_positives) or label_positives[next_index][0] != score
+            )
+            if score != math.inf and is_last_of_score:
+                point = score_counts(
+                    true_pos=true_pos,
+                    false_neg=total_pos - true_pos,
+                    true_neg=total_neg - false_pos,
+                    false_pos=false_pos,
+                )
+                point["Threshold"] = score
+                curve.append(point)
+
+        if curve:
+            curves[label] = list(reversed(curve))
+
+    return curves
+
+
+def best_threshold(curve: list[dict]) -> dict | None:
+    """
+    Returns the point on a threshold_sweep() curve with the highest F1 score.
+
+    Ties go to the highest threshold. Returns None if no point has a valid F1 score.
+    """
+    best = None
+    for point in reversed(curve):
+        if not math.isnan(point["F1"]) and (best is None or point["F1"] > best["F1"]):
+            best = point
+    return best
+
+
 def float_to_str(value: float) -> str:
     if math.isnan(value):
         return "-"
@@ -154,6 +624,99 @@ def csv_row_score(score: dict) -> str | list[str]:
     return [float_to_str(value) for value in row]
 
 
+@dataclasses.dataclass(frozen=True)
+class ContingencyCounts:
+    """Just the counts of a contingency table, without the note & label of each cell."""
+
+    both_correct: int = 0
+    only_left: int = 0
+    only_right: int = 0
+    both_wrong: int = 0
+
+    def __add__(self, other: "ContingencyCounts") -> "ContingencyCounts":
+        return ContingencyCounts(
+            both_correct=self.both_correct + other.both_correct,
+            only_left=self.only_left + other.only_left,
+            only_right=self.only_right + other.only_right,
+            both_wrong=self.both_wrong + other.both_wrong,
+        )
+
+
+def contingency_counts(
+    annotations: defines.ProjectAnnotations,
+    truth: str,
+    annotator1: str,
+    annotator2: str,
+    note_range: Collection[int],
+    labels: defines.LabelSet | None = None,
+) -> ContingencyCounts:
+    """
+    Like contingency_table, but only counts each kind of cell, without recording which is which.
+
+    :return: the counts of each kind of contingency table cell
+    """
+    by_label = contingency_counts_by_label(
+        annotations, truth, annotator1, annotator2, note_range, labels=labels
+    )
+    return sum(by_label.values(), ContingencyCounts())
+
+
+def contingency_counts_by_label(
+    annotations: defines.ProjectAnnotations,
+    truth: str,
+    annotator1: str,
+    annotator2: str,
+    note_range: Collection[int],
+    labels: defines.LabelSet | None = None,
+) -> dict[defines.Label, ContingencyCounts]:
+    """
+    Counts the contingency table cells for every label at once, in a single sweep over the notes.
+
+    Only labels that somebody mentioned in a note are visited. Every other cell is a label
+    that all three annotators left negative, which means both annotators were correct.
+
+    :return: label -> counts, for every given label (or every used label, if none were given).
+        Labels that nobody used have counts of all zeros.
+    """
+    # Grab all mentions
+    mentions = {
+        annotator: annotations.mentions.get(annotator, defines.Mentions())
+        for annotator in {truth, annotator1, annotator2}
+    }
+
+    # Only examine labels that were used by any compared annotators at least once
+    label_set = compared_labels(annotations, [truth, annotator1, annotator2], labels)
+
+    # Cells are tallied per label, indexed by (left correct, right correct)
+    cells = {label: [0, 0, 0, 0] for label in label_set}
+
+    for note_id in note_range:
+        truth_note_mentions = mentions[truth].get(note_id) or set()
+        left_note_mentions = mentions[annotator1].get(note_id) or set()
+        right_note_mentions = mentions[annotator2].get(note_id) or set()
+        positive_labels = label_set & (
+            truth_note_mentions | left_note_mentions | right_note_mentions
+        )
+
+        for label in positive_labels:
+            truth_positive = label in truth_note_mentions
+            left_correct = truth_positive == (label in left_note_mentions)
+            right_correct = truth_positive == (label in right_note_mentions)
+            cells[label][2 * left_correct + right_correct] += 1
+
+    note_count = len(note_range)
+    counts = {label: ContingencyCounts() for label in labels or ()}
+    for label, (both_wrong, only_right, only_left, _both_correct) in cells.items():
+        counts[label] = ContingencyCounts(
+            # Unvisited cells were negative for everyone, so both annotators were correct
+            both_correct=note_count - both_wrong - only_right - only_left,
+            only_left=only_left,
+            only_right=only_right,
+            both_wrong=both_wrong,
+        )
+    return counts
+
+
 def contingency_table(
     annotations: defines.ProjectAnnotations,
     truth: str,
@@ -169,12 +732,7 @@ def contingency_table(
     }
 
     # Only examine labels that were used by any compared annotators at least once
-    label_set = set()
-    for mentions_set in mentions.values():
-        for mention_labels in mentions_set.values():
-            label_set |= set(mention_labels)
-    if labels:
-        label_set &= labels
+    label_set = compared_labels(annotations, [truth, annotator1, annotator2], labels)
 
     BC = []  # both correct
     OL = []  # only left
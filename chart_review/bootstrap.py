@@ -0,0 +1,77 @@
+"""Bootstrap confidence intervals for accuracy scores"""
+
+import warnings
+
+import numpy as np
+
+from chart_review import agree, encoding, parallel
+
+# The scores we calculate intervals for
+METRICS = ("F1", "Sens", "PPV", "Kappa")
+
+
+def _score_batch(
+    cells: encoding.ChartCells, seed: np.random.SeedSequence, size: int
+) -> dict[str, np.ndarray]:
+    """Scores a batch of bootstrap replicates, returning metric -> (replicates x columns) array"""
+    rng = np.random.default_rng(seed)
+    chart_count = cells.true_pos.shape[0]
+
+    # Each row holds how many times each chart was picked for that replicate
+    weights = rng.multinomial(chart_count, np.full(chart_count, 1 / chart_count), size=size)
+
+    true_pos = weights @ cells.true_pos
+    false_neg = weights @ cells.false_neg
+    false_pos = weights @ cells.false_pos
+    true_neg = cells.true_neg(weights, true_pos, false_neg, false_pos)
+
+    scores = agree.score_arrays(
+        true_pos=true_pos, false_neg=false_neg, true_neg=true_neg, false_pos=false_pos
+    )
+    return {metric: scores[metric] for metric in METRICS}
+
+
+def confidence_intervals(
+    cells: encoding.ChartCells,
+    iterations: int,
+    *,
+    seed: int | None = None,
+    confidence: float = 0.95,
+    workers: int | None = None,
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    Calculates percentile bootstrap confidence intervals, resampling charts with replacement.
+
+    Each replicate is just a weighted sum of the per-chart cells (weighted by how many times
+    each chart was picked), and replicates are calculated in batches as matrix products.
+
+    The same seed gives the same intervals, regardless of the number of workers.
+
+    :param cells: the per-chart confusion matrix cells to resample
+    :param iterations: how many bootstrap replicates to calculate
+    :param seed: (optional) random seed, for reproducible results
+    :param confidence: the confidence level of the intervals
+    :param workers: if more than one, spread the batches across this many worker processes
+    :return: metric -> (low bounds, high bounds), with an entry in each array per column in cells.
+        Replicates where a score is undefined (NaN) are left out of that score's bounds,
+        and columns with no valid scores in any replicate get NaN bounds.
+    """
+    if cells.true_pos.shape[0] == 0:
+        batches = []  # no charts to resample
+    else:
+        batches = parallel.map_batches(_score_batch, cells, iterations, seed=seed, workers=workers)
+
+    tail = (1 - confidence) / 2 * 100
+    intervals = {}
+    for metric in METRICS:
+        if batches:
+            replicates = np.concatenate([batch[metric] for batch in batches])
+        else:
+            replicates = np.full((1, len(cells.keys)), np.nan)
+        # Suppress warnings about all-NaN columns (they just get NaN bounds)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            low, high = np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+        intervals[metric] = (low, high)
+
+    return intervals
@@ -0,0 +1,66 @@
+"""Project-local cache of slow-to-calculate intermediate results"""
+
+import hashlib
+import json
+import logging
+import os
+
+from chart_review import common
+
+# Bump this whenever the format or meaning of cached data changes, to invalidate old caches
+CACHE_VERSION = 1
+CACHE_DIR = ".chart-review-cache"
+
+
+def digest_file(path: str) -> str:
+    """Returns a hex digest of a file's contents"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def digest_data(data) -> str:
+    """Returns a hex digest of any JSON-serializable data"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf8")).hexdigest()
+
+
+def _cache_path(project_dir: str, kind: str, name: str) -> str:
+    # Hash the name, since it might be something unfriendly for file paths, like an annotator name
+    name_digest = digest_data(name)[:16]
+    return os.path.join(project_dir, CACHE_DIR, f"{kind}-{name_digest}.json")
+
+
+def load(project_dir: str, kind: str, name: str, key: list) -> dict | list | None:
+    """
+    Returns previously cached data, if it was saved with the same key.
+
+    :param project_dir: the project folder that holds the cache
+    :param kind: a category of cached data, like "external"
+    :param name: the specific item in that category, like an annotator name
+    :param key: any JSON-serializable data that must match what was saved
+    :return: the cached data or None if there was no matching cache entry
+    """
+    try:
+        cached = common.read_json(_cache_path(project_dir, kind, name))
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(cached, dict) or cached.get("key") != [CACHE_VERSION, *key]:
+        return None
+    return cached.get("data")
+
+
+def save(project_dir: str, kind: str, name: str, key: list, data: dict | list) -> None:
+    """
+    Caches some data for later, overwriting any previous data for the same kind & name.
+
+    Failures are not fatal (e.g. a read-only project folder), we just don't cache anything.
+    """
+    path = _cache_path(project_dir, kind, name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        common.write_json(path, {"key": [CACHE_VERSION, *key], "data": data}, indent=None)
+    except OSError as exc:
+        logging.debug("Could not write cache file %s: %s", path, exc)
@@ -3,7 +3,17 @@
 import argparse
 import sys
 
-from chart_review.commands import accuracy, default, frequency, ids, labels, mcnemar, mentions
+from chart_review.commands import (
+    accuracy,
+    default,
+    frequency,
+    ids,
+    labels,
+    mcnemar,
+    mentions,
+    multirater,
+    permutation,
+)
 
 
 def define_parser() -> argparse.ArgumentParser:
@@ -20,6 +30,12 @@ def define_parser() -> argparse.ArgumentParser:
     labels.make_subparser(subparsers.add_parser("labels", help="show label usage by annotator"))
     mcnemar.make_subparser(subparsers.add_parser("mcnemar", help="calculate McNemar’s test"))
     mentions.make_subparser(subparsers.add_parser("mentions", help="show each mention of a label"))
+    multirater.make_subparser(
+        subparsers.add_parser("multirater", help="calculate agreement across many annotators")
+    )
+    permutation.make_subparser(
+        subparsers.add_parser("permutation", help="test F1 and Kappa differences by permutation")
+    )
 
     return parser
 
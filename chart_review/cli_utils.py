@@ -26,6 +26,16 @@ def add_project_args(parser: argparse.ArgumentParser, is_global: bool = False) -
         metavar="PATH",
         help="config file (default: [project-dir]/config.yaml)",
     )
+    group.add_argument(
+        "--workers",
+        type=int,
+        default=None if is_global else argparse.SUPPRESS,
+        metavar="NUM",
+        help=(
+            "number of worker processes to use when loading & simplifying external annotators, "
+            "comparing --all-pairs, and resampling for --bootstrap or permutation (default: 1)"
+        ),
+    )
 
 
 def add_output_args(parser: argparse.ArgumentParser):
@@ -36,7 +46,7 @@ def add_output_args(parser: argparse.ArgumentParser):
 
 def get_cohort_reader(args: argparse.Namespace) -> cohort.CohortReader:
     proj_config = config.ProjectConfig(project_dir=args.project_dir, config_path=args.config)
-    return cohort.CohortReader(proj_config)
+    return cohort.CohortReader(proj_config, workers=args.workers)
 
 
 def create_table(*headers, dense: bool = False) -> rich.table.Table:
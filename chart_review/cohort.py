@@ -1,4 +1,6 @@
-from chart_review import agree, config, defines, external, simplify, studio
+from collections.abc import Iterator
+
+from chart_review import agree, config, consensus, defines, external, simplify, studio
 
 
 class CohortReader:
@@ -8,9 +10,10 @@ class CohortReader:
     It also exposes some statistical helper methods.
     """
 
-    def __init__(self, proj_config: config.ProjectConfig):
+    def __init__(self, proj_config: config.ProjectConfig, *, workers: int | None = None):
         """
         :param proj_config: parsed project configuration
+        :param workers: if more than one, load & simplify external annotators in parallel processes
         """
         self.config = proj_config
         self.project_dir = self.config.project_dir
@@ -18,40 +21,46 @@ class CohortReader:
         # Load exported annotations
         self.ls_export = studio.ExportFile(self.config.project_dir)
 
-        self.annotations = simplify.simplify_export(self.ls_export, self.config)
+        # Find ignored notes up front, so we can skip them entirely as we read mentions
+        self.ignored_notes = self._find_ignored_notes(self.ls_export)
+
+        # Consolidate/expand mentions based on config, as we read them in
+        simplifier = simplify.MentionSimplifier(
+            implied_labels=self.config.implied_labels,
+            grouped_labels=self.config.grouped_labels,
+            ignored_notes=self.ignored_notes,
+            vocabulary=self.config.class_labels.direct_labels(),
+        )
+        self.annotations = simplify.simplify_export(
+            self.ls_export, self.config, simplifier=simplifier
+        )
 
         # Add a placeholder for any annotators that don't have mentions for some reason
         for annotator in self.config.annotators.values():
             self.annotations.mentions.setdefault(annotator, defines.Mentions())
+        for annotator in self.config.prediction_annotators.values():
+            self.annotations.mentions.setdefault(annotator, defines.Mentions())
 
         # Load external annotations (i.e. from NLP tags or ICD10 codes)
-        for name, value in self.config.external_annotations.items():
-            external.merge_external(self.annotations, self.ls_export, self.project_dir, name, value)
-
-        # Consolidate/expand mentions based on config
-        simplify.simplify_mentions(
+        external.merge_all_external(
             self.annotations,
-            implied_labels=self.config.implied_labels,
-            grouped_labels=self.config.grouped_labels,
+            self.ls_export,
+            self.project_dir,
+            self.config.external_annotations,
+            workers=workers,
+            transform=simplifier.simplify_mentions,
+            use_cache=self.config.cache,
         )
 
         # Calculate the final set of note ranges for each annotator
-        self.note_range, self.ignored_notes = self._collect_note_ranges(self.ls_export)
-
-        # Remove any ignored notes from the annotations, for ease of consuming code
-        for note in self.ignored_notes:
-            self.annotations.remove(note)
+        self.note_range = self._collect_note_ranges(self.ls_export)
 
-    def _collect_note_ranges(
-        self, export: studio.ExportFile
-    ) -> tuple[dict[str, defines.NoteSet], defines.NoteSet]:
-        # Detect note ranges if they were not defined in the project config
-        # (i.e. default to the full set of annotated notes)
-        note_ranges = {k: set(v) for k, v in self.config.note_ranges.items()}
-        for annotator, annotator_mentions in self.annotations.mentions.items():
-            if annotator not in note_ranges:
-                note_ranges[annotator] = set(annotator_mentions.keys())
+        # Add any consensus annotators, voting within the final note ranges of their voters
+        consensus.merge_all_consensus(
+            self.annotations, self.note_range, self.config.consensus_annotators
+        )
 
+    def _find_ignored_notes(self, export: studio.ExportFile) -> defines.NoteSet:
         all_ls_notes = {note.note_id for note in export.notes}
 
         # Parse ignored IDs (might be note IDs, might be external IDs)
@@ -67,12 +76,24 @@ class CohortReader:
             if ls_id in all_ls_notes:
                 ignored_notes.add(ls_id)
 
+        return ignored_notes
+
+    def _collect_note_ranges(self, export: studio.ExportFile) -> dict[str, defines.NoteSet]:
+        # Detect note ranges if they were not defined in the project config
+        # (i.e. default to the full set of annotated notes)
+        note_ranges = {k: set(v) for k, v in self.config.note_ranges.items()}
+        for annotator, annotator_mentions in self.annotations.mentions.items():
+            if annotator not in note_ranges:
+                note_ranges[annotator] = set(annotator_mentions.keys())
+
+        all_ls_notes = {note.note_id for note in export.notes}
+
         # Remove any invalid (ignored, non-existent) notes from the range sets
         for note_ids in note_ranges.values():
-            note_ids.difference_update(ignored_notes)
+            note_ids.difference_update(self.ignored_notes)
             note_ids.intersection_update(all_ls_notes)
 
-        return note_ranges, ignored_notes
+        return note_ranges
 
     @property
     def class_labels(self) -> defines.LabelSet:
@@ -113,32 +134,85 @@ class CohortReader:
             labels=labels,
         )
 
-    def contingency_table(
+    def classify_cells(
         self,
         truth: str,
-        annotator1: str,
-        annotator2: str,
+        annotator: str,
         note_range: defines.NoteSet,
         label_pick: defines.Label | defines.LabelMatcher | None = None,
-    ) -> dict:
+        errors_only: bool = False,
+    ) -> Iterator[tuple[int, defines.Label, str]]:
         """
-        Calculate a contingency table for truth and two annotators.
+        Yields the classification of each confusion matrix cell, in note order.
 
-        https://en.wikipedia.org/wiki/Contingency_table
+        :param truth: annotator to use as the ground truth
+        :param annotator: another annotator to compare with truth
+        :param note_range: collection of LabelStudio document ID
+        :param label_pick: (optional) of the CLASS_LABEL to score separately
+        :param errors_only: whether to only yield FN & FP cells
+        :return: iterator of (note ID, label, classification)
+        """
+        labels = self._select_labels(label_pick)
+        return agree.classify_cells(
+            self.annotations,
+            truth,
+            annotator,
+            note_range,
+            labels=labels,
+            errors_only=errors_only,
+        )
+
+    def confusion_counts_with_rollups(
+        self,
+        truth: str,
+        annotator: str,
+        note_range: defines.NoteSet,
+        label_pick: defines.Label | defines.LabelMatcher | None = None,
+        any_positive: bool = False,
+    ) -> tuple[
+        dict[defines.Label, agree.ConfusionCounts], dict[defines.Label, agree.ConfusionCounts]
+    ]:
+        """
+        Counts confusion matrix cells for every label and every sublabel wildcard, in one pass.
 
         :param truth: annotator to use as the ground truth
-        :param annotator1: one annotator to compare
-        :param annotator2: another annotator to compare
+        :param annotator: another annotator to compare with truth
         :param note_range: collection of LabelStudio document ID
         :param label_pick: (optional) of the CLASS_LABEL to score separately
-        :return: dict
+        :param any_positive: whether to score wildcards per note rather than by summing sublabels
+        :return: dicts of label -> counts, for each label and for each wildcard label
         """
         labels = self._select_labels(label_pick)
-        return agree.contingency_table(
+        return agree.confusion_counts_with_rollups(
             self.annotations,
             truth,
-            annotator1,
-            annotator2,
+            annotator,
+            note_range,
+            labels=labels,
+            any_positive=any_positive,
+        )
+
+    def threshold_sweep(
+        self,
+        truth: str,
+        annotator: str,
+        note_range: defines.NoteSet,
+        label_pick: defines.Label | defines.LabelMatcher | None = None,
+    ) -> dict[defines.Label, list[dict]]:
+        """
+        Scores each label at every confidence threshold the annotator used.
+
+        :param truth: annotator to use as the ground truth
+        :param annotator: another annotator (one with confidence scores) to compare with truth
+        :param note_range: collection of LabelStudio document ID
+        :param label_pick: (optional) of the CLASS_LABEL to score separately
+        :return: dict of label -> list of scores at each threshold
+        """
+        labels = self._select_labels(label_pick)
+        return agree.threshold_sweep(
+            self.annotations,
+            truth,
+            annotator,
             note_range,
             labels=labels,
         )
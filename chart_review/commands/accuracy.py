@@ -1,22 +1,67 @@
 """Methods for high-level accuracy calculations."""
 
 import argparse
+import csv
+import dataclasses
 import math
+import sys
+from collections.abc import Iterable
 
+import numpy as np
 import rich
 import rich.box
 import rich.table
 import rich.text
 
-from chart_review import agree, cli_utils, console_utils, defines
+from chart_review import agree, bootstrap, cli_utils, cohort, console_utils, encoding
 
 
 def make_subparser(parser: argparse.ArgumentParser) -> None:
     cli_utils.add_project_args(parser)
     cli_utils.add_output_args(parser)
-    parser.add_argument("--verbose", action="store_true", help="show each chart’s labels")
-    parser.add_argument("truth_annotator")
-    parser.add_argument("annotator")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--verbose", action="store_true", help="show each chart’s labels")
+    mode.add_argument(
+        "--errors-only",
+        action="store_true",
+        help="like --verbose, but only show the false positives and false negatives",
+    )
+    mode.add_argument(
+        "--sweep",
+        action="store_true",
+        help="show scores at every confidence threshold of the annotator’s scored labels",
+    )
+    mode.add_argument(
+        "--all-pairs",
+        action="store_true",
+        help="compare every pair of annotators at once (leave out the annotator arguments)",
+    )
+    parser.add_argument(
+        "--rollup",
+        choices=["sum", "any"],
+        default="sum",
+        help="how to score sublabel aggregate rows: add up each sublabel value (sum, the default) "
+        "or count a chart once if any sublabel value is positive (any)",
+    )
+    intervals = parser.add_argument_group("confidence intervals")
+    interval_method = intervals.add_mutually_exclusive_group()
+    interval_method.add_argument(
+        "--ci",
+        action="store_true",
+        help="add closed-form 95%% confidence intervals "
+        "(Wilson score intervals, and the asymptotic variance for kappa)",
+    )
+    interval_method.add_argument(
+        "--bootstrap",
+        type=int,
+        metavar="N",
+        help="add 95%% confidence intervals, from N bootstrap resamples of the charts",
+    )
+    intervals.add_argument(
+        "--seed", type=int, help="random seed for --bootstrap, for reproducible intervals"
+    )
+    parser.add_argument("truth_annotator", nargs="?")
+    parser.add_argument("annotator", nargs="?")
     parser.set_defaults(func=print_accuracy)
 
 
@@ -26,10 +71,31 @@ def print_accuracy(args: argparse.Namespace) -> None:
 
     The results will be written to the project directory.
     """
-    reader = cli_utils.get_cohort_reader(args)
     truth = args.truth_annotator
     annotator = args.annotator
 
+    uses_intervals = args.ci or args.bootstrap is not None
+    if uses_intervals and (args.verbose or args.errors_only or args.sweep or args.all_pairs):
+        raise ValueError("Confidence intervals can only be added to the default accuracy table.")
+    if args.bootstrap is not None and args.bootstrap < 1:
+        raise ValueError("--bootstrap needs at least one resample.")
+    if args.seed is not None and args.bootstrap is None:
+        raise ValueError("--seed only applies to --bootstrap.")
+    if args.rollup != "sum" and (args.verbose or args.errors_only or args.sweep):
+        raise ValueError("--rollup only applies to the default accuracy table.")
+
+    if args.all_pairs:
+        if truth or annotator:
+            raise ValueError("Don’t specify any annotators when using --all-pairs.")
+        if args.rollup != "sum":
+            raise ValueError("Only --rollup=sum is supported when using --all-pairs.")
+        _print_all_pairs(args, cli_utils.get_cohort_reader(args))
+        return
+    if not truth or not annotator:
+        raise ValueError("Please specify a truth annotator and an annotator to compare.")
+
+    reader = cli_utils.get_cohort_reader(args)
+
     if truth not in reader.note_range:
         raise ValueError(f"Unrecognized annotator '{truth}'")
     if annotator not in reader.note_range:
@@ -42,49 +108,58 @@ def print_accuracy(args: argparse.Namespace) -> None:
     note_range = set(reader.note_range[truth])
     note_range &= set(reader.note_range[annotator])
 
+    if args.sweep:
+        _print_sweep(args, reader, truth, annotator, note_range)
+        return
+
+    if args.verbose or args.errors_only:
+        _print_cells(args, reader, truth, annotator, note_range)
+        return
+
     labels = sorted(reader.class_labels)
 
-    # Calculate confusion matrices
-    matrices = {None: reader.confusion_matrix(truth, annotator, note_range)}
-    for label in labels:
-        matrices[label] = reader.confusion_matrix(truth, annotator, note_range, label)
-        # Add an aggregate row for any sublabel groupings
-        if label.sublabel_name:
-            matcher = defines.LabelMatcher(f"{label.label}|{label.sublabel_name}|*")
-            if matcher not in matrices:
-                matrices[matcher] = reader.confusion_matrix(truth, annotator, note_range, matcher)
+    console = rich.get_console()
+
+    # Calculate confusion matrix counts for every label and sublabel grouping at once,
+    # then add them up for the overall row.
+    label_counts, rollup_counts = reader.confusion_counts_with_rollups(
+        truth, annotator, note_range, any_positive=args.rollup == "any"
+    )
+    counts = {None: sum(label_counts.values(), agree.ConfusionCounts())}
+    counts.update(label_counts)
+    counts.update(rollup_counts)
 
     # Now score them
-    scores = {key: agree.score_matrix(matrix) for key, matrix in matrices.items()}
+    scores = {key: agree.score_matrix(key_counts) for key, key_counts in counts.items()}
 
-    console = rich.get_console()
+    # Pick the table rows: overall, then each label (with sublabel aggregates before their values)
+    rows = [(None, "*")]
+    for label in labels:
+        if (wildcard_label := agree.rollup_label(label)) in rollup_counts:
+            rows.append((wildcard_label, str(wildcard_label)))
+            del rollup_counts[wildcard_label]
+        rows.append((label, str(label)))
 
-    if args.verbose:
-        # Print a table of each chart/label combo - useful for reviewing where an annotator
-        # went wrong.
-        table = cli_utils.create_table("Chart ID", "Label", "Classification")
-        for note_id in sorted(note_range):
-            table.add_section()
-            for label in labels:
-                for classification in ["TN", "TP", "FN", "FP"]:
-                    if {note_id: label} in matrices[label][classification]:
-                        style = "bold" if classification[0] == "F" else None  # highlight errors
-                        class_text = rich.text.Text(classification, style=style)
-                        table.add_row(str(note_id), str(label), class_text)
-                        break
-    else:
-        # Normal F1/Kappa scores
-        table = cli_utils.create_table(*agree.csv_header(), "Label", dense=True)
-        table.add_row(*agree.csv_row_score(scores[None]), "*")
-        for label in labels:
-            # Add an aggregate row for any sublabel groupings
-            if label.sublabel_name:
-                matcher = defines.LabelMatcher(f"{label.label}|{label.sublabel_name}|*")
-                if matcher in scores:
-                    wildcard_label = defines.Label(label.label, label.sublabel_name, "*")
-                    table.add_row(*agree.csv_row_score(scores[matcher]), str(wildcard_label))
-                    del scores[matcher]
-            table.add_row(*agree.csv_row_score(scores[label]), str(label))
+    intervals = {}
+    if args.ci:
+        metrics = agree.INTERVAL_METRICS
+        intervals = _closed_form_intervals(counts)
+        interval_source = "Wilson score, or asymptotic for Kappa"
+    elif args.bootstrap:
+        metrics = bootstrap.METRICS
+        intervals = _bootstrap_intervals(args, reader, truth, annotator, note_range)
+        interval_source = f"from {args.bootstrap:,} bootstrap resamples"
+
+    # Normal F1/Kappa scores
+    headers = agree.csv_header()
+    if intervals and args.csv:
+        headers += _interval_headers(metrics, csv=True)
+    table = cli_utils.create_table(*headers, "Label", dense=True)
+    for key, label_text in rows:
+        row = agree.csv_row_score(scores[key])
+        if intervals and args.csv:
+            row += _interval_cells(intervals[key], csv=True)
+        table.add_row(*row, label_text)
 
     if args.csv:
         cli_utils.print_table_as_csv(table)
@@ -92,14 +167,9 @@ def print_accuracy(args: argparse.Namespace) -> None:
 
     # OK we aren't printing a CSV file to stdout, so we can include a bit more explanation
     # as a little header to the real results.
-    note_count = len(note_range)
-    chart_word = "chart" if note_count == 1 else "charts"
-    pretty_ranges = f" ({console_utils.pretty_note_range(note_range)})" if note_count > 0 else ""
-    console.print(f"Comparing {note_count} {chart_word}{pretty_ranges}")
-    console.print(f"Truth: {truth}")
-    console.print(f"Annotator: {annotator}")
-
-    if not args.verbose and labels:
+    console_utils.print_comparison_header(note_range, [annotator], truth=truth)
+
+    if labels:
         # Calculate Macro F1 as a convenience
         valid_f1s = [scores[label]["F1"] for label in labels if not math.isnan(scores[label]["F1"])]
         macro_f1 = sum(valid_f1s) / len(valid_f1s) if valid_f1s else "-"
@@ -107,3 +177,191 @@ def print_accuracy(args: argparse.Namespace) -> None:
 
     console.print()
     console.print(table)
+
+    if intervals:
+        # Confidence intervals get their own table, since they'd make the main one too wide
+        interval_table = cli_utils.create_table(
+            *_interval_headers(metrics, csv=False), "Label", dense=True
+        )
+        for key, label_text in rows:
+            interval_table.add_row(*_interval_cells(intervals[key], csv=False), label_text)
+        console.print()
+        console.print(f"95% confidence intervals ({interval_source}):")
+        console.print(interval_table)
+
+
+def _closed_form_intervals(counts: dict) -> dict:
+    """Returns row key -> metric -> (low, high) closed-form confidence intervals"""
+    keys = list(counts)
+    bounds = agree.interval_arrays(
+        **{
+            field.name: np.array([getattr(counts[key], field.name) for key in keys])
+            for field in dataclasses.fields(agree.ConfusionCounts)
+        }
+    )
+    return {
+        key: {metric: (low[index], high[index]) for metric, (low, high) in bounds.items()}
+        for index, key in enumerate(keys)
+    }
+
+
+def _bootstrap_intervals(
+    args: argparse.Namespace,
+    reader: cohort.CohortReader,
+    truth: str,
+    annotator: str,
+    note_range: set[int],
+) -> dict:
+    """Returns row key -> metric -> (low, high) bootstrap confidence intervals"""
+    encoded = encoding.MentionEncoding(reader.annotations, reader.class_labels, [truth, annotator])
+    cells = encoded.chart_cells(truth, annotator, note_range, any_positive=args.rollup == "any")
+    bounds = bootstrap.confidence_intervals(
+        cells, args.bootstrap, seed=args.seed, workers=args.workers
+    )
+    return {
+        key: {metric: (low[index], high[index]) for metric, (low, high) in bounds.items()}
+        for index, key in enumerate(cells.keys)
+    }
+
+
+def _interval_headers(metrics: Iterable[str], *, csv: bool) -> list[str]:
+    if csv:
+        return [f"{metric} CI {end}" for metric in metrics for end in ("Low", "High")]
+    return list(metrics)
+
+
+def _interval_cells(bounds: dict[str, tuple[float, float]], *, csv: bool) -> list[str]:
+    cells = []
+    for low, high in bounds.values():
+        low, high = agree.float_to_str(low), agree.float_to_str(high)
+        if csv:
+            cells += [low, high]
+        else:
+            cells.append("-" if low == "-" else f"{low}–{high}")
+    return cells
+
+
+def _print_cells(
+    args: argparse.Namespace,
+    reader: cohort.CohortReader,
+    truth: str,
+    annotator: str,
+    note_range: set[int],
+) -> None:
+    """
+    Prints a table of each chart/label combo - useful for reviewing where an annotator went wrong.
+
+    Cells come out in chart order and CSV rows are written as we go,
+    so this works for large cohorts too.
+    """
+    cells = reader.classify_cells(truth, annotator, note_range, errors_only=args.errors_only)
+
+    if args.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["chart_id", "label", "classification"])
+        for note_id, label, classification in cells:
+            writer.writerow([note_id, str(label), classification])
+        return
+
+    table = cli_utils.create_table("Chart ID", "Label", "Classification")
+    prev_note_id = None
+    for note_id, label, classification in cells:
+        if note_id != prev_note_id:
+            table.add_section()
+            prev_note_id = note_id
+        style = "bold" if classification[0] == "F" else None  # highlight errors
+        table.add_row(str(note_id), str(label), rich.text.Text(classification, style=style))
+
+    console_utils.print_comparison_header(note_range, [annotator], truth=truth)
+    console = rich.get_console()
+    console.print()
+    console.print(table)
+
+
+def _print_all_pairs(args: argparse.Namespace, reader: cohort.CohortReader) -> None:
+    """
+    Prints scores for every ordered pair of annotators.
+
+    The console gets a matrix of overall F1 and Kappa scores for each pair.
+    CSV output gets the full per-label detail for each pair.
+    """
+    annotators = sorted(reader.note_range)
+    labels = sorted(reader.class_labels)
+    pair_counts = encoding.all_pairs_confusion_counts(
+        reader.annotations, reader.note_range, labels, annotators, workers=args.workers
+    )
+
+    if args.csv:
+        table = cli_utils.create_table("Truth", "Annotator", *agree.csv_header(), "Label")
+        for (truth, annotator), label_counts in pair_counts.items():
+            overall = sum(label_counts.values(), agree.ConfusionCounts())
+            table.add_row(truth, annotator, *agree.csv_row_score(agree.score_matrix(overall)), "*")
+            rollup_counts = agree.rollup_counts(label_counts)
+            for label in labels:
+                # Add an aggregate row for any sublabel groupings
+                if (wildcard_label := agree.rollup_label(label)) in rollup_counts:
+                    scores = agree.score_matrix(rollup_counts.pop(wildcard_label))
+                    table.add_row(
+                        truth, annotator, *agree.csv_row_score(scores), str(wildcard_label)
+                    )
+                scores = agree.score_matrix(label_counts[label])
+                table.add_row(truth, annotator, *agree.csv_row_score(scores), str(label))
+        cli_utils.print_table_as_csv(table)
+        return
+
+    scores = {
+        pair: agree.score_matrix(sum(label_counts.values(), agree.ConfusionCounts()))
+        for pair, label_counts in pair_counts.items()
+    }
+
+    console = rich.get_console()
+    console.print(f"Comparing all pairs of {len(annotators)} annotators")
+    console.print("Rows are the truth annotator, columns are the compared annotator.")
+
+    for metric in ("F1", "Kappa"):
+        table = cli_utils.create_table(metric, *annotators)
+        for truth in annotators:
+            row = [
+                agree.float_to_str(scores[truth, annotator][metric]) if truth != annotator else ""
+                for annotator in annotators
+            ]
+            table.add_row(truth, *row)
+        console.print()
+        console.print(table)
+
+
+def _print_sweep(
+    args: argparse.Namespace,
+    reader: cohort.CohortReader,
+    truth: str,
+    annotator: str,
+    note_range: set[int],
+) -> None:
+    """Prints the scores at each confidence threshold, for every label"""
+    if not reader.annotations.scores.get(annotator):
+        raise ValueError(f"Annotator '{annotator}' does not have any confidence scores.")
+
+    curves = reader.threshold_sweep(truth, annotator, note_range)
+
+    table = cli_utils.create_table("Threshold", *agree.csv_header(), "Label", dense=True)
+    for label, curve in curves.items():
+        best = agree.best_threshold(curve)
+        table.add_section()
+        for point in curve:
+            threshold = f"{point['Threshold']:g}"
+            style = None
+            if point is best and not args.csv:
+                threshold += "*"
+                style = "bold"
+            table.add_row(threshold, *agree.csv_row_score(point), str(label), style=style)
+
+    if args.csv:
+        cli_utils.print_table_as_csv(table)
+        return
+
+    console = rich.get_console()
+    console_utils.print_comparison_header(note_range, [annotator], truth=truth)
+    console.print()
+    console.print(table)
+    if curves:
+        console.print("  * Best F1 threshold for this label.", style="italic")
@@ -1,13 +1,29 @@
 import argparse
+import contextlib
+import csv
+import sys
+from collections.abc import Iterator
+from typing import TextIO
 
 import rich.table
 
-from chart_review import cli_utils
+from chart_review import cli_utils, external
 
 
 def make_subparser(parser: argparse.ArgumentParser) -> None:
     cli_utils.add_project_args(parser)
     cli_utils.add_output_args(parser)
+    lookup = parser.add_argument_group("lookup").add_mutually_exclusive_group()
+    lookup.add_argument(
+        "--lookup",
+        metavar="PATH",
+        help="print chart IDs for each FHIR ID listed in this file (or - for stdin), as CSV",
+    )
+    lookup.add_argument(
+        "--lookup-charts",
+        metavar="PATH",
+        help="print FHIR IDs for each chart ID listed in this file (or - for stdin), as CSV",
+    )
     parser.set_defaults(func=print_ids)
 
 
@@ -20,26 +36,25 @@ def print_ids(args: argparse.Namespace) -> None:
     sensible to a casual console user - so I went with the more technical-oriented CSV file.
     """
     reader = cli_utils.get_cohort_reader(args)
+    index = external.id_index(reader.ls_export)
+
+    if args.lookup:
+        _print_chart_ids(index, args.lookup)
+        return
+    if args.lookup_charts:
+        _print_fhir_ids(index, args.lookup_charts)
+        return
 
     table = cli_utils.create_table("Chart ID", "Original FHIR ID", "Anonymized FHIR ID")
 
     for note in reader.ls_export.notes:
         chart_id = str(note.note_id)
-        printed = False
+        fhir_ids = index.fhir_ids(note.note_id)
 
-        # Grab encounters first
-        orig_id = note.encounter_id and f"Encounter/{note.encounter_id}"
-        anon_id = note.anon_encounter_id and f"Encounter/{note.anon_encounter_id}"
-        if orig_id or anon_id:
+        for orig_id, anon_id in fhir_ids:
             table.add_row(chart_id, orig_id, anon_id)
-            printed = True
-
-        # Now each DocRef ID
-        for orig_id, anon_id in note.docref_mappings.items():
-            table.add_row(chart_id, f"DocumentReference/{orig_id}", f"DocumentReference/{anon_id}")
-            printed = True
 
-        if not printed:
+        if not fhir_ids:
             # Guarantee that every Chart ID shows up at least once - so it's clearer that the
             # chart ID is included in the Label Studio export but that it does not have any
             # IDs mapped to it.
@@ -49,3 +64,46 @@ def print_ids(args: argparse.Namespace) -> None:
         cli_utils.print_table_as_csv(table)
     else:
         rich.get_console().print(table)
+
+
+@contextlib.contextmanager
+def _open_id_list(path: str) -> Iterator[TextIO]:
+    if path == "-":
+        yield sys.stdin
+    else:
+        with open(path, encoding="utf8") as f:
+            yield f
+
+
+def _read_ids(file: TextIO) -> Iterator[str]:
+    """Yields each ID in a file, one line at a time (so we never hold the whole list at once)"""
+    for line in file:
+        if line := line.strip():
+            yield line
+
+
+def _print_chart_ids(index: external.ExternalIdIndex, path: str) -> None:
+    """Streams out a CSV of FHIR ID -> chart ID, for each FHIR ID in the file"""
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["fhir_id", "chart_id"])
+
+    with _open_id_list(path) as file:
+        for fhir_id in _read_ids(file):
+            # Like external annotator files, IDs without a resource type are assumed encounters
+            try:
+                chart_id = index.label_studio_id(fhir_id)
+            except ValueError:
+                chart_id = None  # unsupported resource type, which we'll never find
+            writer.writerow([fhir_id, "" if chart_id is None else chart_id])
+
+
+def _print_fhir_ids(index: external.ExternalIdIndex, path: str) -> None:
+    """Streams out a CSV of chart ID -> FHIR IDs, for each chart ID in the file"""
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["chart_id", "original_fhir_id", "anonymized_fhir_id"])
+
+    with _open_id_list(path) as file:
+        for chart_id in _read_ids(file):
+            fhir_ids = index.fhir_ids(int(chart_id)) if chart_id.isdigit() else None
+            for orig_id, anon_id in fhir_ids or [(None, None)]:
+                writer.writerow([chart_id, orig_id, anon_id])
@@ -1,28 +1,43 @@
 """Methods for McNemar calculations."""
 
 import argparse
+import functools
+import itertools
+import math
 
+import numpy as np
 import rich
 import rich.box
 import rich.table
 import rich.text
-from scipy.stats import binom, chi2
 
-from chart_review import cli_utils, console_utils
+from chart_review import agree, cli_utils, console_utils, encoding
 
 
 def make_subparser(parser: argparse.ArgumentParser) -> None:
     cli_utils.add_project_args(parser)
     cli_utils.add_output_args(parser)
+    parser.add_argument(
+        "--adjust",
+        choices=list(ADJUSTMENTS),
+        help="adjust p-values for comparing several pairs of annotators on each label: "
+        "bonferroni, holm, or fdr (Benjamini-Hochberg)",
+    )
     parser.add_argument("truth_annotator")
-    parser.add_argument("annotator1")
-    parser.add_argument("annotator2")
+    parser.add_argument(
+        "annotators",
+        nargs="+",
+        metavar="annotator",
+        help="two or more annotators to compare (every pair will be tested)",
+    )
     parser.set_defaults(func=print_mcnemar)
 
 
 def print_mcnemar(args: argparse.Namespace) -> None:
     """
-    McNemar calculation between three annotators (one truth, two normal).
+    McNemar calculation between a truth annotator and two or more normal annotators.
+
+    With more than two normal annotators, every pair of them is tested.
 
     More information:
      https://en.wikipedia.org/wiki/McNemar's_test
@@ -30,50 +45,64 @@ def print_mcnemar(args: argparse.Namespace) -> None:
     """
     reader = cli_utils.get_cohort_reader(args)
     truth = args.truth_annotator
-    annotator1 = args.annotator1
-    annotator2 = args.annotator2
-
-    all_people = {truth, annotator1, annotator2}
-    annotators = [annotator1, annotator2]
+    annotators = args.annotators
+    all_people = [truth, *annotators]
 
     for annotator in all_people:
         if annotator not in reader.note_range:
             raise ValueError(f"Unrecognized annotator '{annotator}'")
 
-    if len(all_people) != 3:
+    if len(set(all_people)) != len(all_people):
         raise ValueError("Can’t compare the same annotator with themselves.")
+    if len(annotators) < 2:
+        raise ValueError("Please specify at least two annotators to compare with the truth.")
 
     # Grab the intersection of ranges
-    note_range = reader.note_range[truth]
+    note_range = set(reader.note_range[truth])
     for annotator in annotators:
         note_range &= reader.note_range[annotator]
 
     labels = [None, *sorted(reader.class_labels)]
 
-    # Calculate contingency tables
-    matrices = {
-        label: reader.contingency_table(truth, annotator1, annotator2, note_range, label)
-        for label in labels
-    }
-
-    console = rich.get_console()
-
-    table = cli_utils.create_table(
-        "McNemar", "P-value", "BC", "OL", "OR", "BW", "Label", dense=True
+    # Calculate contingency tables for every pair & label at once,
+    # then add them up for each pair's overall row
+    pair_matrices = encoding.all_pairs_contingency_counts(
+        reader.annotations, truth, annotators, note_range, reader.class_labels
     )
+    for matrices in pair_matrices.values():
+        matrices[None] = sum(matrices.values(), agree.ContingencyCounts())
+    pairs = list(pair_matrices)
+
+    # Run every test at once, as a pairs by labels array
+    only_left = np.array([[pair_matrices[p][label].only_left for label in labels] for p in pairs])
+    only_right = np.array([[pair_matrices[p][label].only_right for label in labels] for p in pairs])
+    statistics, pvalues = _mcnemar(only_left, only_right, continuity_correction=True)
+    adjusted = ADJUSTMENTS[args.adjust](pvalues) if args.adjust else None
+
+    multiple_pairs = len(pairs) > 1
+    headers = ["McNemar", "P-value"]
+    if adjusted is not None:
+        headers.append("Adj P-value")
+    headers += ["BC", "OL", "OR", "BW"]
+    if multiple_pairs:
+        headers += ["Left", "Right"]
+    table = cli_utils.create_table(*headers, "Label", dense=True)
+
     empty_val = "" if args.csv else "N/A"
-    for label in labels:
-        m = matrices[label]
-        mcn, pval = _mcnemar(len(m["OL"]), len(m["OR"]), continuity_correction=True)
-        table.add_row(
-            empty_val if mcn is None else _small_float(mcn),
-            _small_float(pval),
-            str(len(m["BC"])),
-            str(len(m["OL"])),
-            str(len(m["OR"])),
-            str(len(m["BW"])),
-            str(label) if label else "*",
-        )
+    for pair_index, pair in enumerate(pairs):
+        for label_index, label in enumerate(labels):
+            m = pair_matrices[pair][label]
+            mcn = statistics[pair_index, label_index]
+            row = [
+                empty_val if math.isnan(mcn) else _small_float(mcn),
+                _small_float(pvalues[pair_index, label_index]),
+            ]
+            if adjusted is not None:
+                row.append(_small_float(adjusted[pair_index, label_index]))
+            row += [str(m.both_correct), str(m.only_left), str(m.only_right), str(m.both_wrong)]
+            if multiple_pairs:
+                row += list(pair)
+            table.add_row(*row, str(label) if label else "*")
 
     if args.csv:
         cli_utils.print_table_as_csv(table)
@@ -81,12 +110,8 @@ def print_mcnemar(args: argparse.Namespace) -> None:
 
     # OK we aren't printing a CSV file to stdout, so we can include a bit more explanation
     # as a little header to the real results.
-    note_count = len(note_range)
-    chart_word = "chart" if note_count == 1 else "charts"
-    pretty_ranges = f" ({console_utils.pretty_note_range(note_range)})" if note_count > 0 else ""
-    console.print(f"Comparing {note_count} {chart_word}{pretty_ranges}")
-    console.print(f"Truth: {truth}")
-    console.print(f"Annotators: {', '.join(annotators)}")
+    console_utils.print_comparison_header(note_range, annotators, truth=truth)
+    console = rich.get_console()
     console.print()
 
     console.print(table)
@@ -101,16 +126,99 @@ def _small_float(number: float) -> str:
     return f"{number:.2e}"
 
 
-# From https://en.wikipedia.org/wiki/McNemar's_test
+# Below this many discordant pairs, we use the exact (mid-P) binomial test instead
+EXACT_CUTOFF = 25
+
+
+@functools.cache
+def _mid_p_table() -> np.ndarray:
+    """
+    Returns two-sided mid-P values for the exact binomial test (with p=0.5).
+
+    The table is indexed by [number of discordant pairs, the smaller of the two counts],
+    and covers every size below EXACT_CUTOFF.
+    """
+    table = np.ones((EXACT_CUTOFF, EXACT_CUTOFF))
+    for total in range(EXACT_CUTOFF):
+        pmf = [math.comb(total, k) / 2**total for k in range(total + 1)]
+        for n_min, (point, cumulative) in enumerate(zip(pmf, itertools.accumulate(pmf))):
+            table[total, n_min] = min(2 * cumulative - point, 1)
+    return table
+
+
+# numpy has no erfc of its own (and we don't want to pull in scipy just for this)
+_erfc = np.vectorize(math.erfc, otypes=[float])
+
+
+def _chi2_sf(statistics: np.ndarray) -> np.ndarray:
+    """Survival function of the chi-squared distribution with one degree of freedom"""
+    return _erfc(np.sqrt(statistics / 2))
+
+
+# Based on https://en.wikipedia.org/wiki/McNemar's_test
 # Licensed as CC-BY-SA-4.0
-# With small tweaks to fit our style and return the McNemar test value.
-def _mcnemar(b: int, c: int, continuity_correction: bool = False) -> tuple[float | None, float]:
-    n_min, n_max = sorted([b, c])
+# With tweaks to fit our style, return the McNemar test value, and test many tables at once.
+def _mcnemar(
+    b: np.ndarray, c: np.ndarray, continuity_correction: bool = False
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Runs McNemar's test for several contingency tables at once.
+
+    :param b: the "only left correct" counts
+    :param c: the "only right correct" counts
+    :return: the McNemar test values (NaN where the exact test was used) and their p-values
+    """
+    b = np.asarray(b, dtype=np.int64)
+    c = np.asarray(c, dtype=np.int64)
+    n_min = np.minimum(b, c)
+    total = b + c
     corr = 1 if continuity_correction else 0
-    if (n_min + n_max) < 25:
-        chi2_statistic = None
-        pvalue = 2 * binom.cdf(n_min, n_min + n_max, 0.5) - binom.pmf(n_min, n_min + n_max, 0.5)
-    else:
-        chi2_statistic = (abs(n_min - n_max) - corr) ** 2 / (n_min + n_max)
-        pvalue = chi2.sf(chi2_statistic, 1)
-    return chi2_statistic, pvalue
+
+    exact = total < EXACT_CUTOFF
+    statistics = np.full(total.shape, np.nan)
+    pvalues = np.empty(total.shape)
+
+    pvalues[exact] = _mid_p_table()[total[exact], n_min[exact]]
+
+    asymptotic = ~exact
+    statistics[asymptotic] = (np.abs(b - c)[asymptotic] - corr) ** 2 / total[asymptotic]
+    pvalues[asymptotic] = _chi2_sf(statistics[asymptotic])
+
+    return statistics, pvalues
+
+
+def _bonferroni(pvalues: np.ndarray) -> np.ndarray:
+    """Bonferroni adjustment: multiply by the number of tests"""
+    return np.minimum(pvalues * len(pvalues), 1)
+
+
+def _holm(pvalues: np.ndarray) -> np.ndarray:
+    """Holm-Bonferroni step-down adjustment"""
+    count = len(pvalues)
+    order = np.argsort(pvalues, axis=0, kind="stable")
+    ranked = np.take_along_axis(pvalues, order, axis=0)
+    factors = (count - np.arange(count)).reshape(-1, *[1] * (pvalues.ndim - 1))
+    stepped = np.minimum(np.maximum.accumulate(ranked * factors, axis=0), 1)
+    adjusted = np.empty_like(stepped)
+    np.put_along_axis(adjusted, order, stepped, axis=0)
+    return adjusted
+
+
+def _fdr(pvalues: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg step-up adjustment, controlling the false discovery rate"""
+    count = len(pvalues)
+    order = np.argsort(pvalues, axis=0, kind="stable")
+    ranked = np.take_along_axis(pvalues, order, axis=0)
+    factors = (count / np.arange(1, count + 1)).reshape(-1, *[1] * (pvalues.ndim - 1))
+    stepped = np.minimum.accumulate((ranked * factors)[::-1], axis=0)[::-1]
+    adjusted = np.empty_like(stepped)
+    np.put_along_axis(adjusted, order, np.minimum(stepped, 1), axis=0)
+    return adjusted
+
+
+# Multiple comparison adjustments, each applied down the first axis (the family of tests)
+ADJUSTMENTS = {
+    "bonferroni": _bonferroni,
+    "holm": _holm,
+    "fdr": _fdr,
+}
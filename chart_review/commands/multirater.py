@@ -0,0 +1,67 @@
+"""Methods for agreement across many annotators at once."""
+
+import argparse
+
+import rich
+
+from chart_review import agree, cli_utils, console_utils, reliability
+
+
+def make_subparser(parser: argparse.ArgumentParser) -> None:
+    cli_utils.add_project_args(parser)
+    cli_utils.add_output_args(parser)
+    parser.add_argument(
+        "annotators", nargs="*", metavar="annotator", help="annotators to compare (default: all)"
+    )
+    parser.set_defaults(func=print_multirater)
+
+
+def print_multirater(args: argparse.Namespace) -> None:
+    """
+    Agreement between any number of annotators, with no one annotator treated as the truth.
+
+    More information:
+     https://en.wikipedia.org/wiki/Fleiss'_kappa
+     https://en.wikipedia.org/wiki/Krippendorff's_alpha
+    """
+    reader = cli_utils.get_cohort_reader(args)
+    annotators = list(dict.fromkeys(args.annotators)) or list(reader.note_range)
+
+    for annotator in annotators:
+        if annotator not in reader.note_range:
+            raise ValueError(f"Unrecognized annotator '{annotator}'")
+    if len(annotators) < 2:
+        raise ValueError("Please specify at least two different annotators to compare.")
+
+    note_ranges = {annotator: reader.note_range[annotator] for annotator in annotators}
+    counts = reliability.rater_counts(reader.annotations, note_ranges, reader.class_labels)
+
+    table = cli_utils.create_table("Kappa", "Alpha", "Label", dense=True)
+
+    def add_row(key, label_text: str) -> None:
+        kappa = reliability.fleiss_kappa(counts[key])
+        alpha = reliability.krippendorff_alpha(counts[key])
+        table.add_row(agree.float_to_str(kappa), agree.float_to_str(alpha), label_text)
+
+    add_row(None, "*")
+    seen_wildcards = set()
+    for label in sorted(reader.class_labels):
+        # Add a row for any sublabel namespace, before its values
+        wildcard_label = agree.rollup_label(label)
+        if wildcard_label is not None and wildcard_label not in seen_wildcards:
+            add_row(wildcard_label, str(wildcard_label))
+            seen_wildcards.add(wildcard_label)
+        add_row(label, str(label))
+
+    if args.csv:
+        cli_utils.print_table_as_csv(table)
+        return
+
+    # OK we aren't printing a CSV file to stdout, so we can include a bit more explanation
+    # as a little header to the real results.
+    note_range = reliability.pairable_notes(note_ranges)
+    console_utils.print_comparison_header(note_range, annotators)
+    console = rich.get_console()
+    console.print()
+
+    console.print(table)
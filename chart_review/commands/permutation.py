@@ -0,0 +1,116 @@
+"""Methods for paired permutation tests."""
+
+import argparse
+import math
+
+import rich
+
+from chart_review import agree, cli_utils, console_utils, encoding, permutation
+
+
+def make_subparser(parser: argparse.ArgumentParser) -> None:
+    cli_utils.add_project_args(parser)
+    cli_utils.add_output_args(parser)
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=10000,
+        metavar="N",
+        help="how many random permutations to test (default: 10000)",
+    )
+    parser.add_argument("--seed", type=int, help="random seed, for reproducible p-values")
+    parser.add_argument("truth_annotator")
+    parser.add_argument("annotator1")
+    parser.add_argument("annotator2")
+    parser.set_defaults(func=print_permutation)
+
+
+def print_permutation(args: argparse.Namespace) -> None:
+    """
+    Paired permutation test of F1 and Kappa differences between two annotators (vs a truth).
+
+    More information:
+     https://en.wikipedia.org/wiki/Permutation_test
+     https://aclanthology.org/C00-2137/
+    """
+    if args.iterations < 1:
+        raise ValueError("--iterations needs at least one permutation.")
+
+    reader = cli_utils.get_cohort_reader(args)
+    truth = args.truth_annotator
+    annotator1 = args.annotator1
+    annotator2 = args.annotator2
+
+    all_people = {truth, annotator1, annotator2}
+    annotators = [annotator1, annotator2]
+
+    for annotator in all_people:
+        if annotator not in reader.note_range:
+            raise ValueError(f"Unrecognized annotator '{annotator}'")
+
+    if len(all_people) != 3:
+        raise ValueError("Can’t compare the same annotator with themselves.")
+
+    # Grab the intersection of ranges
+    note_range = set(reader.note_range[truth])
+    for annotator in annotators:
+        note_range &= reader.note_range[annotator]
+
+    # Break out each annotator's per-chart cells, scored over the same labels
+    encoded = encoding.MentionEncoding(reader.annotations, reader.class_labels, all_people)
+    left, right = (
+        encoded.chart_cells(truth, annotator, note_range, used_by=all_people)
+        for annotator in annotators
+    )
+    results = permutation.paired_test(
+        left, right, args.iterations, seed=args.seed, workers=args.workers
+    )
+
+    table = cli_utils.create_table(
+        *(f"{metric} {column}" for metric in permutation.METRICS for column in ("Diff", "P-value")),
+        "Label",
+        dense=True,
+    )
+
+    def add_row(index: int, label_text: str) -> None:
+        row = []
+        for difference, pvalues in results.values():
+            row.append(agree.float_to_str(difference[index]))
+            row.append(_pvalue_to_str(pvalues[index]))
+        table.add_row(*row, label_text)
+
+    # The columns are the overall score, then labels, then sublabel wildcards
+    column_index = {key: index for index, key in enumerate(left.keys)}
+    add_row(column_index[None], "*")
+    for label in sorted(reader.class_labels):
+        # Add a row for any sublabel namespace, before its values
+        wildcard_label = agree.rollup_label(label)
+        if wildcard_label is not None and wildcard_label in column_index:
+            add_row(column_index.pop(wildcard_label), str(wildcard_label))
+        add_row(column_index[label], str(label))
+
+    if args.csv:
+        cli_utils.print_table_as_csv(table)
+        return
+
+    # OK we aren't printing a CSV file to stdout, so we can include a bit more explanation
+    # as a little header to the real results.
+    console_utils.print_comparison_header(note_range, annotators, truth=truth)
+    console = rich.get_console()
+    console.print(
+        f"Differences are {annotator1} minus {annotator2}, over {args.iterations} permutations."
+    )
+    console.print()
+
+    console.print(table)
+
+
+def _pvalue_to_str(pvalue: float) -> str:
+    if math.isnan(pvalue):
+        return "-"
+    rounded = str(round(pvalue, 3))
+    if rounded != "0.0":
+        return rounded
+
+    # Too small for simple rounding, use scientific notation instead
+    return f"{pvalue:.2e}"
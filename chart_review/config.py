@@ -29,10 +29,16 @@ class ProjectConfig:
         # But as humans writing config files, it's more natural to think of "name -> id".
         # So that's what we keep in the config, and we just reverse it here for convenience.
         self.annotators = defines.AnnotatorMap()
+        self.prediction_annotators: dict[str, str] = {}  # model_version -> name
         self.external_annotations = {}
+        self.consensus_annotators = {}
         for name, value in self._data.get("annotators", {}).items():
             if isinstance(value, int):  # real annotation layer in Label Studio
                 self.annotators[value] = name
+            elif isinstance(value, dict) and "model_version" in value:  # LS prediction layer
+                self.prediction_annotators[str(value["model_version"])] = name
+            elif isinstance(value, dict) and "consensus" in value:  # vote of other annotators
+                self.consensus_annotators[name] = value
             else:  # fake/external annotation layer that we will inject
                 self.external_annotations[name] = value
 
@@ -50,6 +56,7 @@ class ProjectConfig:
                 value = {value}
             source_matcher = defines.LabelMatcher(key)
             self.implied_labels[source_matcher] = set(defines.Label.parse(x) for x in value)
+        self._check_implied_cycles()
 
         # ** Grouped labels **
         self.grouped_labels = defines.GroupedLabels()
@@ -65,6 +72,45 @@ class ProjectConfig:
         # Validate that we don't have any partial labels like A|B by constructing them all:
         self.class_labels.direct_labels()
 
+    def _check_implied_cycles(self) -> None:
+        """
+        Raises an error if implied labels ever loop back around to an earlier label.
+
+        Every label in a loop is implied by another label, so we only need to walk from the
+        implied labels in the config (not from the possibly-wildcard matchers).
+        """
+        implied = set().union(*self.implied_labels.values())
+        successors = {
+            label: sorted(
+                set().union(
+                    *(
+                        targets
+                        for matcher, targets in self.implied_labels.items()
+                        if matcher.is_match(label)
+                    )
+                )
+                - {label}  # a label implying itself is harmless
+            )
+            for label in implied
+        }
+
+        finished = set()
+
+        def visit(label: defines.Label, path: list[defines.Label]) -> None:
+            if label in path:
+                cycle = " → ".join(str(x) for x in [*path[path.index(label) :], label])
+                raise ValueError(f"Implied labels form a cycle: {cycle}")
+            if label in finished:
+                return
+            path.append(label)
+            for successor in successors[label]:
+                visit(successor, path)
+            path.pop()
+            finished.add(label)
+
+        for label in sorted(implied):
+            visit(label, [])
+
     def path(self, filename: str) -> str:
         return os.path.join(self.project_dir, filename)
 
@@ -112,6 +158,10 @@ class ProjectConfig:
             print(f"Unknown note range '{value}'", file=sys.stderr)
             return []
 
+    @property
+    def cache(self) -> bool:
+        return bool(self._data.get("cache", False))
+
     @property
     def ignore(self) -> set[str]:
         return set(self._data.setdefault("ignore", []))
@@ -0,0 +1,105 @@
+"""Virtual annotators that vote on labels, based on other annotators"""
+
+import math
+
+import numpy as np
+
+from chart_review import defines, encoding
+
+
+def _parse_config(name: str, config: dict) -> tuple[list[str], int | str]:
+    """Returns the voters and voting rule for a consensus annotator config"""
+    voters = config.get("consensus")
+    if isinstance(voters, str):
+        voters = [voters]
+    if not isinstance(voters, list) or not voters:
+        raise ValueError(f"Consensus annotator '{name}' needs a list of annotators to vote.")
+    voters = list(dict.fromkeys(str(voter) for voter in voters))
+
+    vote = config.get("vote", "majority")
+    if vote not in {"majority", "unanimous"} and (
+        not isinstance(vote, int) or isinstance(vote, bool) or not 1 <= vote <= len(voters)
+    ):
+        raise ValueError(
+            f"Did not understand vote '{vote}' for consensus annotator '{name}'. "
+            f"Use majority, unanimous, or a number of votes from 1 to {len(voters)}."
+        )
+
+    return voters, vote
+
+
+def _votes_needed(vote: int | str, voter_count: int) -> int:
+    if vote == "majority":
+        return math.floor(voter_count / 2) + 1
+    elif vote == "unanimous":
+        return voter_count
+    return vote
+
+
+def vote_mentions(
+    annotations: defines.ProjectAnnotations,
+    note_ranges: dict[str, defines.NoteSet],
+    voters: list[str],
+    vote: int | str = "majority",
+) -> defines.Mentions:
+    """
+    Counts each label's votes across some annotators, keeping the labels that got enough votes.
+
+    Only notes that every voter reviewed are voted on (the intersection of their note ranges),
+    so that each note has the same number of votes available.
+
+    :param annotations: prepared map of annotators & mentions
+    :param note_ranges: map of annotator -> note range
+    :param voters: the annotators that vote
+    :param vote: "majority" (more than half), "unanimous" (all), or a number of votes needed
+    :return: the winning labels for each voted-on note (including notes with no winning labels)
+    """
+    notes = sorted(set.intersection(*(set(note_ranges[voter]) for voter in voters)))
+    labels = set()
+    for voter in voters:
+        for note_id in notes:
+            labels |= annotations.mentions.get(voter, {}).get(note_id, set())
+
+    # Add up every voter's notes-by-labels array, then compare to the votes needed
+    encoded = encoding.MentionEncoding(annotations, labels, voters)
+    votes = np.zeros((len(notes), len(encoded.labels)), dtype=np.int64)
+    for voter in voters:
+        votes += encoded.note_rows(voter, notes)
+    winners = votes >= _votes_needed(vote, len(voters))
+
+    return {
+        note_id: {encoded.labels[column] for column in np.flatnonzero(winners[row])}
+        for row, note_id in enumerate(notes)
+    }
+
+
+def merge_all_consensus(
+    annotations: defines.ProjectAnnotations,
+    note_ranges: dict[str, defines.NoteSet],
+    configs: dict[str, dict],
+) -> None:
+    """
+    Adds consensus annotators into annotations, in the order given.
+
+    Later consensus annotators may use earlier ones as voters.
+    If a consensus annotator has a configured note range, only notes in that range are kept.
+
+    :param annotations: prepared map of annotators & mentions, which will be updated
+    :param note_ranges: map of annotator -> note range, which will be updated
+    :param configs: map of consensus annotator name -> config
+    """
+    pending = set(configs)
+    for name, config in configs.items():
+        voters, vote = _parse_config(name, config)
+        for voter in voters:
+            if voter in pending or voter not in note_ranges:
+                raise ValueError(f"Unrecognized annotator '{voter}' in consensus '{name}'")
+
+        mentions = vote_mentions(annotations, note_ranges, voters, vote)
+        if name in note_ranges:
+            mentions = {
+                note_id: mentions[note_id] for note_id in note_ranges[name] & mentions.keys()
+            }
+        annotations.mentions[name] = mentions
+        note_ranges[name] = set(mentions)
+        pending.remove(name)
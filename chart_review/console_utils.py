@@ -1,5 +1,7 @@
 """Helper methods for printing to the console."""
 
+from collections.abc import Sequence
+
 import rich
 
 from chart_review import cohort, defines
@@ -38,6 +40,27 @@ def pretty_note_range(notes: defines.NoteSet) -> str:
     return ", ".join(ranges)
 
 
+def print_comparison_header(
+    note_range: defines.NoteSet, annotators: Sequence[str], truth: str | None = None
+) -> None:
+    """
+    Prints which charts and annotators are being compared, as a little header to the results.
+
+    :param note_range: the charts being compared
+    :param annotators: the annotators being compared
+    :param truth: (optional) the annotator being used as the ground truth
+    """
+    console = rich.get_console()
+    note_count = len(note_range)
+    chart_word = "chart" if note_count == 1 else "charts"
+    pretty_ranges = f" ({pretty_note_range(note_range)})" if note_count > 0 else ""
+    console.print(f"Comparing {note_count} {chart_word}{pretty_ranges}")
+    if truth is not None:
+        console.print(f"Truth: {truth}")
+    annotator_word = "Annotator" if len(annotators) == 1 else "Annotators"
+    console.print(f"{annotator_word}: {', '.join(annotators)}")
+
+
 def print_ignored_charts(reader: cohort.CohortReader):
     """
     Prints a line about ignored charts, suitable for underlying a table.
@@ -2,6 +2,7 @@
 
 import dataclasses
 import functools
+from collections.abc import Collection
 
 
 def _split_label(label_str: str) -> tuple[str, str, str]:
@@ -81,6 +82,11 @@ NoteSet = set[int]
 # Usually used in the context of a specific annotator's label mentions.
 Mentions = dict[int, LabelSet]
 
+# Map of label_studio_note_id: {label: confidence score}
+# Usually used in the context of a specific annotator's label mentions.
+# A mentioned label without a score here is considered positive at every confidence threshold.
+Scores = dict[int, dict[Label, float]]
+
 
 class LabelMatcher:
     """
@@ -97,6 +103,21 @@ class LabelMatcher:
     def __init__(self, *expressions: str):
         self._labels = frozenset(_split_label(x) for x in expressions)
 
+        # Index the patterns by kind, so that matching is just a few hash lookups
+        self._exact_labels: LabelSet = set()  # "A|B|C" or "A"
+        self._any_value: set[tuple[str, str]] = set()  # "A|B|*" as (A, B)
+        self._any_sublabel: set[str] = set()  # "A|*" as A
+        for label in self._labels:
+            if label[1] == "*":
+                self._any_sublabel.add(label[0])
+            elif label[2] == "*":
+                self._any_value.add(label[:2])
+            else:
+                try:
+                    self._exact_labels.add(Label(*label))
+                except ValueError:
+                    pass  # a partial label like "A|B" that no real label can ever match
+
     def __eq__(self, other):
         return self._labels == other._labels
 
@@ -107,17 +128,23 @@ class LabelMatcher:
         return bool(self._labels)
 
     def is_match(self, other: Label) -> bool:
-        for label in self._labels:
-            if (
-                label[0] == other.label
-                and (label[1] in {"*", other.sublabel_name})
-                and (label[1] == "*" or label[2] in {"*", other.sublabel_value})
-            ):
-                return True
-        return False
-
-    def matches_in_set(self, other: LabelSet) -> LabelSet:
-        return {label for label in other if self.is_match(label)}
+        return (
+            other in self._exact_labels
+            or other.label in self._any_sublabel
+            or (other.label, other.sublabel_name) in self._any_value
+        )
+
+    def matches_in_set(self, other: Collection[Label]) -> LabelSet:
+        """Returns all the labels in the given collection that match"""
+        matches = self._exact_labels.intersection(other)
+        if self._any_sublabel or self._any_value:
+            matches.update(
+                label
+                for label in other
+                if label.label in self._any_sublabel
+                or (label.label, label.sublabel_name) in self._any_value
+            )
+        return matches
 
     def direct_labels(self) -> LabelSet:
         """Returns all directly specified (non-wildcard) labels in the match set"""
@@ -153,11 +180,6 @@ class ProjectAnnotations:
         default_factory=dict
     )
 
-    def remove(self, chart_id: int):
-        # Remove any instance of this chart ID
-        for mentions in self.mentions.values():
-            if chart_id in mentions:
-                del mentions[chart_id]
-        for mentions in self.original_text_mentions.values():
-            if chart_id in mentions:
-                del mentions[chart_id]
+    # Some sources (like NLP) provide a confidence score for each label they mention.
+    # annotator_name -> Scores
+    scores: dict[str, Scores] = dataclasses.field(default_factory=dict)
@@ -0,0 +1,333 @@
+"""Compact array encodings of annotator mentions, for comparing many annotators at once"""
+
+import dataclasses
+import itertools
+from collections.abc import Collection, Iterable, Sequence
+
+import numpy as np
+
+from chart_review import agree, defines, parallel
+
+
+@dataclasses.dataclass
+class ChartCells:
+    """
+    Confusion matrix cells broken out per chart, for a set of scoring columns (like labels).
+
+    Each array has a row for each chart and a column for each key. Summing the rows gives the
+    usual confusion matrix counts, while a weighted sum gives the counts for a resampled cohort.
+    True negatives are not stored, since they follow from the other cells (see true_neg()).
+
+    A chart's cell never counts more than the number of labels, so the per-chart arrays use the
+    smallest signed integer type that fits (usually int8), to keep them cheap to copy to workers.
+    """
+
+    keys: list
+    true_pos: np.ndarray
+    false_neg: np.ndarray
+    false_pos: np.ndarray
+    # The number of label cells that each chart has in each column
+    # (1 for a single label, more for an aggregate of several labels, or 0 for an unused label)
+    sizes: np.ndarray
+
+    def true_neg(self, weights: np.ndarray, true_pos, false_neg, false_pos) -> np.ndarray:
+        """Returns true negative counts, given some weighted sums of the other cells"""
+        return (
+            np.multiply.outer(weights.sum(axis=-1), self.sizes) - true_pos - false_neg - false_pos
+        )
+
+
+class MentionEncoding:
+    """
+    Every annotator's mentions, as sparse sets of (note, label) cells.
+
+    Each annotator gets a sorted array of flat cell indices (note row * label count + label
+    column), so the encoding is only as big as the mentions themselves and is cheap to send to
+    worker processes. Comparisons are set operations on those arrays, and dense notes by labels
+    arrays are only built for the notes that a caller asks for (see note_rows).
+    """
+
+    def __init__(
+        self,
+        annotations: defines.ProjectAnnotations,
+        labels: Iterable[defines.Label],
+        annotators: Iterable[str] | None = None,
+    ):
+        """
+        :param annotations: prepared map of annotators & mentions
+        :param labels: the labels to encode (any others are dropped). If empty, every label used
+            by the encoded annotators is encoded, and counts only cover the labels that the
+            compared annotators used (just like the agree module does without labels).
+        :param annotators: (optional) the annotators to encode, defaults to all of them
+        """
+        if annotators is None:
+            annotators = annotations.mentions.keys()
+        all_mentions = {
+            annotator: annotations.mentions.get(annotator, defines.Mentions())
+            for annotator in annotators
+        }
+
+        labels = set(labels)
+        self._only_used = not labels
+        if self._only_used:
+            for mentions in all_mentions.values():
+                for note_labels in mentions.values():
+                    labels |= note_labels
+        self.labels = sorted(labels)
+        label_index = {label: index for index, label in enumerate(self.labels)}
+
+        self.notes = sorted(set().union(*(mentions.keys() for mentions in all_mentions.values())))
+        self._note_index = {note_id: index for index, note_id in enumerate(self.notes)}
+
+        self.cells: dict[str, np.ndarray] = {}
+        for annotator, mentions in all_mentions.items():
+            cells = [
+                self._note_index[note_id] * len(self.labels) + label_index[label]
+                for note_id, note_labels in mentions.items()
+                for label in note_labels
+                if label in label_index
+            ]
+            self.cells[annotator] = np.unique(np.array(cells, dtype=np.int64))
+
+    def _split(self, cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Splits flat cell indices into (note rows, label columns)"""
+        return np.divmod(cells, max(len(self.labels), 1))
+
+    def _label_totals(self, cells: np.ndarray) -> np.ndarray:
+        """Returns how many of the given cells are in each label column"""
+        return np.bincount(self._split(cells)[1], minlength=len(self.labels))
+
+    def label_use(self, annotator: str) -> np.ndarray:
+        """Returns a boolean array of which labels an annotator used at least once"""
+        return self._label_totals(self.cells[annotator]) > 0
+
+    def note_mask(self, note_range: Collection[int]) -> np.ndarray:
+        """Returns a boolean array of which encoded notes are in the given range"""
+        mask = np.zeros(len(self.notes), dtype=bool)
+        mask[[self._note_index[x] for x in note_range if x in self._note_index]] = True
+        return mask
+
+    def _cells_in(self, annotator: str, mask: np.ndarray) -> np.ndarray:
+        """Returns an annotator's cells in the notes selected by a note_mask"""
+        cells = self.cells[annotator]
+        return cells[mask[self._split(cells)[0]]]
+
+    def note_rows(self, annotator: str, notes: Sequence[int]) -> np.ndarray:
+        """
+        Returns an annotator's mentions for the given notes, as a notes by labels boolean array.
+
+        Notes that nobody mentioned are not encoded, but come back as all negative.
+        """
+        out_rows = np.full(len(self.notes), -1, dtype=np.int64)
+        for out_row, note_id in enumerate(notes):
+            if note_id in self._note_index:
+                out_rows[self._note_index[note_id]] = out_row
+
+        rows, columns = self._split(self.cells[annotator])
+        rows = out_rows[rows]
+        wanted = rows >= 0
+
+        dense = np.zeros((len(notes), len(self.labels)), dtype=bool)
+        dense[rows[wanted], columns[wanted]] = True
+        return dense
+
+    def confusion_counts_by_label(
+        self, truth: str, annotator: str, note_range: Collection[int]
+    ) -> dict[defines.Label, agree.ConfusionCounts]:
+        """
+        Like agree.confusion_counts_by_label, but using the encoded arrays.
+
+        Notes in the range that nobody mentioned are not encoded, but are still counted as
+        true negatives, because we use the size of the range for the total.
+        """
+        # Only examine labels that were used by either annotator at least once
+        used = self.label_use(truth) | self.label_use(annotator)
+
+        mask = self.note_mask(note_range)
+        truth_cells = self._cells_in(truth, mask)
+        annotator_cells = self._cells_in(annotator, mask)
+        both_cells = np.intersect1d(truth_cells, annotator_cells, assume_unique=True)
+        tp = self._label_totals(both_cells)
+        fn = self._label_totals(truth_cells) - tp
+        fp = self._label_totals(annotator_cells) - tp
+        tn = len(note_range) - tp - fn - fp
+
+        counts = {}
+        for index, label in enumerate(self.labels):
+            if used[index]:
+                counts[label] = agree.ConfusionCounts(
+                    true_pos=int(tp[index]),
+                    false_neg=int(fn[index]),
+                    true_neg=int(tn[index]),
+                    false_pos=int(fp[index]),
+                )
+            elif not self._only_used:
+                counts[label] = agree.ConfusionCounts()
+        return counts
+
+    def chart_cells(
+        self,
+        truth: str,
+        annotator: str,
+        note_range: Collection[int],
+        any_positive: bool = False,
+        used_by: Iterable[str] | None = None,
+    ) -> ChartCells:
+        """
+        Breaks out per-chart confusion matrix cells for every column of an accuracy table.
+
+        The columns are the overall score (key None), then each label,
+        and then each sublabel wildcard (see agree.confusion_counts_with_rollups).
+
+        :param truth: annotator to use as the ground truth
+        :param annotator: another annotator to compare with truth
+        :param note_range: collection of LabelStudio document ID
+        :param any_positive: whether to score wildcards per note rather than by summing sublabels
+        :param used_by: (optional) the annotators whose labels get scored, defaults to truth and
+            annotator (pass more to score several annotators' cells over the same labels)
+        :return: the per-chart cells, with a row for each note in note_range, in sorted order
+        """
+        if used_by is None:
+            used_by = [truth, annotator]
+        used = np.zeros(len(self.labels), dtype=bool)
+        for used_annotator in used_by:
+            used |= self.label_use(used_annotator)
+
+        notes = sorted(note_range)
+        truth_positive = self.note_rows(truth, notes)
+        annotator_positive = self.note_rows(annotator, notes)
+
+        # Signed, so that callers can safely subtract one annotator's cells from another's
+        dtype = np.min_scalar_type(-len(self.labels) - 1)
+        tp = (truth_positive & annotator_positive).astype(dtype)
+        fn = (truth_positive & ~annotator_positive).astype(dtype)
+        fp = (~truth_positive & annotator_positive).astype(dtype)
+
+        # Map each sublabel to its wildcard column
+        rollups = sorted({agree.rollup_label(x) for x in self.labels} - {None})
+        rollup_index = {label: index for index, label in enumerate(rollups)}
+        groups = np.zeros((len(self.labels), len(rollups)), dtype=np.int64)
+        for index, label in enumerate(self.labels):
+            if (parent := agree.rollup_label(label)) is not None:
+                groups[index, rollup_index[parent]] = 1
+
+        if any_positive:
+            truth_group = (truth_positive @ groups) > 0
+            annotator_group = (annotator_positive @ groups) > 0
+            group_tp = (truth_group & annotator_group).astype(dtype)
+            group_fn = (truth_group & ~annotator_group).astype(dtype)
+            group_fp = (~truth_group & annotator_group).astype(dtype)
+            group_sizes = ((used @ groups) > 0).astype(np.int64)
+        else:
+            group_tp, group_fn, group_fp = tp @ groups, fn @ groups, fp @ groups
+            group_sizes = used @ groups
+
+        def columns(overall, by_label, by_group) -> np.ndarray:
+            return np.column_stack([overall, by_label, by_group]).astype(dtype)
+
+        return ChartCells(
+            keys=[None, *self.labels, *rollups],
+            true_pos=columns(tp.sum(axis=1), tp, group_tp),
+            false_neg=columns(fn.sum(axis=1), fn, group_fn),
+            false_pos=columns(fp.sum(axis=1), fp, group_fp),
+            sizes=np.concatenate([[used.sum()], used, group_sizes]).astype(np.int64),
+        )
+
+
+def all_pairs_confusion_counts(
+    annotations: defines.ProjectAnnotations,
+    note_ranges: dict[str, defines.NoteSet],
+    labels: Iterable[defines.Label],
+    annotators: Collection[str] | None = None,
+    workers: int | None = None,
+) -> dict[tuple[str, str], dict[defines.Label, agree.ConfusionCounts]]:
+    """
+    Counts confusion matrix cells for every ordered pair of annotators (truth, annotator).
+
+    Each pair only compares the notes that are in both annotators' note ranges.
+
+    :param annotations: prepared map of annotators & mentions
+    :param note_ranges: map of annotator -> note range
+    :param labels: the labels to count (or every used label, if empty)
+    :param annotators: (optional) the annotators to compare, defaults to all in note_ranges
+    :param workers: if more than one, spread the pairs across this many worker processes
+    :return: map of (truth, annotator) -> label -> counts, in annotator order
+    """
+    if annotators is None:
+        annotators = list(note_ranges)
+
+    encoding = MentionEncoding(annotations, labels, annotators)
+    pairs = {
+        (truth, annotator): note_ranges[truth] & note_ranges[annotator]
+        for truth in annotators
+        for annotator in annotators
+        if truth != annotator
+    }
+
+    counts = parallel.map_with_payload(
+        MentionEncoding.confusion_counts_by_label,
+        encoding,
+        [truth for truth, _ in pairs],
+        [annotator for _, annotator in pairs],
+        pairs.values(),
+        workers=workers,
+    )
+    return dict(zip(pairs, counts))
+
+
+def all_pairs_contingency_counts(
+    annotations: defines.ProjectAnnotations,
+    truth: str,
+    annotators: Sequence[str],
+    note_range: Collection[int],
+    labels: Iterable[defines.Label],
+) -> dict[tuple[str, str], dict[defines.Label, agree.ContingencyCounts]]:
+    """
+    Counts contingency table cells for every pair of annotators, against one truth annotator.
+
+    Each annotator's mistakes (the cells where they disagreed with truth) are worked out once,
+    as a sparse set of cells. Then each pair is just an intersection of two of those sets,
+    and the cells that neither annotator got wrong follow from the size of the range.
+
+    :param annotations: prepared map of annotators & mentions
+    :param truth: annotator to use as the ground truth
+    :param annotators: the annotators to compare with each other
+    :param note_range: collection of LabelStudio document ID
+    :param labels: the labels to count (or every used label, if empty)
+    :return: map of (left, right) -> label -> counts, for each pair in annotator order.
+        Like agree.contingency_counts_by_label, labels that none of the three annotators
+        used have counts of all zeros.
+    """
+    encoded = MentionEncoding(annotations, labels, [truth, *annotators])
+    mask = encoded.note_mask(note_range)
+    truth_cells = encoded._cells_in(truth, mask)
+    wrong = {
+        annotator: np.setxor1d(encoded._cells_in(annotator, mask), truth_cells, assume_unique=True)
+        for annotator in annotators
+    }
+    wrong_totals = {annotator: encoded._label_totals(cells) for annotator, cells in wrong.items()}
+    used = {annotator: encoded.label_use(annotator) for annotator in encoded.cells}
+
+    pair_counts = {}
+    for left, right in itertools.combinations(annotators, 2):
+        both_wrong = encoded._label_totals(
+            np.intersect1d(wrong[left], wrong[right], assume_unique=True)
+        )
+        only_left = wrong_totals[right] - both_wrong
+        only_right = wrong_totals[left] - both_wrong
+        both_correct = len(note_range) - only_left - only_right - both_wrong
+        pair_used = used[truth] | used[left] | used[right]
+
+        pair_counts[left, right] = {
+            label: agree.ContingencyCounts(
+                both_correct=int(both_correct[index]),
+                only_left=int(only_left[index]),
+                only_right=int(only_right[index]),
+                both_wrong=int(both_wrong[index]),
+            )
+            if pair_used[index]
+            else agree.ContingencyCounts()
+            for index, label in enumerate(encoded.labels)
+            if pair_used[index] or not encoded._only_used
+        }
+    return pair_counts
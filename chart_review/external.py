@@ -1,10 +1,17 @@
 """Match external document references & labels to Label Studio data"""
 
 import csv
+import dataclasses
+import functools
 import os
 import sys
+from collections.abc import Callable
 
-from chart_review import defines, studio
+from chart_review import cache, defines, parallel, studio
+
+MentionsTransform = Callable[
+    [defines.Mentions, defines.Scores], tuple[defines.Mentions, defines.Scores]
+]
 
 
 class ExternalCsvParser:
@@ -23,9 +30,9 @@ class ExternalCsvParser:
         self._read_headers()
         return self
 
-    def __next__(self) -> tuple[str, defines.Label | None]:
+    def __next__(self) -> tuple[str, defines.Label | None, float | None]:
         row = next(self.reader)
-        return self._row_to_id(row), self._row_to_label(row)
+        return self._row_to_id(row), self._row_to_label(row), self._row_to_score(row)
 
     def _read_headers(self):
         self.reader = csv.reader(self.file)
@@ -36,6 +43,7 @@ class ExternalCsvParser:
 
         self.sublabel_name_col = None
         self.sublabel_value_col = None
+        self.score_col = None
 
         # There are two ways headers could be layed out:
         # - bare bones two column layout of id/label
@@ -75,6 +83,10 @@ class ExternalCsvParser:
                     self.sublabel_value_col = header.index("sublabel_value")
                 except ValueError:
                     self._error("no 'sublabel_value' column found")
+            try:
+                self.score_col = header.index("score")
+            except ValueError:
+                pass  # this is allowed
 
     def _row_to_id(self, row: list[str]) -> str:
         row_id = row[self.id_col]
@@ -93,6 +105,15 @@ class ExternalCsvParser:
 
         return defines.Label(*args)
 
+    def _row_to_score(self, row: list[str]) -> float | None:
+        if self.score_col is None or not row[self.score_col]:
+            return None  # no score means that the label is positive at any threshold
+
+        try:
+            return float(row[self.score_col])
+        except ValueError:
+            self._error(f"invalid score '{row[self.score_col]}'")
+
     def _check_col_name_for_res(self, col_name: str) -> str | None:
         if "doc" in col_name or col_name == "note_ref":
             return "DocumentReference"
@@ -107,48 +128,100 @@ class ExternalCsvParser:
         raise ValueError(f"Could not parse external file '{self.filename}': {msg}.")
 
 
-def _load_csv_labels(filename: str) -> dict[str, defines.LabelSet]:
+def _load_csv_labels(
+    filename: str,
+) -> tuple[dict[str, defines.LabelSet], dict[str, dict[defines.Label, float]]]:
     """
     Loads a csv and returns a list of labels per row.
 
     CSV format is two columns, where the first is note/encounter id and the second is a single
     label.
 
-    Returns {row_id -> set of labels for that ID}
+    Returns {row_id -> set of labels for that ID} and {row_id -> label -> confidence score}
     """
     id_to_labels = {}
+    id_to_scores = {}
 
     with ExternalCsvParser(filename) as parser:
-        for row_id, label in parser:
+        for row_id, label, score in parser:
             label_set = id_to_labels.setdefault(row_id, defines.LabelSet())
             if label:  # can be None if no labels given for a row
                 label_set.add(label)
+                if score is not None:
+                    label_scores = id_to_scores.setdefault(row_id, {})
+                    label_scores[label] = max(score, label_scores.get(label, score))
 
-    return id_to_labels
+    return id_to_labels, id_to_scores
 
 
-def _note_ref_to_label_studio_id(export: studio.ExportFile, note_ref: str) -> int | None:
-    """Looks at the metadata in LS and grabs the note ID that holds the provided note ref"""
-    for note in export.notes:
-        for key, value in note.docref_mappings.items():
-            # Support older exports that didn't specify DocRef vs DxReport
-            key = key if "/" in key else f"DocumentReference/{key}"
-            value = value if "/" in value else f"DocumentReference/{value}"
+class ExternalIdIndex:
+    """
+    A hash index of every FHIR ID in a Label Studio export's metadata.
+
+    This allows quick lookups in both directions: FHIR ID -> LS note ID and vice versa.
+    """
+
+    def __init__(self, export: studio.ExportFile):
+        self._notes: dict[int, studio.Note] = {}
+        self._ls_ids: dict[str, int] = {}
+
+        # If an ID shows up in several notes, the first note wins
+        for note in export.notes:
+            self._notes.setdefault(note.note_id, note)
+
             # Allow either an anonymous ID or the real ID -- collisions seem very unlikely
             # (i.e. real IDs aren't going to be formatted like our long anonymous ID hash)
-            if key == note_ref or value == note_ref:
-                return note.note_id
-    return None
+            for enc_id in (note.encounter_id, note.anon_encounter_id):
+                if enc_id:
+                    self._ls_ids.setdefault(f"Encounter/{enc_id}", note.note_id)
+
+            for key, value in note.docref_mappings.items():
+                # Support older exports that didn't specify DocRef vs DxReport
+                key = key if "/" in key else f"DocumentReference/{key}"
+                value = value if "/" in value else f"DocumentReference/{value}"
+                self._ls_ids.setdefault(key, note.note_id)
+                self._ls_ids.setdefault(value, note.note_id)
+
+    def label_studio_id(self, row_id: str) -> int | None:
+        """Returns the LS note ID that holds the provided ID"""
+        # First, check if there is a resource prefix, which will tell us which kind of ID this is
+        parts = row_id.split("/", 1)
+        if parts[0] == "Encounter" or len(parts) == 1:
+            return self._ls_ids.get(f"Encounter/{parts[-1]}")
+        elif parts[0] in {"DiagnosticReport", "DocumentReference"}:
+            return self._ls_ids.get(row_id)
+        else:
+            raise ValueError(f"Unrecognized resource type: {parts[0]}")
 
+    def fhir_ids(self, ls_id: int) -> list[tuple[str | None, str | None]] | None:
+        """
+        Returns all (original, anonymized) FHIR ID pairs for the provided LS note ID.
 
-def _encounter_id_to_label_studio_id(export: studio.ExportFile, enc_id: str) -> int | None:
-    """Looks at the metadata in LS and grabs the note ID that holds the provided encounter"""
-    for note in export.notes:
-        # Allow either an anonymous ID or the real ID -- collisions seem very unlikely
-        # (i.e. real IDs aren't going to be formatted like our long anonymous ID hash)
-        if note.encounter_id == enc_id or note.anon_encounter_id == enc_id:
-            return note.note_id
-    return None
+        Returns None if the note ID is not in the export.
+        """
+        if not (note := self._notes.get(ls_id)):
+            return None
+
+        fhir_ids = []
+
+        # Grab encounters first
+        orig_id = note.encounter_id and f"Encounter/{note.encounter_id}"
+        anon_id = note.anon_encounter_id and f"Encounter/{note.anon_encounter_id}"
+        if orig_id or anon_id:
+            fhir_ids.append((orig_id, anon_id))
+
+        # Now each DocRef ID
+        for orig_id, anon_id in note.docref_mappings.items():
+            fhir_ids.append((f"DocumentReference/{orig_id}", f"DocumentReference/{anon_id}"))
+
+        return fhir_ids
+
+
+# Every lookup in a run is against the same export, so we only need to keep the latest index
+@functools.lru_cache(maxsize=1)
+def id_index(export: studio.ExportFile) -> ExternalIdIndex:
+    """Returns the ID index for an export, building it the first time it's needed"""
+    return ExternalIdIndex(export)
 
 
 def external_id_to_label_studio_id(
@@ -156,43 +229,197 @@ def external_id_to_label_studio_id(
     row_id: str,
 ) -> int | None:
     """Looks at the metadata in LS and grabs the note ID that holds the provided ID"""
-    # First, check if there is a resource prefix, which will tell us which kind of ID this is
-    parts = row_id.split("/", 1)
-    if parts[0] == "Encounter" or len(parts) == 1:
-        return _encounter_id_to_label_studio_id(export, parts[-1])
-    elif parts[0] in {"DiagnosticReport", "DocumentReference"}:
-        return _note_ref_to_label_studio_id(export, row_id)
-    else:
-        raise ValueError(f"Unrecognized resource type: {parts[0]}")  # pragma: no cover
+    return id_index(export).label_studio_id(row_id)
+
+
+def export_ids_digest(export: studio.ExportFile) -> str:
+    """Returns a digest of all the ID mapping metadata in the export"""
+    return cache.digest_data(
+        [
+            [
+                note.note_id,
+                note.encounter_id,
+                note.anon_encounter_id,
+                sorted(note.docref_mappings.items()),
+            ]
+            for note in export.notes
+        ]
+    )
+
+
+def _resolve_external(
+    export: studio.ExportFile, filename: str
+) -> tuple[defines.Mentions, defines.Scores]:
+    """Loads an external csv file and converts all of its IDs to Label Studio IDs"""
+    label_map, score_map = _load_csv_labels(filename)
 
+    # Inspect exported json to see if it has the metadata we'll need.
+    for note in export.notes:
+        if not note.docref_mappings:
+            raise ValueError(
+                "Your Label Studio export does not include note/encounter ID mapping metadata!\n"
+                "Consider re-uploading your notes using Cumulus ETL's upload-notes command."
+            )
+        break  # just inspect one
 
-def merge_external(
-    annotations: defines.ProjectAnnotations,
+    # Convert each row id into an LS id, carrying along any confidence scores
+    # (every scored row also has an entry in label_map, so one lookup per row covers both)
+    mentions = defines.Mentions()
+    scores = defines.Scores()
+    for row_id, label_set in label_map.items():
+        ls_id = external_id_to_label_studio_id(export, row_id)
+        if ls_id is None:
+            continue
+
+        all_labels = mentions.setdefault(ls_id, set())
+        all_labels |= label_set
+
+        if label_scores := score_map.get(row_id):
+            all_scores = scores.setdefault(ls_id, {})
+            for label, score in label_scores.items():
+                all_scores[label] = max(score, all_scores.get(label, score))
+
+    return mentions, scores
+
+
+def _read_cached_external(cached) -> tuple[defines.Mentions, defines.Scores] | None:
+    """Decodes cached external annotations, or returns None if they aren't in the right shape"""
+    try:
+        mentions = {
+            int(note_id): {defines.Label(*label) for label in labels}
+            for note_id, labels in cached["mentions"].items()
+        }
+        scores = {
+            int(note_id): {defines.Label(*label): score for *label, score in label_scores}
+            for note_id, label_scores in cached["scores"].items()
+        }
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None  # someone else's file, or a corrupted one: just resolve from scratch
+    return mentions, scores
+
+
+def _load_external(
+    export: studio.ExportFile, project_dir: str, name: str, filename: str, export_digest: str
+) -> tuple[defines.Mentions, defines.Scores]:
+    """
+    Like _resolve_external, but uses a cached result if neither the csv nor the export changed.
+
+    Resolving IDs can be slow for big projects, so this can save a lot of time.
+
+    :param export_digest: digest of the export's ID mapping metadata (see export_ids_digest)
+    """
+    key = [cache.digest_file(filename), export_digest]
+    cached = cache.load(project_dir, "external", name, key)
+    if cached is not None and (result := _read_cached_external(cached)) is not None:
+        return result
+
+    mentions, scores = _resolve_external(export, filename)
+
+    cache.save(
+        project_dir,
+        "external",
+        name,
+        key,
+        {
+            "mentions": {
+                note_id: [dataclasses.astuple(label) for label in labels]
+                for note_id, labels in mentions.items()
+            },
+            "scores": {
+                note_id: [[*dataclasses.astuple(label), score] for label, score in items.items()]
+                for note_id, items in scores.items()
+            },
+        },
+    )
+    return mentions, scores
+
+
+def load_external(
     export: studio.ExportFile,
     project_dir: str,
     name: str,
     config: dict,
-) -> None:
-    """Loads an external csv file annotator and merges them into an existing simple dict"""
+    export_digest: str | None = None,
+) -> tuple[defines.Mentions, defines.Scores]:
+    """
+    Loads an external csv file annotator and returns its mentions & scores by LS note ID
+
+    :param export_digest: if given, cache the results in the project folder, keyed on this digest
+        of the export's ID mapping metadata (see export_ids_digest)
+    """
     if isinstance(config, dict) and (filename := config.get("filename")):
         full_filename = os.path.join(project_dir, filename)
-        label_map = _load_csv_labels(full_filename)
+        if export_digest is None:
+            return _resolve_external(export, full_filename)
+        return _load_external(export, project_dir, name, full_filename, export_digest)
     else:
         raise ValueError(f"Did not understand config for external annotator '{name}'")
 
-    # Inspect exported json to see if it has the metadata we'll need.
-    for note in export.notes:
-        if not note.docref_mappings:
-            raise ValueError(
-                "Your Label Studio export does not include note/encounter ID mapping metadata!\n"
-                "Consider re-uploading your notes using Cumulus ETL's upload-notes command."
-            )
-        break  # just inspect one
 
-    # Convert each row id into an LS id:
+def _merge_mentions(
+    annotations: defines.ProjectAnnotations,
+    name: str,
+    mentions: defines.Mentions,
+    scores: defines.Scores,
+) -> None:
     external_mentions = annotations.mentions.setdefault(name, defines.Mentions())
-    for row_id, label_set in label_map.items():
-        ls_id = external_id_to_label_studio_id(export, row_id)
-        if ls_id is not None:
-            all_labels = external_mentions.setdefault(ls_id, set())
-            all_labels |= label_set
+    for ls_id, label_set in mentions.items():
+        all_labels = external_mentions.setdefault(ls_id, set())
+        all_labels |= label_set
+
+    if scores:
+        external_scores = annotations.scores.setdefault(name, defines.Scores())
+        for ls_id, label_scores in scores.items():
+            all_scores = external_scores.setdefault(ls_id, {})
+            for label, score in label_scores.items():
+                all_scores[label] = max(score, all_scores.get(label, score))
+
+
+def _load_transformed(
+    shared: tuple[studio.ExportFile, str, str | None, MentionsTransform | None],
+    name: str,
+    config: dict,
+) -> tuple[defines.Mentions, defines.Scores]:
+    export, project_dir, export_digest, transform = shared
+    mentions, scores = load_external(export, project_dir, name, config, export_digest)
+    if transform:
+        mentions, scores = transform(mentions, scores)
+    return mentions, scores
+
+
+def merge_all_external(
+    annotations: defines.ProjectAnnotations,
+    export: studio.ExportFile,
+    project_dir: str,
+    configs: dict[str, dict],
+    workers: int | None = None,
+    transform: MentionsTransform | None = None,
+    use_cache: bool = False,
+) -> None:
+    """
+    Loads several external csv file annotators and merges them all into annotations.
+
+    CSV parsing, ID matching, and simplifying are plain Python work, so to load annotators side
+    by side, pass more than one worker and each annotator is loaded in a worker process.
+    Either way, they are merged in the order given, so the result never depends on the workers.
+
+    If a transform is given, each annotator's mentions & scores are passed through it first.
+    With workers, the transform runs in the worker too, so it must be picklable
+    (like a bound method of simplify.MentionSimplifier).
+    If use_cache is set, resolved annotations are cached in the project folder.
+    """
+    if not configs:
+        return
+
+    # The export is the same for every annotator, so only digest it once
+    export_digest = export_ids_digest(export) if use_cache else None
+
+    loaded = parallel.map_with_payload(
+        _load_transformed,
+        (export, project_dir, export_digest, transform),
+        configs.keys(),
+        configs.values(),
+        workers=workers,
+    )
+    for name, (mentions, scores) in zip(configs, loaded):
+        _merge_mentions(annotations, name, mentions, scores)
@@ -0,0 +1,77 @@
+"""Spreading work across worker processes"""
+
+import concurrent.futures
+import functools
+from collections.abc import Callable, Iterable
+from typing import Any
+
+import numpy as np
+
+# How many random replicates to calculate at once (bounded so each batch's arrays stay small)
+BATCH_SIZE = 100
+
+# The payload that worker processes share (set once per process, to avoid re-sending)
+_worker_payload: Any = None
+
+
+def _init_worker(payload: Any) -> None:  # pragma: no cover (only runs in worker processes)
+    global _worker_payload
+    _worker_payload = payload
+
+
+def _call_worker(fn: Callable, *args) -> Any:  # pragma: no cover (only runs in worker processes)
+    return fn(_worker_payload, *args)
+
+
+def map_with_payload(
+    fn: Callable, payload: Any, *iterables: Iterable, workers: int | None = None
+) -> list:
+    """
+    Calls fn(payload, *args) for each set of args zipped from iterables, in order.
+
+    With more than one worker (and more than one call), the calls are spread across worker
+    processes, and the payload is only sent once to each process instead of with every call.
+    In that case, fn and the payload must be picklable (like a module-level function).
+
+    :param fn: the function to call
+    :param payload: the (possibly large) first argument, shared by every call
+    :param iterables: the remaining arguments for each call
+    :param workers: if more than one, spread the calls across this many worker processes
+    :return: the result of each call, in order
+    """
+    calls = list(zip(*iterables))
+    if not workers or workers < 2 or len(calls) < 2:
+        return [fn(payload, *args) for args in calls]
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(workers, len(calls)), initializer=_init_worker, initargs=(payload,)
+    ) as executor:
+        return list(executor.map(functools.partial(_call_worker, fn), *zip(*calls)))
+
+
+def map_batches(
+    fn: Callable,
+    payload: Any,
+    iterations: int,
+    *,
+    seed: int | None = None,
+    workers: int | None = None,
+) -> list:
+    """
+    Calls fn(payload, seed, size) for batches of random replicates, covering iterations in all.
+
+    Each batch gets its own seed, spawned from the given one,
+    so the same seed gives the same batches regardless of the number of workers.
+
+    :param fn: the function that calculates one batch of replicates
+    :param payload: the data to resample, shared by every batch
+    :param iterations: how many replicates to calculate in all
+    :param seed: (optional) random seed, for reproducible results
+    :param workers: if more than one, spread the batches across this many worker processes
+    :return: the result of each batch, in order
+    """
+    sizes = [BATCH_SIZE] * (iterations // BATCH_SIZE)
+    if iterations % BATCH_SIZE:
+        sizes.append(iterations % BATCH_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return map_with_payload(fn, payload, seeds, sizes, workers=workers)
@@ -0,0 +1,103 @@
+"""Paired permutation tests (approximate randomization) between two annotators"""
+
+import numpy as np
+
+from chart_review import agree, encoding, parallel
+
+# The scores we test differences for
+METRICS = ("F1", "Kappa")
+
+_CELLS = ("true_pos", "false_neg", "false_pos")
+
+
+def _differences(
+    left: encoding.ChartCells, right: encoding.ChartCells, swaps: np.ndarray
+) -> dict[str, np.ndarray]:
+    """
+    Scores left minus right, after swapping the outputs of some charts between the two.
+
+    :param swaps: permutations (rows) by charts (columns), holding 1 where a chart is swapped
+    :return: metric -> (permutations x columns) array of score differences
+    """
+    chart_count = left.true_pos.shape[0]
+    sizes = np.maximum(left.sizes, right.sizes)
+
+    left_cells, right_cells = {}, {}
+    for name in _CELLS:
+        left_charts, right_charts = getattr(left, name), getattr(right, name)
+        # Swapping a chart moves its difference in contributions from one side to the other
+        moved = swaps @ (right_charts - left_charts)
+        left_cells[name] = left_charts.sum(axis=0) + moved
+        right_cells[name] = right_charts.sum(axis=0) - moved
+
+    def score(cells: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        true_neg = chart_count * sizes - sum(cells.values())
+        return agree.score_arrays(true_neg=true_neg, **cells)
+
+    left_scores, right_scores = score(left_cells), score(right_cells)
+    return {metric: left_scores[metric] - right_scores[metric] for metric in METRICS}
+
+
+def _count_batch(
+    cells: tuple[encoding.ChartCells, encoding.ChartCells, dict[str, np.ndarray]],
+    seed: np.random.SeedSequence,
+    size: int,
+) -> dict[str, np.ndarray]:
+    """Counts how many of a batch of permutations differ at least as much as observed"""
+    left, right, observed = cells
+    rng = np.random.default_rng(seed)
+    swaps = rng.integers(0, 2, size=(size, left.true_pos.shape[0]), dtype=np.int64)
+    differences = _differences(left, right, swaps)
+
+    counts = {}
+    for metric in METRICS:
+        permuted, target = np.abs(differences[metric]), np.abs(observed[metric])
+        # Allow for float noise, so that ties with the observed difference count as extreme
+        extreme = (permuted >= target) | np.isclose(permuted, target)
+        counts[metric] = extreme.sum(axis=0)
+    return counts
+
+
+def paired_test(
+    left: encoding.ChartCells,
+    right: encoding.ChartCells,
+    iterations: int,
+    *,
+    seed: int | None = None,
+    workers: int | None = None,
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    Tests whether two annotators score differently against the same truth, by approximate
+    randomization: each chart's outputs are randomly swapped between the two annotators.
+
+    Each permutation is just the original cell totals plus a swap-weighted sum of the per-chart
+    differences between the two annotators, and permutations are calculated in batches as
+    matrix products.
+
+    The same seed gives the same p-values, regardless of the number of workers.
+
+    :param left: the per-chart cells of one annotator against truth
+    :param right: the per-chart cells of another annotator against truth, for the same charts
+        and columns (see encoding.MentionEncoding.chart_cells and its used_by parameter)
+    :param iterations: how many permutations to calculate
+    :param seed: (optional) random seed, for reproducible results
+    :param workers: if more than one, spread the batches across this many worker processes
+    :return: metric -> (observed differences, two-sided p-values), with an entry in each array
+        per column in the cells. Differences that can't be scored get NaN for both.
+    """
+    no_swaps = np.zeros((1, left.true_pos.shape[0]), dtype=np.int64)
+    observed = {metric: diff[0] for metric, diff in _differences(left, right, no_swaps).items()}
+
+    batches = parallel.map_batches(
+        _count_batch, (left, right, observed), iterations, seed=seed, workers=workers
+    )
+
+    results = {}
+    for metric in METRICS:
+        extreme = sum((batch[metric] for batch in batches), np.zeros(len(left.keys)))
+        # Count the observed assignment itself as one of the permutations, so p is never zero
+        pvalues = (extreme + 1) / (iterations + 1)
+        pvalues[np.isnan(observed[metric])] = np.nan
+        results[metric] = (observed[metric], pvalues)
+
+    return results
@@ -0,0 +1,141 @@
+"""Multi-rater agreement scores (Fleiss' kappa and Krippendorff's alpha)"""
+
+import collections
+from collections.abc import Collection, Iterable
+
+import numpy as np
+
+from chart_review import agree, defines
+
+
+def rater_counts(
+    annotations: defines.ProjectAnnotations,
+    note_ranges: dict[str, defines.NoteSet],
+    labels: Iterable[defines.Label],
+) -> dict[defines.Label | None, np.ndarray]:
+    """
+    Counts how many annotators put each chart into each category, for every label at once.
+
+    Each label is a yes/no question (columns: no, yes) for the charts in an annotator's range.
+    Charts outside an annotator's range are treated as missing data for that annotator.
+
+    Each sublabel namespace (like "Deceased → Datetime") also gets a nominal row
+    keyed by its wildcard label (see agree.rollup_label), where each annotator's category
+    is the set of values they picked for a chart (with picking no values as its own category).
+
+    The overall row (key None) pools every label's yes/no counts, as if each chart & label
+    combination were a separate question.
+
+    :param annotations: prepared map of annotators & mentions
+    :param note_ranges: map of annotator -> the charts they reviewed (only these annotators count)
+    :param labels: the labels to count
+    :return: map of label -> array of charts (rows) by categories (columns), holding rater counts
+    """
+    labels = sorted(labels)
+    label_set = set(labels)
+
+    notes = sorted(set().union(*note_ranges.values()))
+    note_index = {note_id: index for index, note_id in enumerate(notes)}
+    raters = np.zeros(len(notes), dtype=np.int64)
+
+    # A single pass over every annotator's mentions
+    positives = {label: np.zeros(len(notes), dtype=np.int64) for label in labels}
+    picked = collections.defaultdict(lambda: collections.defaultdict(set))
+    for annotator, note_range in note_ranges.items():
+        mentions = annotations.mentions.get(annotator, {})
+        for note_id in note_range:
+            index = note_index[note_id]
+            raters[index] += 1
+            for label in mentions.get(note_id, ()):
+                if label not in label_set:
+                    continue
+                positives[label][index] += 1
+                if (wildcard := agree.rollup_label(label)) is not None:
+                    picked[wildcard][(index, annotator)].add(label.sublabel_value)
+
+    counts = {
+        label: np.column_stack([raters - positives[label], positives[label]]) for label in labels
+    }
+    counts[None] = (
+        np.concatenate([counts[label] for label in labels]) if labels else np.zeros((0, 2))
+    )
+
+    for label in labels:
+        wildcard = agree.rollup_label(label)
+        if wildcard is not None and wildcard not in counts:
+            counts[wildcard] = _nominal_counts(raters, picked[wildcard])
+
+    return counts
+
+
+def _nominal_counts(raters: np.ndarray, picked: dict[tuple[int, str], set[str]]) -> np.ndarray:
+    """Turns each annotator's picked values into a charts by categories array of rater counts"""
+    categories = {}  # value combination -> column (column 0 is for picking nothing)
+    cells = collections.Counter()
+    for (index, _annotator), values in picked.items():
+        column = categories.setdefault(frozenset(values), len(categories) + 1)
+        cells[(index, column)] += 1
+
+    counts = np.zeros((len(raters), len(categories) + 1), dtype=np.int64)
+    for (index, column), count in cells.items():
+        counts[index, column] = count
+    counts[:, 0] = raters - counts[:, 1:].sum(axis=1)
+    return counts
+
+
+def _pairable(counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Drops charts with fewer than two raters, which can't tell us anything about agreement"""
+    per_chart = counts.sum(axis=1)
+    keep = per_chart >= 2
+    return counts[keep].astype(float), per_chart[keep].astype(float)
+
+
+def fleiss_kappa(counts: np.ndarray) -> float:
+    """
+    Calculates Fleiss' kappa from a charts by categories array of rater counts.
+
+    Charts may have different numbers of raters (charts with fewer than two are ignored),
+    in which case each chart's agreement is averaged over the pairs of raters it had.
+
+    :return: the kappa score, or NaN if there's nothing to score or only one category was used
+    """
+    counts, per_chart = _pairable(counts)
+    if not len(counts):
+        return float("nan")
+
+    observed = ((counts * (counts - 1)).sum(axis=1) / (per_chart * (per_chart - 1))).mean()
+    proportions = counts.sum(axis=0) / per_chart.sum()
+    expected = (proportions**2).sum()
+    if expected == 1:
+        return float("nan")
+    return float((observed - expected) / (1 - expected))
+
+
+def krippendorff_alpha(counts: np.ndarray) -> float:
+    """
+    Calculates Krippendorff's alpha (nominal) from a charts by categories array of rater counts.
+
+    Alpha handles missing ratings natively, by weighting each chart's pairs of raters.
+    Charts with fewer than two raters are ignored.
+
+    :return: the alpha score, or NaN if there's nothing to score or only one category was used
+    """
+    counts, per_chart = _pairable(counts)
+
+    # Observed disagreement: the mismatched pairs of ratings within each chart
+    # (the off-diagonal of Krippendorff's coincidence matrix)
+    observed = ((per_chart**2 - (counts**2).sum(axis=1)) / (per_chart - 1)).sum()
+
+    # Expected disagreement: the mismatched pairs among all ratings, regardless of chart
+    totals = counts.sum(axis=0)
+    total = totals.sum()
+    expected = total**2 - (totals**2).sum()
+    if not expected:
+        return float("nan")
+    return float(1 - (total - 1) * observed / expected)
+
+
+def pairable_notes(note_ranges: dict[str, Collection[int]]) -> set[int]:
+    """Returns the charts that at least two of the annotators reviewed"""
+    seen = collections.Counter(note_id for notes in note_ranges.values() for note_id in notes)
+    return {note_id for note_id, count in seen.items() if count >= 2}
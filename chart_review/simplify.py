@@ -1,8 +1,14 @@
+import math
+from collections.abc import Iterable
+
 from chart_review import config, defines, studio
 
 
 def simplify_export(
-    export: studio.ExportFile, proj_config: config.ProjectConfig
+    export: studio.ExportFile,
+    proj_config: config.ProjectConfig,
+    *,
+    simplifier: "MentionSimplifier | None" = None,
 ) -> defines.ProjectAnnotations:
     """
     Label Studio outputs contain more info than needed for IAA and term_freq.
@@ -11,6 +17,7 @@ def simplify_export(
 
     :param export: exported json from Label Studio
     :param proj_config: project configuration
+    :param simplifier: if provided, used to simplify each note's mentions as they are read
     :return: all project mentions parsed from the Label Studio export
     """
     annotations = defines.ProjectAnnotations()
@@ -21,111 +28,237 @@ def simplify_export(
             if proj_config.annotators and annot.author not in proj_config.annotators:
                 continue  # user specified an annotators config, and this one doesn't fit
             annotator = proj_config.annotators.get(annot.author, str(annot.author))
+            _add_note_mentions(
+                annotations, proj_config, simplifier, annotator, note.note_id, annot.mentions
+            )
 
-            # Grab all valid mentions for this annotator & note
-            labels = defines.LabelSet()
-            text_tags = []
-            for mention in annot.mentions:
-                labels |= mention.labels
-                text_tags.append(defines.LabeledText(mention.text, mention.labels))
-
-            valid_proj_labels = labels
-            if proj_config.class_labels:
-                valid_proj_labels = proj_config.class_labels.matches_in_set(labels)
-            annotations.labels |= valid_proj_labels
+        # Model predictions are only used if the config asks for them
+        for prediction in note.predictions:
+            if annotator := proj_config.prediction_annotators.get(prediction.model_version):
+                _add_note_mentions(
+                    annotations,
+                    proj_config,
+                    simplifier,
+                    annotator,
+                    note.note_id,
+                    prediction.mentions,
+                )
 
-            # Store these mentions in the main annotations list, by author & note
-            annotator_mentions = annotations.mentions.setdefault(annotator, defines.Mentions())
-            annotator_mentions[note.note_id] = labels
-            annot_orig_text_tags = annotations.original_text_mentions.setdefault(annotator, {})
-            annot_orig_text_tags[note.note_id] = text_tags
+    if simplifier:
+        simplifier.simplify_project_labels(annotations.labels)
 
     return annotations
 
 
-def _find_implied_labels(
-    source_label: defines.Label,
-    implied_label_mappings: defines.ImpliedLabels,
-    found_labels: defines.LabelSet | None = None,
-) -> defines.LabelSet:
+def _add_note_mentions(
+    annotations: defines.ProjectAnnotations,
+    proj_config: config.ProjectConfig,
+    simplifier: "MentionSimplifier | None",
+    annotator: str,
+    note_id: int,
+    mentions: list[studio.Mention],
+) -> None:
+    # Grab all valid mentions for this annotator & note
+    labels = defines.LabelSet()
+    text_tags = []
+    scores = {}
+    for mention in mentions:
+        labels |= mention.labels
+        text_tags.append(defines.LabeledText(mention.text, mention.labels))
+        for label in mention.labels:
+            if (score := mention.label_score(label)) is not None:
+                scores[label] = max(score, scores.get(label, score))
+
+    # Even ignored notes help define the set of project labels
+    valid_proj_labels = labels
+    if proj_config.class_labels:
+        valid_proj_labels = proj_config.class_labels.matches_in_set(labels)
+    annotations.labels |= valid_proj_labels
+
+    annotator_mentions = annotations.mentions.setdefault(annotator, defines.Mentions())
+    annot_orig_text_tags = annotations.original_text_mentions.setdefault(annotator, {})
+
+    if simplifier:
+        if note_id in simplifier.ignored_notes:
+            return
+        if scores:
+            scores = simplifier.simplify_scores(labels, scores)
+        labels = simplifier.simplify_labels(labels)
+
+    # Store these mentions in the main annotations list, by author & note
+    annotator_mentions[note_id] = labels
+    annot_orig_text_tags[note_id] = text_tags
+    if scores:
+        annotator_scores = annotations.scores.setdefault(annotator, defines.Scores())
+        annotator_scores[note_id] = scores
+
+
+class ImpliedLabelClosure:
     """
-    Expands the source label into the set of all implied labels.
+    A precompiled table of each label to the full set of labels it implies (including itself).
 
-    Don't bother passing found_labels in, that's just a helper arg for recursion.
+    Wildcard matchers in the implied-labels config are resolved against a vocabulary of known
+    labels up front, so that expanding a label afterward is a single dict lookup.
+    (Labels outside the vocabulary still work, they just get compiled on first use.)
+
+    The mappings must not loop back on themselves (ProjectConfig checks that as it loads).
     """
-    if found_labels is None:
-        found_labels = set()
-
-    if source_label in found_labels:
-        return found_labels
-
-    found_labels.add(source_label)
-    for matcher, implied_labels in implied_label_mappings.items():
-        if matcher.is_match(source_label):
-            for implied_label in implied_labels:
-                _find_implied_labels(
-                    implied_label, implied_label_mappings, found_labels=found_labels
-                )
 
-    return found_labels
+    def __init__(
+        self,
+        implied_label_mappings: defines.ImpliedLabels,
+        vocabulary: Iterable[defines.Label] = (),
+    ):
+        self._mappings = implied_label_mappings
+        self._closures: dict[defines.Label, frozenset[defines.Label]] = {}
+        for label in vocabulary:
+            self.expand(label)
+
+    def expand(self, label: defines.Label) -> frozenset[defines.Label]:
+        """Returns the set of all labels implied by the given label, including itself"""
+        if (closure := self._closures.get(label)) is None:
+            closure = self._compile(label)
+        return closure
+
+    def _direct_labels(self, label: defines.Label) -> defines.LabelSet:
+        direct = set()
+        for matcher, implied_labels in self._mappings.items():
+            if matcher.is_match(label):
+                direct |= implied_labels
+        direct.discard(label)  # a label implying itself is harmless
+        return direct
 
+    def _compile(self, label: defines.Label) -> frozenset[defines.Label]:
+        closure = {label}
+        for implied_label in self._direct_labels(label):
+            closure |= self.expand(implied_label)
 
-def _find_implied_mentions(
-    mentions: defines.Mentions, implied_label_mappings: defines.ImpliedLabels
-) -> defines.Mentions:
+        self._closures[label] = frozenset(closure)
+        return self._closures[label]
+
+
+class GroupedLabelMap:
     """
-    For every note, expands its labels into the set of all implied labels for that note.
+    A precompiled table of each label to the group label that replaces it (or itself, if none).
+
+    Like ImpliedLabelClosure, the group matchers are resolved against a vocabulary of known
+    labels up front, so that converting a label afterward is a single dict lookup.
+
+    Groups are applied one after another, in config order (just like converting a whole note's
+    labels one group at a time). So if a label matches several groups, the first group wins,
+    but a later group can still absorb that group label in turn.
+
+    Each entry also records whether any group matches the label at all,
+    which is what decides if the label is still a valid project label (see is_grouped).
     """
-    found_mentions = defines.Mentions()
 
-    for note_id, labels in mentions.items():
-        implied_mentions = found_mentions.setdefault(note_id, set())
-        for label in labels:
-            implied_mentions |= _find_implied_labels(label, implied_label_mappings)
+    def __init__(
+        self,
+        grouped_label_mappings: defines.GroupedLabels,
+        vocabulary: Iterable[defines.Label] = (),
+    ):
+        self._mappings = grouped_label_mappings
+        self._groups: dict[defines.Label, tuple[defines.Label, bool]] = {}
+        for label in {*vocabulary, *grouped_label_mappings}:
+            self._lookup(label)
+
+    def convert(self, label: defines.Label) -> defines.Label:
+        """Returns the group label for the given label, or the label itself if not grouped"""
+        return self._lookup(label)[0]
+
+    def is_grouped(self, label: defines.Label) -> bool:
+        """Returns whether any group matches the label (even a group label can be grouped)"""
+        return self._lookup(label)[1]
 
-    return found_mentions
+    def _lookup(self, label: defines.Label) -> tuple[defines.Label, bool]:
+        if (entry := self._groups.get(label)) is None:
+            group = label
+            for group_label, group_matcher in self._mappings.items():
+                if group_matcher.is_match(group):
+                    group = group_label
+            grouped = any(matcher.is_match(label) for matcher in self._mappings.values())
+            entry = self._groups[label] = (group, grouped)
+        return entry
 
 
-def _convert_grouped_mentions(
-    mentions: defines.Mentions, grouped_label_mappings: defines.GroupedLabels
-) -> defines.Mentions:
+class MentionSimplifier:
     """
-    For every note, converts all labels in a group into one label for the group name.
+    Applies the project's implied labels, grouped labels, and ignored notes to mentions.
 
-    This is not recursive. (i.e. you can't have complicated grouping configs that combine)
+    This works one note at a time, so that mentions can be simplified as they are read in,
+    rather than building a fresh copy of every annotator's mentions for each step.
     """
-    final_mentions = defines.Mentions()
 
-    for note_id, labels in mentions.items():
-        for group_label, group_matcher in grouped_label_mappings.items():
-            if matched := group_matcher.matches_in_set(labels):
-                labels -= matched
-                labels.add(group_label)
-        final_mentions[note_id] = labels
+    def __init__(
+        self,
+        *,
+        implied_labels: defines.ImpliedLabels,
+        grouped_labels: defines.GroupedLabels,
+        ignored_notes: Iterable[int] = (),
+        vocabulary: Iterable[defines.Label] = (),
+    ):
+        """
+        :param implied_labels: the implied labels config
+        :param grouped_labels: the grouped labels config
+        :param ignored_notes: notes to drop entirely
+        :param vocabulary: the known project labels, to precompile the label tables for
+        """
+        vocabulary = set(vocabulary)
+        self.closure = ImpliedLabelClosure(implied_labels, vocabulary)
+        # Groups are applied after implied labels, so precompile for those too
+        self.groups = GroupedLabelMap(
+            grouped_labels, set().union(*(self.closure.expand(x) for x in vocabulary))
+        )
+        self.grouped_labels = grouped_labels
+        self.ignored_notes = frozenset(ignored_notes)
 
-    return final_mentions
+    def simplify_labels(self, labels: defines.LabelSet) -> defines.LabelSet:
+        """
+        Expands a note's implied labels, then converts all labels in a group into the group label.
 
+        Grouping is not recursive. (i.e. you can't have complicated grouping configs that combine)
+        """
+        return {
+            self.groups.convert(implied_label)
+            for label in labels
+            for implied_label in self.closure.expand(label)
+        }
 
-def simplify_mentions(
-    annotations: defines.ProjectAnnotations,
-    *,
-    implied_labels: defines.ImpliedLabels,
-    grouped_labels: defines.GroupedLabels,
-) -> None:
-    # ** Expand all implied labels.
-    annotations.mentions = {
-        annotator: _find_implied_mentions(mentions, implied_labels)
-        for annotator, mentions in annotations.mentions.items()
-    }
-
-    # ** Convert all grouped labels.
-    # First, calculate the new set of valid labels, adding the group and removing the groupees
-    annotations.labels |= set(grouped_labels.keys())
-    annotations.labels.difference_update(
-        *[m.matches_in_set(annotations.labels) for m in grouped_labels.values()]
-    )
-    # Next, convert old labels to the new group labels
-    annotations.mentions = {
-        annotator: _convert_grouped_mentions(mentions, grouped_labels)
-        for annotator, mentions in annotations.mentions.items()
-    }
+    def simplify_scores(
+        self, labels: defines.LabelSet, scores: dict[defines.Label, float]
+    ) -> dict[defines.Label, float]:
+        """
+        Carries the confidence scores of a note's labels over to their simplified labels.
+
+        A simplified label takes the highest score of the labels that produced it.
+        Unscored labels are positive at any threshold, so anything they produce is unscored too.
+        """
+        new_scores = {}
+        for label in labels:
+            score = scores.get(label, math.inf)
+            for implied_label in self.closure.expand(label):
+                new_label = self.groups.convert(implied_label)
+                new_scores[new_label] = max(score, new_scores.get(new_label, score))
+        return {label: score for label, score in new_scores.items() if score != math.inf}
+
+    def simplify_mentions(
+        self, mentions: defines.Mentions, scores: defines.Scores
+    ) -> tuple[defines.Mentions, defines.Scores]:
+        """Simplifies all of one annotator's mentions & scores, dropping any ignored notes"""
+        new_mentions = defines.Mentions()
+        new_scores = defines.Scores()
+        for note_id, labels in mentions.items():
+            if note_id in self.ignored_notes:
+                continue
+            new_mentions[note_id] = self.simplify_labels(labels)
+            if (note_scores := scores.get(note_id)) and (
+                note_scores := self.simplify_scores(labels, note_scores)
+            ):
+                new_scores[note_id] = note_scores
+        return new_mentions, new_scores
+
+    def simplify_project_labels(self, labels: defines.LabelSet) -> None:
+        """Updates the set of valid project labels in place, adding groups & removing groupees"""
+        labels |= set(self.grouped_labels)
+        # Any label that some group matches is removed, even if it is itself a group label
+        labels.difference_update([label for label in labels if self.groups.is_grouped(label)])
@@ -25,6 +25,12 @@ class Mention:
     text: str
     labels: defines.LabelSet
     from_name: str
+    score: float | None = None  # only models (i.e. predictions) tend to give scores
+    # Scores for specific labels, overriding the score above (like separately-scored sublabels)
+    label_scores: dict[defines.Label, float] = dataclasses.field(default_factory=dict)
+
+    def label_score(self, label: defines.Label) -> float | None:
+        return self.label_scores.get(label, self.score)
 
     @staticmethod
     def parse(entry: dict) -> "Mention":
@@ -57,7 +63,11 @@ class Mention:
         text = value.get("text", "") if field != "text" else ""
         labels = set(defines.Label(x) for x in value.get(field, []))
         return Mention(
-            id=entry.get("id", ""), text=text, labels=labels, from_name=entry.get("from_name", "")
+            id=entry.get("id", ""),
+            text=text,
+            labels=labels,
+            from_name=entry.get("from_name", ""),
+            score=entry.get("score"),
         )
 
 
@@ -74,71 +84,102 @@ class Annotation:
         if author is None:
             return None  # we don't know who annotated this!
 
-        # Labels can be nested - e.g. there might be a toplevel label "Illness" and a sublabel
-        # (maybe called "Illness Confirmed?") with a three-way choice of "confirmed", "suspected",
-        # and "none of the above".
-        # The way that would shows up as a mention in an export is a little odd (to my mind):
-        # {
-        #   "value": {
-        #     "text": "text from note",
-        #     "labels": ["Illness"]
-        #   },
-        #   "id": "HI1y_tlNwu",
-        #   "from_name": "label",
-        #   "to_name": "text",
-        #   "type": "labels",
-        # },
-        # {
-        #   "value": {
-        #     "text": "text from note",
-        #     "choices": ["confirmed"]
-        #   },
-        #   "id": "HI1y_tlNwu",
-        #   "from_name": "Illness Confirmed?",
-        #   "to_name": "text",
-        #   "type": "choices",
-        # },
-        #
-        # So you can see there that the "id" field is re-used, and the sublabel refers to the
-        # parent via "from_name".
-
-        # When parsing here, we'll first look for the toplevel entries (identifiable by a
-        # "from_name" pointing at a key in data_keys). Then do a second pass for any sublabels and
-        # adjust the parent with the extra info.
-        mentions: list[Mention] = []
-        toplevels: dict[str, Mention] = {}
-        sublabels: list[Mention] = []
-        for result in entry.get("result", []):
-            mention = Mention.parse(result)
-            if not mention.from_name or mention.from_name in data_keys:
-                # This is a toplevel mention
-                toplevels[mention.id] = mention
-                mentions.append(mention)
-            else:
-                # It's a sublabel, set it aside for a second
-                sublabels.append(mention)
+        return Annotation(author=author, mentions=_parse_results(entry, data_keys))
 
-        # Now match up the sublabels
-        base_sets: dict[str, defines.LabelSet] = {}
-        for sublabel in sublabels:
-            if sublabel.id not in toplevels:
-                raise ValueError(f"Unrecognized sublabel ID '{sublabel.id}'.")
-            toplevel = toplevels[sublabel.id]
 
-            # Wipe out any toplevel tags (existence of a sublabel implies no toplevel labels)
-            if toplevel.id not in base_sets:
-                base_sets[toplevel.id] = toplevel.labels
-                toplevel.labels = set()
+@dataclasses.dataclass(kw_only=True)
+class Prediction:
+    """All of a single model's mentions (i.e. pre-annotations from a machine learning model)"""
 
-            # Now merge in new labels (preserving other fields like `text` from toplevel entry)
-            base_labels = base_sets[toplevel.id]
-            for label in sublabel.labels:
-                for base_label in base_labels:
-                    toplevel.labels.add(
-                        defines.Label(base_label.label, sublabel.from_name, label.label)
-                    )
+    model_version: str
+    mentions: list[Mention] = dataclasses.field(default_factory=list)
 
-        return Annotation(author=author, mentions=mentions)
+    @staticmethod
+    def parse(entry: dict, data_keys: set[str]) -> "Prediction | None":
+        model_version = entry.get("model_version")
+        if not model_version:
+            return None  # we don't know which model made this!
+
+        # Predictions can have a score for the whole prediction, or for each individual result
+        mentions = _parse_results(entry, data_keys)
+        if (score := entry.get("score")) is not None:
+            for mention in mentions:
+                if mention.score is None:
+                    mention.score = score
+
+        return Prediction(model_version=str(model_version), mentions=mentions)
+
+
+def _parse_results(entry: dict, data_keys: set[str]) -> list[Mention]:
+    """Parses the results of an annotation or prediction into mentions"""
+    # Labels can be nested - e.g. there might be a toplevel label "Illness" and a sublabel
+    # (maybe called "Illness Confirmed?") with a three-way choice of "confirmed", "suspected",
+    # and "none of the above".
+    # The way that would shows up as a mention in an export is a little odd (to my mind):
+    # {
+    #   "value": {
+    #     "text": "text from note",
+    #     "labels": ["Illness"]
+    #   },
+    #   "id": "HI1y_tlNwu",
+    #   "from_name": "label",
+    #   "to_name": "text",
+    #   "type": "labels",
+    # },
+    # {
+    #   "value": {
+    #     "text": "text from note",
+    #     "choices": ["confirmed"]
+    #   },
+    #   "id": "HI1y_tlNwu",
+    #   "from_name": "Illness Confirmed?",
+    #   "to_name": "text",
+    #   "type": "choices",
+    # },
+    #
+    # So you can see there that the "id" field is re-used, and the sublabel refers to the
+    # parent via "from_name".
+
+    # When parsing here, we'll first look for the toplevel entries (identifiable by a
+    # "from_name" pointing at a key in data_keys). Then do a second pass for any sublabels and
+    # adjust the parent with the extra info.
+    mentions: list[Mention] = []
+    toplevels: dict[str, Mention] = {}
+    sublabels: list[Mention] = []
+    for result in entry.get("result", []):
+        mention = Mention.parse(result)
+        if not mention.from_name or mention.from_name in data_keys:
+            # This is a toplevel mention
+            toplevels[mention.id] = mention
+            mentions.append(mention)
+        else:
+            # It's a sublabel, set it aside for a second
+            sublabels.append(mention)
+
+    # Now match up the sublabels
+    base_sets: dict[str, defines.LabelSet] = {}
+    for sublabel in sublabels:
+        if sublabel.id not in toplevels:
+            raise ValueError(f"Unrecognized sublabel ID '{sublabel.id}'.")
+        toplevel = toplevels[sublabel.id]
+
+        # Wipe out any toplevel tags (existence of a sublabel implies no toplevel labels)
+        if toplevel.id not in base_sets:
+            base_sets[toplevel.id] = toplevel.labels
+            toplevel.labels = set()
+
+        # Now merge in new labels (preserving other fields like `text` from toplevel entry)
+        base_labels = base_sets[toplevel.id]
+        for label in sublabel.labels:
+            for base_label in base_labels:
+                new_label = defines.Label(base_label.label, sublabel.from_name, label.label)
+                toplevel.labels.add(new_label)
+                # A scored choice is more specific than any score on the toplevel span
+                if sublabel.score is not None:
+                    old_score = toplevel.label_scores.get(new_label, sublabel.score)
+                    toplevel.label_scores[new_label] = max(sublabel.score, old_score)
+
+    return mentions
 
 
 @dataclasses.dataclass(kw_only=True)
@@ -147,6 +188,7 @@ class Note:
 
     note_id: int
     annotations: list[Annotation] = dataclasses.field(default_factory=list)
+    predictions: list[Prediction] = dataclasses.field(default_factory=list)
 
     # metadata
     docref_mappings: dict[str, str] = dataclasses.field(default_factory=dict)
@@ -165,10 +207,15 @@ class Note:
             Annotation.parse(x, data_keys=data_keys) for x in entry.get("annotations", [])
         ]
         annotations = list(filter(None, annotations))  # parse() returns None if we should skip
+        predictions = [
+            Prediction.parse(x, data_keys=data_keys) for x in entry.get("predictions", [])
+        ]
+        predictions = list(filter(None, predictions))  # parse() returns None if we should skip
 
         return Note(
             note_id=entry["id"],
             annotations=annotations,
+            predictions=predictions,
             docref_mappings=docref_mappings,
             encounter_id=encounter_id,
             anon_encounter_id=anon_encounter_id,
@@ -238,6 +285,13 @@ class ExportFile:
             else:
                 old.annotations.append(new_annot)
                 continue
+        for new_pred in new.predictions:
+            for old_pred in old.predictions:
+                if old_pred.model_version == new_pred.model_version:
+                    old_pred.mentions.extend(new_pred.mentions)
+                    break
+            else:
+                old.predictions.append(new_pred)
 
     @property
     def notes(self) -> list[Note]:
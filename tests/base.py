@@ -3,8 +3,9 @@
 import contextlib
 import io
 import os
+import random
 import unittest
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence
 
 from chart_review import cli, defines
 
@@ -16,6 +17,33 @@ def labels(strs: Iterable[str]) -> defines.LabelSet:
     return {defines.Label.parse(x) for x in strs}
 
 
+def random_annotations(
+    annotators: Iterable[str],
+    all_labels: Sequence[defines.Label],
+    note_count: int,
+    *,
+    max_labels: int = 3,
+    note_chance: float = 1,
+    seed: int = 1234,
+) -> defines.ProjectAnnotations:
+    """
+    Makes reproducible random mentions, of up to max_labels labels per note.
+
+    Each annotator mentions each note with a probability of note_chance.
+    """
+    rand = random.Random(seed)
+    return defines.ProjectAnnotations(
+        mentions={
+            annotator: {
+                note_id: set(rand.sample(all_labels, rand.randint(0, max_labels)))
+                for note_id in range(note_count)
+                if note_chance >= 1 or rand.random() < note_chance
+            }
+            for annotator in annotators
+        },
+    )
+
+
 class TestCase(unittest.TestCase):
     """Test case parent class"""
 
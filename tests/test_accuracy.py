@@ -1,8 +1,14 @@
 """Tests for commands/accuracy.py"""
 
+import tempfile
+
+import ddt
+
+from chart_review import common
 from tests import base
 
 
+@ddt.ddt
 class TestAccuracy(base.TestCase):
     """Test case for the top-level accuracy code"""
 
@@ -24,6 +30,21 @@ F1     Sens  Spec   PPV  NPV   Kappa  TP  FN  TN  FP  Label
             stdout,
         )
 
+    def test_undefined_kappa(self):
+        """Verify that a label where every chart agrees on one class gets no kappa (not a crash)"""
+        stdout = self.run_cli("accuracy", "--csv", "jane", "john", path=f"{self.DATA_DIR}/cold")
+
+        self.assertEqual(
+            [
+                "f1,sens,spec,ppv,npv,kappa,tp,fn,tn,fp,label",
+                "0.889,0.8,1.0,1.0,0.5,0.571,4,1,1,0,*",
+                "1.0,1.0,1.0,1.0,1.0,1.0,1,0,1,0,Cough",
+                "1.0,1.0,,1.0,,,2,0,0,0,Fatigue",
+                "0.667,0.5,,1.0,0.0,0.0,1,1,0,0,Headache",
+            ],
+            stdout.splitlines(),
+        )
+
     def test_csv(self):
         stdout = self.run_cli("accuracy", "--csv", "jill", "jane", path=f"{self.DATA_DIR}/cold")
 
@@ -85,6 +106,216 @@ Annotator: jane
             stdout.splitlines(),
         )
 
+    def test_errors_only(self):
+        """Verify we can show just the cells where the annotators disagreed"""
+        output = self.run_cli(
+            "accuracy", "--errors-only", "jill", "jane", path=f"{self.DATA_DIR}/cold"
+        )
+        self.assertEqual(
+            """Comparing 3 charts (1, 3–4)
+Truth: jill
+Annotator: jane
+
+╭──────────┬──────────┬────────────────╮
+│ Chart ID │ Label    │ Classification │
+├──────────┼──────────┼────────────────┤
+│ 1        │ Headache │ FP             │
+├──────────┼──────────┼────────────────┤
+│ 4        │ Cough    │ FN             │
+│ 4        │ Headache │ FP             │
+╰──────────┴──────────┴────────────────╯
+""",
+            output,
+        )
+
+    def test_all_pairs(self):
+        output = self.run_cli("accuracy", "--all-pairs", path=f"{self.DATA_DIR}/cold")
+        self.assertEqual(
+            """Comparing all pairs of 3 annotators
+Rows are the truth annotator, columns are the compared annotator.
+
+╭──────┬───────┬───────┬───────╮
+│ F1   │ jane  │ jill  │ john  │
+├──────┼───────┼───────┼───────┤
+│ jane │       │ 0.667 │ 0.889 │
+│ jill │ 0.667 │       │ 0.6   │
+│ john │ 0.889 │ 0.6   │       │
+╰──────┴───────┴───────┴───────╯
+
+╭───────┬───────┬───────┬───────╮
+│ Kappa │ jane  │ jill  │ john  │
+├───────┼───────┼───────┼───────┤
+│ jane  │       │ 0.341 │ 0.571 │
+│ jill  │ 0.341 │       │ 0.1   │
+│ john  │ 0.571 │ 0.1   │       │
+╰───────┴───────┴───────┴───────╯
+""",
+            output,
+        )
+
+    @ddt.data(None, 2)
+    def test_all_pairs_csv(self, workers):
+        """Verify that each pair's detail matches what we'd get comparing just that pair"""
+        path = f"{self.DATA_DIR}/sublabels"
+        workers_args = [f"--workers={workers}"] if workers else []
+        output = self.run_cli("accuracy", "--all-pairs", "--csv", *workers_args, path=path)
+        lines = output.splitlines()
+        self.assertEqual("truth,annotator,f1,sens,spec,ppv,npv,kappa,tp,fn,tn,fp,label", lines[0])
+
+        pairs = [("alice", "bob"), ("alice", "carla"), ("bob", "alice"), ("bob", "carla")]
+        pairs += [("carla", "alice"), ("carla", "bob")]
+        expected = []
+        for truth, annotator in pairs:
+            pair_lines = self.run_cli("accuracy", "--csv", truth, annotator, path=path)
+            expected += [f"{truth},{annotator},{line}" for line in pair_lines.splitlines()[1:]]
+        self.assertEqual(expected, lines[1:])
+
+    def test_all_pairs_bad_args(self):
+        path = f"{self.DATA_DIR}/cold"
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("accuracy", "--all-pairs", "jill", path=path)
+        self.assertEqual(
+            "Don’t specify any annotators when using --all-pairs.\n", stderr.getvalue()
+        )
+
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("accuracy", "--all-pairs", "--rollup=any", path=path)
+        self.assertEqual(
+            "Only --rollup=sum is supported when using --all-pairs.\n", stderr.getvalue()
+        )
+
+        for mode in ("--verbose", "--errors-only", "--sweep"):
+            with self.capture_stderr() as stderr:
+                with self.assertRaises(SystemExit):
+                    self.run_cli("accuracy", mode, "--rollup=any", "jill", "jane", path=path)
+            self.assertEqual(
+                "--rollup only applies to the default accuracy table.\n", stderr.getvalue()
+            )
+
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("accuracy", "jill", path=path)
+        self.assertEqual(
+            "Please specify a truth annotator and an annotator to compare.\n", stderr.getvalue()
+        )
+
+    def test_bootstrap(self):
+        output = self.run_cli(
+            "accuracy", "--bootstrap=200", "--seed=3", "jill", "jane", path=f"{self.DATA_DIR}/cold"
+        )
+
+        self.assertEqual(
+            """Comparing 3 charts (1, 3–4)
+Truth: jill
+Annotator: jane
+Macro F1: 0.833
+
+F1     Sens  Spec   PPV  NPV   Kappa  TP  FN  TN  FP  Label   
+0.667  0.75  0.6    0.6  0.75  0.341  3   1   3   2   *       
+0.667  0.5   1.0    1.0  0.5   0.4    1   1   1   0   Cough   
+1.0    1.0   1.0    1.0  1.0   1.0    2   0   1   0   Fatigue 
+-      -     0.333  0.0  1.0   0.0    0   0   1   2   Headache
+
+95% confidence intervals (from 200 bootstrap resamples):
+F1       Sens     PPV        Kappa       Label   
+0.5–0.8  0.5–1.0  0.5–0.667  -0.5–0.727  *       
+0.5–1.0  0.0–1.0  1.0–1.0    0.0–1.0     Cough   
+1.0–1.0  1.0–1.0  1.0–1.0    1.0–1.0     Fatigue 
+-        -        0.0–0.0    0.0–0.0     Headache
+""",
+            output,
+        )
+
+    @ddt.data(None, 2)
+    def test_bootstrap_csv(self, workers):
+        """Verify that seeded intervals are reproducible, regardless of worker count"""
+        workers_args = [f"--workers={workers}"] if workers else []
+        output = self.run_cli(
+            "accuracy",
+            "--csv",
+            "--bootstrap=500",
+            "--seed=3",
+            *workers_args,
+            "jill",
+            "jane",
+            path=f"{self.DATA_DIR}/cold",
+        )
+
+        self.assertEqual(
+            [
+                "f1,sens,spec,ppv,npv,kappa,tp,fn,tn,fp,f1_ci_low,f1_ci_high,sens_ci_low,"
+                "sens_ci_high,ppv_ci_low,ppv_ci_high,kappa_ci_low,kappa_ci_high,label",
+                "0.667,0.75,0.6,0.6,0.75,0.341,3,1,3,2,0.5,0.8,0.5,1.0,0.5,0.667,-0.5,0.727,*",
+                "0.667,0.5,1.0,1.0,0.5,0.4,1,1,1,0,0.5,1.0,0.0,1.0,1.0,1.0,0.0,1.0,Cough",
+                "1.0,1.0,1.0,1.0,1.0,1.0,2,0,1,0,1.0,1.0,1.0,1.0,1.0,1.0,1.0,1.0,Fatigue",
+                ",,0.333,0.0,1.0,0.0,0,0,1,2,,,,,0.0,0.0,0.0,0.0,Headache",
+            ],
+            output.splitlines(),
+        )
+
+    def test_closed_form_intervals(self):
+        output = self.run_cli("accuracy", "--ci", "jill", "jane", path=f"{self.DATA_DIR}/cold")
+        self.assertEqual(
+            """95% confidence intervals (Wilson score, or asymptotic for Kappa):
+Sens         Spec         PPV          NPV          Kappa         Label   
+0.301–0.954  0.231–0.882  0.231–0.882  0.301–0.954  -0.254–0.937  *       
+0.095–0.905  0.207–1.0    0.207–1.0    0.095–0.905  -0.368–1.0    Cough   
+0.342–1.0    0.207–1.0    0.342–1.0    0.207–1.0    1.0–1.0       Fatigue 
+-            0.061–0.792  0.0–0.658    0.207–1.0    0.0–0.0       Headache
+""",
+            output.split("\n\n")[-1],
+        )
+
+    def test_closed_form_intervals_csv(self):
+        output = self.run_cli(
+            "accuracy", "--ci", "--csv", "jill", "jane", path=f"{self.DATA_DIR}/cold"
+        )
+        self.assertEqual(
+            [
+                "f1,sens,spec,ppv,npv,kappa,tp,fn,tn,fp,sens_ci_low,sens_ci_high,spec_ci_low,"
+                "spec_ci_high,ppv_ci_low,ppv_ci_high,npv_ci_low,npv_ci_high,kappa_ci_low,"
+                "kappa_ci_high,label",
+                "0.667,0.75,0.6,0.6,0.75,0.341,3,1,3,2,"
+                "0.301,0.954,0.231,0.882,0.231,0.882,0.301,0.954,-0.254,0.937,*",
+                "0.667,0.5,1.0,1.0,0.5,0.4,1,1,1,0,"
+                "0.095,0.905,0.207,1.0,0.207,1.0,0.095,0.905,-0.368,1.0,Cough",
+                "1.0,1.0,1.0,1.0,1.0,1.0,2,0,1,0,"
+                "0.342,1.0,0.207,1.0,0.342,1.0,0.207,1.0,1.0,1.0,Fatigue",
+                ",,0.333,0.0,1.0,0.0,0,0,1,2,,,0.061,0.792,0.0,0.658,0.207,1.0,0.0,0.0,Headache",
+            ],
+            output.splitlines(),
+        )
+
+    def test_bootstrap_bad_args(self):
+        path = f"{self.DATA_DIR}/cold"
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("accuracy", "--bootstrap=10", "--verbose", "jill", "jane", path=path)
+        self.assertEqual(
+            "Confidence intervals can only be added to the default accuracy table.\n",
+            stderr.getvalue(),
+        )
+
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("accuracy", "--bootstrap=0", "jill", "jane", path=path)
+        self.assertEqual("--bootstrap needs at least one resample.\n", stderr.getvalue())
+
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("accuracy", "--seed=3", "jill", "jane", path=path)
+        self.assertEqual("--seed only applies to --bootstrap.\n", stderr.getvalue())
+
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("accuracy", "--ci", "--all-pairs", path=path)
+        self.assertEqual(
+            "Confidence intervals can only be added to the default accuracy table.\n",
+            stderr.getvalue(),
+        )
+
     def test_bad_truth(self):
         """Verify that we do something suitable for bad arguments"""
         # Truth
@@ -133,3 +364,113 @@ F1   Sens  Spec   PPV  NPV    Kappa   TP  FN  TN  FP  Label
 1.0  1.0   1.0    1.0  1.0    1.0     1   0   1   0   Infection → Suspected     
 """,
         )
+
+    def test_sublabels_rollup_any(self):
+        """Verify that wildcard rows can count a chart once, if any sublabel value is positive"""
+        output = self.run_cli(
+            "accuracy", "--csv", "--rollup=any", "alice", "bob", path=f"{self.DATA_DIR}/sublabels"
+        )
+        self.assertEqual(
+            [
+                "f1,sens,spec,ppv,npv,kappa,tp,fn,tn,fp,label",
+                "0.6,0.6,0.778,0.6,0.778,0.378,3,2,7,2,*",
+                ",0.0,1.0,,0.5,0.0,0,1,1,0,Deceased",
+                "1.0,1.0,1.0,1.0,1.0,1.0,1,0,1,0,Deceased → *",
+                "1.0,1.0,1.0,1.0,1.0,1.0,1,0,1,0,Deceased → False",
+                # Both annotators picked some datetime for the same chart, so that's a match
+                "1.0,1.0,1.0,1.0,1.0,1.0,1,0,1,0,Deceased → Datetime → *",
+                ",0.0,1.0,,0.5,0.0,0,1,1,0,Deceased → Datetime → 11/12/25",
+                ",,0.5,0.0,1.0,0.0,0,0,1,1,Deceased → Datetime → 11/13/25",
+                "1.0,1.0,1.0,1.0,1.0,1.0,1,0,1,0,Fungal → *",
+                "1.0,1.0,1.0,1.0,1.0,1.0,1,0,1,0,Fungal → Confirmed",
+                ",,0.5,0.0,1.0,0.0,0,0,1,1,Infection",
+                "1.0,1.0,1.0,1.0,1.0,1.0,1,0,1,0,Infection → *",
+                ",,,,,,0,0,0,0,Infection → Confirmed",
+                "1.0,1.0,1.0,1.0,1.0,1.0,1,0,1,0,Infection → Suspected",
+            ],
+            output.splitlines(),
+        )
+
+    @staticmethod
+    def make_scored_project(tmpdir: str) -> None:
+        common.write_json(
+            f"{tmpdir}/config.json", {"annotators": {"human": 1, "nlp": {"filename": "nlp.csv"}}}
+        )
+        truth = {1: ["Cough"], 2: ["Cough", "Fever"], 3: [], 4: ["Fever"]}
+        common.write_json(
+            f"{tmpdir}/labelstudio-export.json",
+            [
+                {
+                    "id": note_id,
+                    "data": {
+                        "enc_id": f"enc{note_id}",
+                        "docref_mappings": {f"doc{note_id}": "anon"},
+                    },
+                    "annotations": [
+                        {
+                            "completed_by": 1,
+                            "result": [{"value": {"labels": [label]}} for label in labels],
+                        }
+                    ],
+                }
+                for note_id, labels in truth.items()
+            ],
+        )
+        common.write_text(
+            f"{tmpdir}/nlp.csv",
+            "encounter_id,label,score\n"
+            "enc1,Cough,0.9\n"
+            "enc2,Cough,0.4\n"
+            "enc3,Cough,0.6\n"
+            "enc4,,\n"
+            "enc1,Fever,0.2\n"
+            "enc2,Fever,0.8\n"
+            "enc3,Fever,\n"
+            "enc4,Fever,0.8\n",
+        )
+
+    def test_sweep(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.make_scored_project(tmpdir)
+            stdout = self.run_cli("accuracy", "--sweep", "human", "nlp", path=tmpdir)
+
+        self.assertEqual(
+            """Comparing 4 charts (1–4)
+Truth: human
+Annotator: nlp
+
+Threshold  F1     Sens  Spec  PPV    NPV    Kappa  TP  FN  TN  FP  Label
+0.4*       0.8    1.0   0.5   0.667  1.0    0.5    2   0   1   1   Cough
+0.6        0.5    0.5   0.5   0.5    0.5    0.0    1   1   1   1   Cough
+0.9        0.667  0.5   1.0   1.0    0.667  0.5    1   1   2   0   Cough
+0.2        0.667  1.0   0.0   0.5    -      0.0    2   0   0   2   Fever
+0.8*       0.8    1.0   0.5   0.667  1.0    0.5    2   0   1   1   Fever
+  * Best F1 threshold for this label.
+""",
+            stdout,
+        )
+
+    def test_sweep_csv(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.make_scored_project(tmpdir)
+            stdout = self.run_cli("accuracy", "--sweep", "--csv", "human", "nlp", path=tmpdir)
+
+        self.assertEqual(
+            [
+                "threshold,f1,sens,spec,ppv,npv,kappa,tp,fn,tn,fp,label",
+                "0.4,0.8,1.0,0.5,0.667,1.0,0.5,2,0,1,1,Cough",
+                "0.6,0.5,0.5,0.5,0.5,0.5,0.0,1,1,1,1,Cough",
+                "0.9,0.667,0.5,1.0,1.0,0.667,0.5,1,1,2,0,Cough",
+                "0.2,0.667,1.0,0.0,0.5,,0.0,2,0,0,2,Fever",
+                "0.8,0.8,1.0,0.5,0.667,1.0,0.5,2,0,1,1,Fever",
+            ],
+            stdout.splitlines(),
+        )
+
+    def test_sweep_without_scores(self):
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("accuracy", "--sweep", "jill", "jane", path=f"{self.DATA_DIR}/cold")
+        self.assertEqual(
+            "Annotator 'jane' does not have any confidence scores.\n", stderr.getvalue()
+        )
@@ -1,6 +1,9 @@
 """Tests for agree.py"""
 
+import math
+
 import ddt
+import numpy as np
 
 from chart_review import agree, defines
 from tests import base
@@ -60,6 +63,45 @@ class TestAgreement(base.TestCase):
         matrix = agree.confusion_matrix(annotations, truth, annotator, notes, labels=labels)
         self.assertEqual(expected_matrix, matrix)
 
+        # Confirm the counts-only version agrees and scores the same
+        counts = agree.confusion_counts(annotations, truth, annotator, notes, labels=labels)
+        self.assertEqual(
+            agree.ConfusionCounts(
+                true_pos=len(expected_matrix["TP"]),
+                false_neg=len(expected_matrix["FN"]),
+                true_neg=len(expected_matrix["TN"]),
+                false_pos=len(expected_matrix["FP"]),
+            ),
+            counts,
+        )
+        self.assertEqual(str(agree.score_matrix(matrix)), str(agree.score_matrix(counts)))
+
+        # And that the per-label counts add up to the same thing
+        by_label = agree.confusion_counts_by_label(
+            annotations, truth, annotator, notes, labels=labels
+        )
+        self.assertEqual(counts, sum(by_label.values(), agree.ConfusionCounts()))
+
+    def test_confusion_counts_by_label(self):
+        """Verify that we count each label separately, including unused labels."""
+        annotations = defines.ProjectAnnotations(
+            mentions={
+                "alice": {1: base.labels({"Cough"}), 2: base.labels({"Fever"})},
+                "bob": {1: base.labels({"Headache"}), 2: base.labels({"Cough", "Fever"})},
+            },
+        )
+        by_label = agree.confusion_counts_by_label(
+            annotations, "alice", "bob", [1, 2], labels=base.labels({"Cough", "Fever", "Nausea"})
+        )
+        self.assertEqual(
+            {
+                base.Label("Cough"): agree.ConfusionCounts(false_neg=1, false_pos=1),
+                base.Label("Fever"): agree.ConfusionCounts(true_pos=1, true_neg=1),
+                base.Label("Nausea"): agree.ConfusionCounts(),
+            },
+            by_label,
+        )
+
     @ddt.data(
         # Examples pulled from https://en.wikipedia.org/wiki/Cohen's_kappa#Examples
         (
@@ -105,3 +147,121 @@ class TestAgreement(base.TestCase):
         """Verify that we can score a matrix for kappa."""
         kappa = round(agree.score_kappa(matrix), 4)
         self.assertEqual(expected_kappa, kappa)
+
+    @ddt.data(
+        agree.ConfusionCounts(true_pos=2),
+        agree.ConfusionCounts(true_neg=3),
+    )
+    def test_kappa_undefined(self, counts):
+        """Verify that kappa is undefined (not a crash) when every cell agrees on one class"""
+        self.assertTrue(math.isnan(agree.score_kappa(counts)))
+
+    def test_sparse_counts_match_full_tables(self):
+        """Verify that counting only positive cells gives the same answer as visiting every cell."""
+        all_labels = [base.Label(f"L{i}") for i in range(10)]
+        # Leave some notes out entirely
+        annotations = base.random_annotations(
+            ("alice", "bob", "carla"), all_labels, 50, note_chance=0.8
+        )
+        notes = set(range(60))
+        labels = set(all_labels[:8])
+
+        matrix = agree.confusion_matrix(annotations, "alice", "bob", notes, labels=labels)
+        self.assertEqual(
+            agree.ConfusionCounts(
+                true_pos=len(matrix["TP"]),
+                false_neg=len(matrix["FN"]),
+                true_neg=len(matrix["TN"]),
+                false_pos=len(matrix["FP"]),
+            ),
+            agree.confusion_counts(annotations, "alice", "bob", notes, labels=labels),
+        )
+
+        table = agree.contingency_table(annotations, "alice", "bob", "carla", notes, labels=labels)
+        self.assertEqual(
+            agree.ContingencyCounts(
+                both_correct=len(table["BC"]),
+                only_left=len(table["OL"]),
+                only_right=len(table["OR"]),
+                both_wrong=len(table["BW"]),
+            ),
+            agree.contingency_counts(annotations, "alice", "bob", "carla", notes, labels=labels),
+        )
+
+        by_label = agree.contingency_counts_by_label(
+            annotations, "alice", "bob", "carla", notes, labels=labels
+        )
+        self.assertEqual(labels, set(by_label))
+        for label in labels:
+            table = agree.contingency_table(
+                annotations, "alice", "bob", "carla", notes, labels={label}
+            )
+            self.assertEqual(
+                agree.ContingencyCounts(
+                    both_correct=len(table["BC"]),
+                    only_left=len(table["OL"]),
+                    only_right=len(table["OR"]),
+                    both_wrong=len(table["BW"]),
+                ),
+                by_label[label],
+            )
+
+    def test_score_arrays_match_score_counts(self):
+        """Verify that vectorized scoring gives the same answers as scoring one matrix at a time"""
+        all_counts = [
+            agree.ConfusionCounts(true_pos=3, false_neg=1, true_neg=3, false_pos=2),
+            agree.ConfusionCounts(true_pos=2, true_neg=1),
+            agree.ConfusionCounts(true_neg=1, false_pos=2),  # no positives, so NaN F1
+            agree.ConfusionCounts(true_pos=4),  # perfect agreement, so NaN kappa
+        ]
+        arrays = agree.score_arrays(
+            **{
+                field: np.array([getattr(counts, field) for counts in all_counts])
+                for field in ("true_pos", "false_neg", "true_neg", "false_pos")
+            }
+        )
+
+        for index, counts in enumerate(all_counts):
+            expected = agree.score_matrix(counts)
+            for metric, values in arrays.items():
+                if math.isnan(expected[metric]):
+                    self.assertTrue(math.isnan(values[index]), metric)
+                else:
+                    self.assertAlmostEqual(expected[metric], values[index], places=3, msg=metric)
+
+    def test_interval_arrays(self):
+        """Verify closed-form intervals against some hand-checked values"""
+        intervals = agree.interval_arrays(
+            true_pos=np.array([3, 0]),
+            false_neg=np.array([1, 0]),
+            true_neg=np.array([3, 1]),
+            false_pos=np.array([2, 2]),
+        )
+        self.assertEqual(list(agree.INTERVAL_METRICS), list(intervals))
+
+        # Wilson score interval for 3/4
+        low, high = intervals["Sens"]
+        self.assertAlmostEqual(0.3006, low[0], places=4)
+        self.assertAlmostEqual(0.9544, high[0], places=4)
+        self.assertTrue(math.isnan(low[1]))  # no positives, so no sensitivity
+
+        # Wilson score interval for 0/2 starts at zero
+        low, high = intervals["PPV"]
+        self.assertAlmostEqual(0, low[1])
+        self.assertAlmostEqual(0.6576, high[1], places=4)
+
+        # Kappa of 0.341, with a standard error of 0.304
+        low, high = intervals["Kappa"]
+        self.assertAlmostEqual(0.3415 - agree.Z_95 * 0.304, low[0], places=3)
+        self.assertAlmostEqual(0.3415 + agree.Z_95 * 0.304, high[0], places=3)
+
+    def test_kappa_interval_clipped(self):
+        """Verify that small, disagreeable samples don't give kappa intervals outside [-1, 1]"""
+        low, high = agree.interval_arrays(
+            true_pos=np.array([0]),
+            false_neg=np.array([1]),
+            true_neg=np.array([0]),
+            false_pos=np.array([1]),
+        )["Kappa"]
+        self.assertGreaterEqual(low[0], -1)
+        self.assertLessEqual(high[0], 1)
@@ -0,0 +1,64 @@
+"""Tests for bootstrap.py"""
+
+import math
+
+import numpy as np
+
+from chart_review import bootstrap, encoding
+from tests import base
+
+
+class TestBootstrap(base.TestCase):
+    """Test case for bootstrap confidence intervals"""
+
+    def setUp(self):
+        super().setUp()
+        all_labels = [base.Label(f"L{i}") for i in range(5)]
+        self.annotations = base.random_annotations(("alice", "bob"), all_labels, 40, max_labels=2)
+        self.labels = set(all_labels)
+
+    def chart_cells(self, note_range=None) -> encoding.ChartCells:
+        note_range = set(range(40)) if note_range is None else note_range
+        encoded = encoding.MentionEncoding(self.annotations, self.labels)
+        return encoded.chart_cells("alice", "bob", note_range)
+
+    def assert_intervals_equal(self, expected: dict, actual: dict) -> None:
+        self.assertEqual(set(expected), set(actual))
+        for metric in expected:
+            for expected_bound, actual_bound in zip(expected[metric], actual[metric]):
+                np.testing.assert_array_equal(expected_bound, actual_bound, err_msg=metric)
+
+    def test_seeded(self):
+        """Verify that a seed gives reproducible intervals, no matter how many workers we use"""
+        cells = self.chart_cells()
+        intervals = bootstrap.confidence_intervals(cells, 250, seed=5)
+        self.assertEqual(set(bootstrap.METRICS), set(intervals))
+
+        self.assert_intervals_equal(
+            intervals, bootstrap.confidence_intervals(cells, 250, seed=5, workers=2)
+        )
+
+        other_seed = bootstrap.confidence_intervals(cells, 250, seed=6)
+        self.assertFalse(np.array_equal(intervals["F1"][0], other_seed["F1"][0]))
+
+    def test_bounds_surround_estimate(self):
+        """Verify that intervals are ordered and hold the full-cohort score"""
+        cells = self.chart_cells()
+        intervals = bootstrap.confidence_intervals(cells, 500, seed=5)
+
+        # Overall column, F1 is 2TP / (2TP + FN + FP)
+        true_pos = cells.true_pos[:, 0].sum()
+        errors = cells.false_neg[:, 0].sum() + cells.false_pos[:, 0].sum()
+        f1 = 2 * true_pos / (2 * true_pos + errors)
+        low, high = intervals["F1"]
+        valid = ~np.isnan(low)  # some labels might never have a positive, and thus no F1
+        self.assertTrue(np.all(low[valid] <= high[valid]))
+        self.assertLessEqual(low[0], f1)
+        self.assertGreaterEqual(high[0], f1)
+
+    def test_no_charts(self):
+        """Verify that an empty cohort just gives NaN bounds"""
+        intervals = bootstrap.confidence_intervals(self.chart_cells(set()), 10, seed=5)
+        low, high = intervals["Kappa"]
+        self.assertTrue(all(math.isnan(x) for x in low))
+        self.assertTrue(all(math.isnan(x) for x in high))
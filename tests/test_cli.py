@@ -60,6 +60,10 @@ Pass --help to see more options.
             stdout,
         )
 
+    def test_workers(self):
+        stdout = self.run_cli("--workers=2", path=f"{self.DATA_DIR}/cold")
+        self.assert_cold_output(stdout)
+
     def test_custom_config(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             shutil.copy(f"{self.DATA_DIR}/cold/labelstudio-export.json", tmpdir)
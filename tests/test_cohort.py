@@ -1,8 +1,9 @@
 """Tests for cohort.py"""
 
 import tempfile
+from unittest import mock
 
-from chart_review import cohort, common, config
+from chart_review import agree, cohort, common, config, defines, simplify
 from tests import base
 
 
@@ -214,3 +215,199 @@ class TestCohort(base.TestCase):
             )
             reader = cohort.CohortReader(config.ProjectConfig(tmpdir))
             self.assertEqual(reader.class_labels, base.labels({"A|B|C", "D|X|Y", "E|F|Z"}))
+
+    def test_predictions(self):
+        """Verify that model predictions can be used as annotators"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json",
+                {
+                    "annotators": {
+                        "bob": 1,
+                        "model": {"model_version": "v2"},
+                        "unused": {"model_version": "v3"},
+                    },
+                },
+            )
+            common.write_json(
+                f"{tmpdir}/labelstudio-export.json",
+                [
+                    {
+                        "id": 1,
+                        "annotations": [
+                            {"completed_by": 1, "result": [{"value": {"labels": ["cat"]}}]},
+                        ],
+                        "predictions": [
+                            {
+                                "model_version": "v1",  # not in config, so ignored
+                                "result": [{"value": {"labels": ["bird"]}}],
+                            },
+                            {
+                                "model_version": "v2",
+                                "score": 0.5,
+                                "result": [
+                                    {"value": {"text": "meow", "labels": ["cat"]}},
+                                    {"value": {"labels": ["dog"]}, "score": 0.75},
+                                ],
+                            },
+                            {"result": [{"value": {"labels": ["fish"]}}]},  # no model version
+                        ],
+                    },
+                    {
+                        "id": 2,
+                        "annotations": [{"completed_by": 1, "result": []}],
+                        "predictions": [
+                            {"model_version": "v2", "result": [{"value": {"labels": ["cat"]}}]},
+                        ],
+                    },
+                ],
+            )
+            reader = cohort.CohortReader(config.ProjectConfig(tmpdir))
+
+        self.assertEqual(
+            {
+                "bob": {1: base.labels({"cat"}), 2: set()},
+                "model": {1: base.labels({"cat", "dog"}), 2: base.labels({"cat"})},
+                "unused": {},
+            },
+            reader.annotations.mentions,
+        )
+        self.assertEqual(
+            {"model": {1: {base.Label("cat"): 0.5, base.Label("dog"): 0.75}}},
+            reader.annotations.scores,
+        )
+        self.assertEqual("meow", reader.annotations.original_text_mentions["model"][1][0].text)
+        self.assertEqual({"bob": {1, 2}, "model": {1, 2}, "unused": set()}, reader.note_range)
+
+    def test_scored_choices(self):
+        """Verify that scores on sublabel choices reach their labels"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json", {"annotators": {"model": {"model_version": "v1"}}}
+            )
+            span = {"id": "span1", "from_name": "label", "type": "labels"}
+            common.write_json(
+                f"{tmpdir}/labelstudio-export.json",
+                [
+                    {
+                        "id": 1,
+                        "data": {"text": "patient has a bad infection", "label": []},
+                        "predictions": [
+                            {
+                                "model_version": "v1",
+                                "score": 0.1,
+                                "result": [
+                                    {**span, "value": {"labels": ["Infection"]}, "score": 0.5},
+                                    {
+                                        **span,
+                                        "from_name": "Severity",
+                                        "type": "choices",
+                                        "value": {"choices": ["High"]},
+                                        "score": 0.9,
+                                    },
+                                    {
+                                        **span,
+                                        "from_name": "Onset",
+                                        "type": "choices",
+                                        "value": {"choices": ["Sudden"]},
+                                    },
+                                ],
+                            },
+                        ],
+                    },
+                ],
+            )
+            reader = cohort.CohortReader(config.ProjectConfig(tmpdir))
+
+        self.assertEqual(
+            {
+                "model": {
+                    1: {
+                        # The scored choice gets its own score
+                        base.Label("Infection", "Severity", "High"): 0.9,
+                        # The unscored choice falls back to the span's score
+                        base.Label("Infection", "Onset", "Sudden"): 0.5,
+                    }
+                }
+            },
+            reader.annotations.scores,
+        )
+
+    def test_confusion_matrix_label_pick(self):
+        """Verify that a confusion matrix can be limited to one label or to a label wildcard"""
+        reader = cohort.CohortReader(config.ProjectConfig(f"{self.DATA_DIR}/sublabels"))
+        notes = reader.note_range["alice"]
+        infection = defines.LabelMatcher("Infection|*")
+        picks = {
+            None: reader.class_labels,
+            base.Label("Fungal", "Fungal", "Confirmed"): base.labels({"Fungal|Fungal|Confirmed"}),
+            infection: infection.matches_in_set(reader.class_labels),
+        }
+        for pick, labels in picks.items():
+            with self.subTest(pick=pick):
+                self.assertEqual(
+                    agree.confusion_matrix(
+                        reader.annotations, "alice", "bob", notes, labels=labels
+                    ),
+                    reader.confusion_matrix("alice", "bob", notes, pick),
+                )
+
+    def test_simplifier_vocabulary(self):
+        """Verify that the project labels are precompiled into the simplifier's tables"""
+        proj_config = config.ProjectConfig(f"{self.DATA_DIR}/cold")
+        with mock.patch(
+            "chart_review.simplify.MentionSimplifier", wraps=simplify.MentionSimplifier
+        ) as mock_simplifier:
+            cohort.CohortReader(proj_config)
+        self.assertEqual(
+            base.labels({"Cough", "Fatigue", "Headache"}),
+            mock_simplifier.call_args.kwargs["vocabulary"],
+        )
+
+    def test_simplified_while_reading(self):
+        """Verify that ignored, implied, and grouped labels are all handled as we read mentions"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json",
+                {
+                    "annotators": {"bob": 1, "ext": {"filename": "ext.csv"}},
+                    "implied-labels": {"kitten": "cat"},
+                    "grouped-labels": {"pet": ["cat", "dog"]},
+                    "ignore": [2],
+                },
+            )
+            common.write_json(
+                f"{tmpdir}/labelstudio-export.json",
+                [
+                    {
+                        "id": 1,
+                        "annotations": [
+                            {"completed_by": 1, "result": [{"value": {"labels": ["kitten"]}}]},
+                        ],
+                        "data": {"enc_id": "a", "docref_mappings": {"x": "y"}},
+                    },
+                    {
+                        "id": 2,
+                        "annotations": [
+                            {"completed_by": 1, "result": [{"value": {"labels": ["fish"]}}]},
+                        ],
+                        "data": {"enc_id": "b", "docref_mappings": {"z": "w"}},
+                    },
+                ],
+            )
+            common.write_text(f"{tmpdir}/ext.csv", "encounter_id,label,score\na,dog,0.5\nb,dog,1")
+
+            reader = cohort.CohortReader(config.ProjectConfig(tmpdir))
+
+        self.assertEqual(
+            {
+                "bob": {1: base.labels({"kitten", "pet"})},
+                "ext": {1: base.labels({"pet"})},
+            },
+            reader.annotations.mentions,
+        )
+        self.assertEqual({"ext": {1: {base.Label("pet"): 0.5}}}, reader.annotations.scores)
+        # Labels from ignored notes still count as project labels
+        self.assertEqual(base.labels({"kitten", "pet", "fish"}), reader.class_labels)
+        self.assertEqual({"bob": {1}, "ext": {1}}, reader.note_range)
+        self.assertEqual({2}, reader.ignored_notes)
@@ -120,6 +120,26 @@ class TestProjectConfig(base.TestCase):
             proj_config.implied_labels,
         )
 
+    def test_implied_cycle(self):
+        """Verify that we catch implied label loops when loading, even for unused labels."""
+        with self.assertRaisesRegex(ValueError, "^Implied labels form a cycle: B → C → D → B$"):
+            self.make_config(
+                """
+                implied-labels:
+                    A: B
+                    B: C
+                    C: [D, E]
+                    D|*: B
+                    E: F
+                """
+            )
+
+        # A label implying itself is fine, though
+        proj_config = self.make_config("implied-labels: {A: [A, B]}")
+        self.assertEqual(
+            {base.LabelMatcher("A"): base.labels({"A", "B"})}, proj_config.implied_labels
+        )
+
     def test_incomplete_label(self):
         with self.assertRaisesRegex(ValueError, "Sublabel name but no sublabel value provided"):
             proj_config = self.make_config("labels: [A|B]")
@@ -0,0 +1,132 @@
+"""Tests for consensus.py"""
+
+import shutil
+import tempfile
+
+import ddt
+
+from chart_review import cohort, common, config
+from tests import base
+
+
+@ddt.ddt
+class TestConsensus(base.TestCase):
+    """Test case for consensus (voting) annotators"""
+
+    def read_cold(self, annotators: dict, ranges: dict | None = None) -> cohort.CohortReader:
+        """Reads the cold project, with some extra annotators added to its config"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shutil.copy(f"{self.DATA_DIR}/cold/labelstudio-export.json", tmpdir)
+            common.write_json(
+                f"{tmpdir}/config.json",
+                {
+                    "labels": ["Cough", "Fatigue", "Headache"],
+                    "annotators": {"jane": 3, "john": 5, "jill": 6, **annotators},
+                    "ranges": {"jane": [1, 3, 4], **(ranges or {})},
+                },
+            )
+            return cohort.CohortReader(config.ProjectConfig(tmpdir))
+
+    @ddt.data(
+        # Only charts 1 & 4 were reviewed by everyone
+        ("majority", {1: {"Cough", "Fatigue"}, 4: {"Fatigue", "Headache"}}),
+        ("unanimous", {1: {"Cough", "Fatigue"}, 4: {"Fatigue"}}),
+        (2, {1: {"Cough", "Fatigue"}, 4: {"Fatigue", "Headache"}}),
+        (
+            1,
+            {
+                1: {"Cough", "Fatigue", "Headache", "Label Not In Study"},
+                4: {"Cough", "Fatigue", "Headache"},
+            },
+        ),
+    )
+    @ddt.unpack
+    def test_votes(self, vote, expected):
+        reader = self.read_cold(
+            {"humans": {"consensus": ["jane", "john", "jill"], "vote": vote}},
+        )
+        self.assertEqual(
+            {note_id: base.labels(labels) for note_id, labels in expected.items()},
+            reader.annotations.mentions["humans"],
+        )
+        self.assertEqual({1, 4}, reader.note_range["humans"])
+        # Consensus doesn't introduce any new labels
+        self.assertEqual(base.labels({"Cough", "Fatigue", "Headache"}), reader.class_labels)
+
+    def test_default_majority(self):
+        reader = self.read_cold({"pair": {"consensus": ["john", "jill"]}})
+        self.assertEqual(
+            {
+                1: base.labels({"Cough", "Fatigue"}),
+                2: set(),
+                4: base.labels({"Fatigue"}),
+            },
+            reader.annotations.mentions["pair"],
+        )
+
+    def test_single_voter(self):
+        """Verify that a lone voter can be given as a plain string"""
+        reader = self.read_cold({"copy": {"consensus": "jill"}})
+        self.assertEqual(reader.annotations.mentions["jill"], reader.annotations.mentions["copy"])
+
+    def test_range_and_chaining(self):
+        """Verify that a configured range narrows the votes, and consensus can vote in consensus"""
+        reader = self.read_cold(
+            {
+                "pair": {"consensus": ["john", "jill"], "vote": "unanimous"},
+                "trio": {"consensus": ["pair", "jane"], "vote": 1},
+            },
+            ranges={"pair": [1, 2]},
+        )
+        self.assertEqual(
+            {1: base.labels({"Cough", "Fatigue"}), 2: set()}, reader.annotations.mentions["pair"]
+        )
+        self.assertEqual(
+            {1: base.labels({"Cough", "Fatigue", "Headache", "Label Not In Study"})},
+            reader.annotations.mentions["trio"],
+        )
+
+    def test_accuracy_against_consensus(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shutil.copy(f"{self.DATA_DIR}/cold/labelstudio-export.json", tmpdir)
+            common.write_json(
+                f"{tmpdir}/config.json",
+                {
+                    "labels": ["Cough", "Fatigue", "Headache"],
+                    "annotators": {
+                        "jane": 3,
+                        "john": 5,
+                        "jill": 6,
+                        "humans": {"consensus": ["jane", "john", "jill"]},
+                    },
+                    "ranges": {"jane": [1, 3, 4]},
+                },
+            )
+            stdout = self.run_cli("accuracy", "--csv", "humans", "jill", path=tmpdir)
+
+        self.assertEqual(
+            [
+                "f1,sens,spec,ppv,npv,kappa,tp,fn,tn,fp,label",
+                "0.75,0.75,0.5,0.75,0.5,0.25,3,1,1,1,*",
+                "0.667,1.0,0.0,0.5,,0.0,1,0,0,1,Cough",
+                "1.0,1.0,,1.0,,,2,0,0,0,Fatigue",
+                ",0.0,1.0,,0.5,0.0,0,1,1,0,Headache",
+            ],
+            stdout.splitlines(),
+        )
+
+    @ddt.data(
+        ({"consensus": []}, "Consensus annotator 'bad' needs a list of annotators to vote."),
+        ({"consensus": ["jill", "nope"]}, "Unrecognized annotator 'nope' in consensus 'bad'"),
+        ({"consensus": ["jill", "bad"]}, "Unrecognized annotator 'bad' in consensus 'bad'"),
+        (
+            {"consensus": ["jill", "jane"], "vote": 3},
+            "Did not understand vote '3' for consensus annotator 'bad'. "
+            "Use majority, unanimous, or a number of votes from 1 to 2.",
+        ),
+    )
+    @ddt.unpack
+    def test_bad_config(self, bad_config, message):
+        with self.assertRaises(ValueError) as cm:
+            self.read_cold({"bad": bad_config})
+        self.assertEqual(message, str(cm.exception))
@@ -0,0 +1,38 @@
+"""Tests for defines.py"""
+
+import ddt
+
+from tests import base
+
+
+@ddt.ddt
+class TestLabelMatcher(base.TestCase):
+    """Test case for label matching"""
+
+    @ddt.data(
+        (["A|B|C"], "A|B|C", True),
+        (["A|B|C"], "A|B|D", False),
+        (["A|B"], "A|B|C", False),
+        (["A|B|*"], "A|B|C", True),
+        (["A|B|*"], "A|E|F", False),
+        (["A|B|*"], "A", False),
+        (["A|*"], "A|B|C", True),
+        (["A|*"], "A", True),
+        (["A|*"], "X", False),
+        (["A"], "A", True),
+        (["A"], "A|B|C", False),
+        (["X", "Y|*", "A|B|*"], "A|B|C", True),
+        ([], "A", False),
+    )
+    @ddt.unpack
+    def test_is_match(self, patterns, label, expected):
+        matcher = base.LabelMatcher(*patterns)
+        self.assertEqual(expected, matcher.is_match(base.Label.parse(label)))
+
+    def test_matches_in_set(self):
+        matcher = base.LabelMatcher("A", "B|*", "C|D|*", "E|F|G", "H|I")
+        all_labels = base.labels({"A", "B", "B|X|Y", "C|D|E", "C|X|Y", "E|F|G", "E|F|H", "H", "Z"})
+        self.assertEqual(
+            base.labels({"A", "B", "B|X|Y", "C|D|E", "E|F|G"}), matcher.matches_in_set(all_labels)
+        )
+        self.assertEqual(base.labels({"A"}), base.LabelMatcher("A").matches_in_set(all_labels))
@@ -0,0 +1,148 @@
+"""Tests for encoding.py"""
+
+from unittest import mock
+
+import ddt
+import numpy as np
+
+from chart_review import agree, defines, encoding
+from tests import base
+
+
+@ddt.ddt
+class TestEncoding(base.TestCase):
+    """Test case for array encodings of mentions"""
+
+    @ddt.data(True, False)
+    def test_matches_agree(self, with_labels):
+        """Verify that encoded comparisons give the same counts as the basic agree code"""
+        all_labels = [base.Label(f"L{i}") for i in range(10)]
+        # Leave some notes out entirely
+        annotations = base.random_annotations(
+            ("alice", "bob", "carla"), all_labels, 50, note_chance=0.8
+        )
+        note_ranges = {
+            "alice": set(range(60)),  # some notes that nobody mentioned
+            "bob": set(range(0, 50, 2)),
+            "carla": set(range(40)),
+        }
+        # Without labels, every used label is scored
+        labels = set(all_labels[:8]) if with_labels else set()
+
+        pair_counts = encoding.all_pairs_confusion_counts(annotations, note_ranges, labels)
+
+        self.assertEqual(6, len(pair_counts))
+        for (truth, annotator), label_counts in pair_counts.items():
+            note_range = note_ranges[truth] & note_ranges[annotator]
+            expected = agree.confusion_counts_by_label(
+                annotations, truth, annotator, note_range, labels=labels
+            )
+            self.assertEqual(expected, label_counts)
+
+    @ddt.data(True, False)
+    def test_all_pairs_contingency_counts(self, with_labels):
+        """Verify that encoded contingency tables match the basic agree code"""
+        all_labels = [base.Label(f"L{i}") for i in range(10)]
+        annotators = ["bob", "carla", "dave"]
+        annotations = base.random_annotations(
+            ["alice", *annotators], all_labels, 50, note_chance=0.8
+        )
+        note_range = set(range(5, 60))
+        labels = set(all_labels[:8]) | {base.Label("Unused")} if with_labels else set()
+
+        pair_counts = encoding.all_pairs_contingency_counts(
+            annotations, "alice", annotators, note_range, labels
+        )
+
+        self.assertEqual([("bob", "carla"), ("bob", "dave"), ("carla", "dave")], list(pair_counts))
+        for (left, right), label_counts in pair_counts.items():
+            expected = agree.contingency_counts_by_label(
+                annotations, "alice", left, right, note_range, labels=labels
+            )
+            self.assertEqual(expected, label_counts)
+
+    def test_all_pairs_contingency_counts_stay_sparse(self):
+        """Verify that contingency tables are counted without building dense note arrays"""
+        annotations = defines.ProjectAnnotations(
+            mentions={
+                "alice": {1: base.labels({"A"}), 2: base.labels({"B"})},
+                "bob": {1: base.labels({"A"})},
+                "carla": {2: base.labels({"A", "B"})},
+            }
+        )
+        with mock.patch.object(encoding.MentionEncoding, "note_rows", side_effect=AssertionError):
+            pair_counts = encoding.all_pairs_contingency_counts(
+                annotations, "alice", ["bob", "carla"], {1, 2, 3}, set()
+            )
+        self.assertEqual(
+            {
+                ("bob", "carla"): {
+                    base.Label("A"): agree.ContingencyCounts(both_correct=1, only_left=2),
+                    base.Label("B"): agree.ContingencyCounts(both_correct=2, only_right=1),
+                }
+            },
+            pair_counts,
+        )
+
+    def test_unknown_annotator(self):
+        """Verify that an annotator without mentions is treated as all negative"""
+        annotations = defines.ProjectAnnotations(mentions={"alice": {1: base.labels({"A"})}})
+        encoded = encoding.MentionEncoding(annotations, base.labels({"A"}), ["alice", "bob"])
+        self.assertEqual(
+            {base.Label("A"): agree.ConfusionCounts(false_neg=1, true_neg=1)},
+            encoded.confusion_counts_by_label("alice", "bob", {1, 2}),
+        )
+
+    def test_sparse_cells(self):
+        """Verify that mentions are stored as sparse cells, and only densified on request"""
+        annotations = defines.ProjectAnnotations(
+            mentions={"alice": {1: base.labels({"A", "C"}), 5: base.labels({"B", "Other"})}}
+        )
+        encoded = encoding.MentionEncoding(annotations, base.labels({"A", "B", "C"}))
+        # Notes 1 & 5 are rows 0 & 1, and A/B/C are columns 0/1/2
+        np.testing.assert_array_equal([0, 2, 4], encoded.cells["alice"])
+        np.testing.assert_array_equal([True, True, True], encoded.label_use("alice"))
+        np.testing.assert_array_equal(
+            [[False, True, False], [False, False, False], [True, False, True]],
+            encoded.note_rows("alice", [5, 3, 1]),
+        )
+
+    @ddt.data(False, True)
+    def test_chart_cells_sum_to_counts(self, any_positive):
+        """Verify that per-chart cells add up to the usual accuracy table counts"""
+        all_labels = [base.Label("A", "B", f"V{i}") for i in range(4)]
+        all_labels += [base.Label(f"L{i}") for i in range(4)]
+        annotations = base.random_annotations(("alice", "bob"), all_labels, 30, note_chance=0.8)
+        note_range = set(range(35))
+        labels = set(all_labels[:-1])
+
+        encoded = encoding.MentionEncoding(annotations, labels)
+        cells = encoded.chart_cells("alice", "bob", note_range, any_positive=any_positive)
+        self.assertEqual(len(note_range), cells.true_pos.shape[0])
+        self.assertEqual(np.int8, cells.true_pos.dtype)
+
+        label_counts, rollups = agree.confusion_counts_with_rollups(
+            annotations, "alice", "bob", note_range, labels=labels, any_positive=any_positive
+        )
+        expected = {None: sum(label_counts.values(), agree.ConfusionCounts())}
+        expected |= label_counts | rollups
+
+        weights = np.ones(len(note_range), dtype=np.int64)
+        true_pos, false_neg, false_pos = (
+            weights @ cells.true_pos,
+            weights @ cells.false_neg,
+            weights @ cells.false_pos,
+        )
+        true_neg = cells.true_neg(weights, true_pos, false_neg, false_pos)
+        self.assertEqual(set(expected), set(cells.keys))
+        for index, key in enumerate(cells.keys):
+            self.assertEqual(
+                expected[key],
+                agree.ConfusionCounts(
+                    true_pos=int(true_pos[index]),
+                    false_neg=int(false_neg[index]),
+                    true_neg=int(true_neg[index]),
+                    false_pos=int(false_pos[index]),
+                ),
+                key,
+            )
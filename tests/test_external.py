@@ -1,11 +1,16 @@
 """Tests for external.py"""
 
+import os
 import tempfile
+from unittest import mock
 
-from chart_review import cohort, common, config
+import ddt
+
+from chart_review import cache, cohort, common, config, external, studio
 from tests import base
 
 
+@ddt.ddt
 class TestExternal(base.TestCase):
     """Test case for basic external ID merging"""
 
@@ -200,3 +205,202 @@ class TestExternal(base.TestCase):
 
             with self.assertRaisesRegex(ValueError, "no 'sublabel_value' column found"):
                 cohort.CohortReader(config.ProjectConfig(tmpdir))
+
+    def test_scores(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json", {"annotators": {"ext": {"filename": "ext.csv"}}}
+            )
+            common.write_json(
+                f"{tmpdir}/labelstudio-export.json",
+                [
+                    {"id": 1, "data": {"enc_id": "a", "docref_mappings": {"x": "y"}}},
+                    {"id": 2, "data": {"enc_id": "b", "docref_mappings": {"z": "w"}}},
+                ],
+            )
+            common.write_text(
+                f"{tmpdir}/ext.csv",
+                "encounter_id,label,score\na,Cough,0.5\na,Cough,0.75\na,Fever,\nb,Fever,0.25",
+            )
+            reader = cohort.CohortReader(config.ProjectConfig(tmpdir))
+
+        self.assertEqual(
+            {"ext": {1: base.labels({"Cough", "Fever"}), 2: base.labels({"Fever"})}},
+            reader.annotations.mentions,
+        )
+        # Fever has no score for chart 1, so it's always positive, and we take the max of dupes
+        self.assertEqual(
+            {"ext": {1: {base.Label("Cough"): 0.75}, 2: {base.Label("Fever"): 0.25}}},
+            reader.annotations.scores,
+        )
+
+    def test_bad_score(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json", {"annotators": {"ext": {"filename": "ext.csv"}}}
+            )
+            common.write_json(
+                f"{tmpdir}/labelstudio-export.json",
+                [{"id": 1, "data": {"enc_id": "a", "docref_mappings": {"x": "y"}}}],
+            )
+            common.write_text(f"{tmpdir}/ext.csv", "encounter_id,label,score\na,Cough,high")
+
+            with self.assertRaisesRegex(ValueError, "invalid score 'high'"):
+                cohort.CohortReader(config.ProjectConfig(tmpdir))
+
+    def test_cache(self):
+        """Verify that we cache resolved external annotations until the inputs change"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json",
+                {"annotators": {"ext": {"filename": "ext.csv"}}, "cache": True},
+            )
+            export = [{"id": 1, "data": {"enc_id": "a", "docref_mappings": {"x": "y"}}}]
+            common.write_json(f"{tmpdir}/labelstudio-export.json", export)
+            common.write_text(
+                f"{tmpdir}/ext.csv",
+                "encounter_id,label,sublabel_name,sublabel_value,score\na,A,B,C,0.5",
+            )
+            proj_config = config.ProjectConfig(tmpdir)
+
+            with mock.patch(
+                "chart_review.external._resolve_external", wraps=external._resolve_external
+            ) as mock_resolve:
+                # First load calculates and saves cache
+                reader = cohort.CohortReader(proj_config)
+                self.assertEqual(1, mock_resolve.call_count)
+                self.assertTrue(os.path.isdir(f"{tmpdir}/.chart-review-cache"))
+
+                # Second load uses the cache
+                cached_reader = cohort.CohortReader(proj_config)
+                self.assertEqual(1, mock_resolve.call_count)
+                self.assertEqual(reader.annotations, cached_reader.annotations)
+                self.assertEqual(
+                    {"ext": {1: {base.Label("A", "B", "C"): 0.5}}}, cached_reader.annotations.scores
+                )
+
+                # Changing the csv invalidates the cache
+                common.write_text(f"{tmpdir}/ext.csv", "encounter_id,label\na,Cough")
+                reader = cohort.CohortReader(proj_config)
+                self.assertEqual(2, mock_resolve.call_count)
+                self.assertEqual({"ext": {1: base.labels({"Cough"})}}, reader.annotations.mentions)
+
+                # Changing the export ID mappings invalidates the cache
+                export[0]["data"]["enc_id"] = "b"
+                common.write_json(f"{tmpdir}/labelstudio-export.json", export)
+                reader = cohort.CohortReader(proj_config)
+                self.assertEqual(3, mock_resolve.call_count)
+                self.assertEqual({"ext": {}}, reader.annotations.mentions)
+
+    def test_no_cache_by_default(self):
+        """Verify that we don't write anything into the project folder unless asked to"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json", {"annotators": {"ext": {"filename": "ext.csv"}}}
+            )
+            export = [{"id": 1, "data": {"enc_id": "a", "docref_mappings": {"x": "y"}}}]
+            common.write_json(f"{tmpdir}/labelstudio-export.json", export)
+            common.write_text(f"{tmpdir}/ext.csv", "encounter_id,label\na,Cough")
+
+            reader = cohort.CohortReader(config.ProjectConfig(tmpdir))
+            self.assertEqual({"ext": {1: base.labels({"Cough"})}}, reader.annotations.mentions)
+            self.assertFalse(os.path.exists(f"{tmpdir}/.chart-review-cache"))
+
+    def test_cache_save_fails(self):
+        """Verify that a cache we can't write to is not fatal"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json",
+                {"annotators": {"ext": {"filename": "ext.csv"}}, "cache": True},
+            )
+            export = [{"id": 1, "data": {"enc_id": "a", "docref_mappings": {"x": "y"}}}]
+            common.write_json(f"{tmpdir}/labelstudio-export.json", export)
+            common.write_text(f"{tmpdir}/ext.csv", "encounter_id,label\na,Cough")
+            # A plain file where the cache folder should be (works even when running as root)
+            common.write_text(f"{tmpdir}/.chart-review-cache", "")
+
+            reader = cohort.CohortReader(config.ProjectConfig(tmpdir))
+            self.assertEqual({"ext": {1: base.labels({"Cough"})}}, reader.annotations.mentions)
+            self.assertTrue(os.path.isfile(f"{tmpdir}/.chart-review-cache"))
+
+    @ddt.data(
+        {},
+        {"mentions": {}},
+        {"mentions": [], "scores": {}},
+        {"mentions": {"1": [["A", "B", "C", "D"]]}, "scores": {}},
+        {"mentions": {"x": [["A"]]}, "scores": {}},
+    )
+    def test_bad_cache_shape(self, data):
+        """Verify that a cache file in the wrong shape is treated as a cache miss"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json",
+                {"annotators": {"ext": {"filename": "ext.csv"}}, "cache": True},
+            )
+            export = [{"id": 1, "data": {"enc_id": "a", "docref_mappings": {"x": "y"}}}]
+            common.write_json(f"{tmpdir}/labelstudio-export.json", export)
+            common.write_text(f"{tmpdir}/ext.csv", "encounter_id,label\na,Cough")
+            proj_config = config.ProjectConfig(tmpdir)
+
+            # Write a cache file with the right key, but the wrong data
+            key = [
+                cache.digest_file(f"{tmpdir}/ext.csv"),
+                external.export_ids_digest(studio.ExportFile(tmpdir)),
+            ]
+            cache.save(tmpdir, "external", "ext", key, data)
+
+            reader = cohort.CohortReader(proj_config)
+            self.assertEqual({"ext": {1: base.labels({"Cough"})}}, reader.annotations.mentions)
+
+    def test_worker_loading(self):
+        """Verify that loading external annotators in worker processes gives the same result"""
+        proj_config = config.ProjectConfig(f"{self.DATA_DIR}/external")
+        reader = cohort.CohortReader(proj_config)
+        parallel_reader = cohort.CohortReader(proj_config, workers=2)
+        self.assertEqual(reader.annotations, parallel_reader.annotations)
+        # Annotators are added in config order, regardless of which finished loading first
+        self.assertEqual(
+            ["human", "icd10-doc", "icd10-enc"], list(parallel_reader.annotations.mentions)
+        )
+
+    def test_worker_simplifying(self):
+        """Verify that worker processes simplify their own external annotators"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            common.write_json(
+                f"{tmpdir}/config.json",
+                {
+                    "annotators": {
+                        "ext1": {"filename": "ext1.csv"},
+                        "ext2": {"filename": "ext2.csv"},
+                    },
+                    "implied-labels": {"kitten": "cat"},
+                    "grouped-labels": {"pet": ["cat", "dog"]},
+                    "ignore": [2],
+                },
+            )
+            export = [
+                {"id": 1, "data": {"enc_id": "a", "docref_mappings": {"x": "y"}}},
+                {"id": 2, "data": {"enc_id": "b", "docref_mappings": {"z": "w"}}},
+            ]
+            common.write_json(f"{tmpdir}/labelstudio-export.json", export)
+            common.write_text(
+                f"{tmpdir}/ext1.csv", "encounter_id,label,score\na,kitten,0.5\nb,dog,1"
+            )
+            common.write_text(f"{tmpdir}/ext2.csv", "encounter_id,label\na,dog\na,fish")
+            proj_config = config.ProjectConfig(tmpdir)
+
+            reader = cohort.CohortReader(proj_config)
+            parallel_reader = cohort.CohortReader(proj_config, workers=2)
+
+        self.assertEqual(reader.annotations, parallel_reader.annotations)
+        self.assertEqual(
+            {
+                "ext1": {1: base.labels({"kitten", "pet"})},
+                "ext2": {1: base.labels({"pet", "fish"})},
+            },
+            parallel_reader.annotations.mentions,
+        )
+        self.assertEqual(
+            {"ext1": {1: {base.Label("kitten"): 0.5, base.Label("pet"): 0.5}}},
+            parallel_reader.annotations.scores,
+        )
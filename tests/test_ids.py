@@ -1,6 +1,8 @@
 """Tests for commands/ids.py"""
 
+import io
 import tempfile
+from unittest import mock
 
 from chart_review import common
 from tests import base
@@ -119,3 +121,72 @@ class TestIDs(base.TestCase):
         self.assertEqual(2, len(lines))
         self.assertEqual("chart_id,original_fhir_id,anonymized_fhir_id", lines[0])
         self.assertEqual('1,"Encounter/Orig,\\ \'Enc","Encounter/Anon ""Enc"', lines[1])
+
+    @staticmethod
+    def make_lookup_project(tmpdir: str) -> None:
+        common.write_json(f"{tmpdir}/config.json", {})
+        common.write_json(
+            f"{tmpdir}/labelstudio-export.json",
+            [
+                {
+                    "id": 1,
+                    "data": {
+                        "enc_id": "Orig",
+                        "anon_id": "Anon",
+                        "docref_mappings": {"Orig1": "Anon1", "DiagnosticReport/Orig2": "Anon2"},
+                    },
+                },
+                {"id": 2, "data": {"anon_id": "Anon-Only"}},
+                {"id": 3},
+            ],
+        )
+
+    def test_lookup(self):
+        """Verify that we can look up chart IDs for a list of FHIR IDs"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.make_lookup_project(tmpdir)
+            common.write_text(
+                f"{tmpdir}/ids.txt",
+                "Encounter/Orig\n"
+                "Anon-Only\n"  # assumed to be an Encounter
+                "\n"  # blank lines are skipped
+                "DocumentReference/Anon1\n"
+                "DiagnosticReport/Orig2\n"
+                "DocumentReference/Nope\n"
+                "Patient/Orig\n",
+            )
+            stdout = self.run_cli("ids", "--lookup", f"{tmpdir}/ids.txt", path=tmpdir)
+
+        self.assertEqual(
+            [
+                "fhir_id,chart_id",
+                "Encounter/Orig,1",
+                "Anon-Only,2",
+                "DocumentReference/Anon1,1",
+                "DiagnosticReport/Orig2,1",
+                "DocumentReference/Nope,",
+                "Patient/Orig,",
+            ],
+            stdout.splitlines(),
+        )
+
+    def test_lookup_charts_from_stdin(self):
+        """Verify that we can look up FHIR IDs for a list of chart IDs"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.make_lookup_project(tmpdir)
+            with mock.patch("sys.stdin", new=io.StringIO("2\n1\n3\n4\nbogus\n")):
+                stdout = self.run_cli("ids", "--lookup-charts", "-", path=tmpdir)
+
+        self.assertEqual(
+            [
+                "chart_id,original_fhir_id,anonymized_fhir_id",
+                "2,,Encounter/Anon-Only",
+                "1,Encounter/Orig,Encounter/Anon",
+                "1,DocumentReference/Orig1,DocumentReference/Anon1",
+                "1,DocumentReference/DiagnosticReport/Orig2,DocumentReference/Anon2",
+                "3,,",
+                "4,,",
+                "bogus,,",
+            ],
+            stdout.splitlines(),
+        )
@@ -1,5 +1,14 @@
 """Tests for commands/mcnemar.py"""
 
+import math
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from chart_review import common
+from chart_review.commands import mcnemar
 from tests import base
 
 
@@ -77,3 +86,112 @@ N/A      0.5      1   1   0   0   Infection → Confirmed
 N/A      0.5      1   1   0   0   Infection → Suspected         
 """,
         )
+
+    def test_matches_scipy(self):
+        """Verify that our own p-values match SciPy's, on both sides of the exact cutoff"""
+        try:
+            from scipy.stats import binom, chi2
+        except ImportError:  # pragma: no cover
+            raise unittest.SkipTest("SciPy is not installed")
+
+        pairs = [(b, c) for b in range(40) for c in range(40)]
+        statistics, pvalues = mcnemar._mcnemar(
+            [b for b, _ in pairs], [c for _, c in pairs], continuity_correction=True
+        )
+
+        for (b, c), statistic, pvalue in zip(pairs, statistics, pvalues):
+            n_min, total = min(b, c), b + c
+            if total < mcnemar.EXACT_CUTOFF:
+                self.assertTrue(math.isnan(statistic))
+                expected = 2 * binom.cdf(n_min, total, 0.5) - binom.pmf(n_min, total, 0.5)
+            else:
+                self.assertAlmostEqual((abs(b - c) - 1) ** 2 / total, statistic)
+                expected = chi2.sf(statistic, 1)
+            self.assertAlmostEqual(expected, pvalue, places=12, msg=(b, c))
+
+    def make_panel_project(self, tmpdir: str) -> None:
+        """Copies the many-notes project, adding a fourth (consensus) annotator"""
+        shutil.copy(f"{self.DATA_DIR}/many-notes/labelstudio-export.json", tmpdir)
+        common.write_text(
+            f"{tmpdir}/config.yaml",
+            "annotators:\n"
+            "  alice: 1\n"
+            "  bob: 2\n"
+            "  carla: 3\n"
+            "  panel:\n"
+            "    consensus: [alice, bob, carla]\n",
+        )
+
+    def test_all_pairs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.make_panel_project(tmpdir)
+            stdout = self.run_cli("mcnemar", "alice", "bob", "carla", "panel", path=tmpdir)
+
+        self.assertEqual(
+            """Comparing 50 charts (1–50)
+Truth: alice
+Annotators: bob, carla, panel
+
+McNemar  P-value   BC  OL  OR  BW  Left   Right  Label
+12.375   4.35e-04  20  61  27  42  bob    carla  *    
+6.5      0.011     10  20  6   14  bob    carla  A    
+N/A      0.035     1   16  6   27  bob    carla  B    
+2.025    0.155     9   25  15  1   bob    carla  C    
+25.037   5.62e-07  81  0   27  42  bob    panel  *    
+N/A      0.016     30  0   6   14  bob    panel  A    
+N/A      0.016     17  0   6   27  bob    panel  B    
+N/A      3.05e-05  34  0   15  1   bob    panel  C    
+59.016   1.56e-14  47  0   61  42  carla  panel  *    
+N/A      9.54e-07  16  0   20  14  carla  panel  A    
+N/A      1.53e-05  7   0   16  27  carla  panel  B    
+23.04    1.59e-06  24  0   25  1   carla  panel  C    
+""",
+            stdout,
+        )
+
+    def test_all_pairs_adjusted_csv(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.make_panel_project(tmpdir)
+            stdout = self.run_cli(
+                "mcnemar", "--csv", "--adjust=holm", "alice", "bob", "carla", "panel", path=tmpdir
+            )
+
+        self.assertEqual(
+            [
+                "mcnemar,p-value,adj_p-value,bc,ol,or,bw,left,right,label",
+                "12.375,4.35e-04,4.35e-04,20,61,27,42,bob,carla,*",
+                "6.5,0.011,0.022,10,20,6,14,bob,carla,A",
+                ",0.035,0.035,1,16,6,27,bob,carla,B",
+                "2.025,0.155,0.155,9,25,15,1,bob,carla,C",
+                "25.037,5.62e-07,1.12e-06,81,0,27,42,bob,panel,*",
+                ",0.016,0.022,30,0,6,14,bob,panel,A",
+                ",0.016,0.031,17,0,6,27,bob,panel,B",
+                ",3.05e-05,6.10e-05,34,0,15,1,bob,panel,C",
+                "59.016,1.56e-14,4.69e-14,47,0,61,42,carla,panel,*",
+                ",9.54e-07,2.86e-06,16,0,20,14,carla,panel,A",
+                ",1.53e-05,4.58e-05,7,0,16,27,carla,panel,B",
+                "23.04,1.59e-06,4.76e-06,24,0,25,1,carla,panel,C",
+            ],
+            stdout.splitlines(),
+        )
+
+    def test_too_few_annotators(self):
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("mcnemar", "john", "jill", path=f"{self.DATA_DIR}/cold")
+        self.assertEqual(
+            "Please specify at least two annotators to compare with the truth.\n",
+            stderr.getvalue(),
+        )
+
+    def test_adjustments(self):
+        """Verify the multiple comparison adjustments against hand-checked values"""
+        pvalues = np.array([[0.01, 0.5], [0.04, 0.2], [0.03, 0.9], [0.005, 0.6]])
+        expected = {
+            "bonferroni": [[0.04, 1.0], [0.16, 0.8], [0.12, 1.0], [0.02, 1.0]],
+            "holm": [[0.03, 1.0], [0.06, 0.8], [0.06, 1.0], [0.02, 1.0]],
+            "fdr": [[0.02, 0.8], [0.04, 0.8], [0.04, 0.9], [0.02, 0.8]],
+        }
+        for method, adjusted in expected.items():
+            with self.subTest(method):
+                np.testing.assert_allclose(mcnemar.ADJUSTMENTS[method](pvalues), adjusted)
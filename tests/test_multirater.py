@@ -0,0 +1,73 @@
+"""Tests for commands/multirater.py"""
+
+from tests import base
+
+
+class TestMultirater(base.TestCase):
+    """Test case for the multirater command"""
+
+    def test_default_output(self):
+        stdout = self.run_cli("multirater", path=f"{self.DATA_DIR}/cold")
+
+        self.assertEqual(
+            """Comparing 4 charts (1–4)
+Annotators: jane, john, jill
+
+Kappa   Alpha   Label   
+0.333   0.356   *       
+0.653   0.625   Cough   
+0.405   0.571   Fatigue 
+-0.215  -0.125  Headache
+""",
+            stdout,
+        )
+
+    def test_csv(self):
+        stdout = self.run_cli("multirater", "--csv", "jill", "jane", path=f"{self.DATA_DIR}/cold")
+
+        self.assertEqual(
+            [
+                "kappa,alpha,label",
+                "0.333,0.37,*",
+                "0.333,0.444,Cough",
+                "1.0,1.0,Fatigue",
+                "-0.5,-0.25,Headache",
+            ],
+            stdout.splitlines(),
+        )
+
+    def test_sublabels(self):
+        stdout = self.run_cli("multirater", "--csv", path=f"{self.DATA_DIR}/sublabels")
+
+        self.assertEqual(
+            [
+                "kappa,alpha,label",
+                "0.395,0.408,*",
+                "-0.2,0.0,Deceased",
+                "1.0,1.0,Deceased → *",
+                "1.0,1.0,Deceased → False",
+                "0.455,0.545,Deceased → Datetime → *",
+                "0.25,0.375,Deceased → Datetime → 11/12/25",
+                "-0.2,0.0,Deceased → Datetime → 11/13/25",
+                "1.0,1.0,Fungal → *",
+                "1.0,1.0,Fungal → Confirmed",
+                "-0.2,0.0,Infection",
+                "0.455,0.545,Infection → *",
+                "-0.2,0.0,Infection → Confirmed",
+                "0.25,0.375,Infection → Suspected",
+            ],
+            stdout.splitlines(),
+        )
+
+    def test_bad_annotators(self):
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("multirater", "jill", "nope", path=f"{self.DATA_DIR}/cold")
+        self.assertEqual("Unrecognized annotator 'nope'\n", stderr.getvalue())
+
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("multirater", "jill", "jill", path=f"{self.DATA_DIR}/cold")
+        self.assertEqual(
+            "Please specify at least two different annotators to compare.\n", stderr.getvalue()
+        )
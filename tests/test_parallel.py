@@ -0,0 +1,36 @@
+"""Tests for parallel.py"""
+
+import ddt
+import numpy as np
+
+from chart_review import parallel
+from tests import base
+
+
+def _scale(factor: int, value: int, offset: int) -> int:
+    return factor * value + offset
+
+
+def _draw(payload: str, seed: np.random.SeedSequence, size: int) -> tuple[str, list[int]]:
+    return payload, list(np.random.default_rng(seed).integers(0, 1000, size=size))
+
+
+@ddt.ddt
+class TestParallel(base.TestCase):
+    """Test case for spreading work across processes"""
+
+    @ddt.data(None, 1, 2)
+    def test_map_with_payload(self, workers):
+        """Verify that every call gets the payload, and results come back in order"""
+        results = parallel.map_with_payload(_scale, 10, [1, 2, 3], [0, 5, 0], workers=workers)
+        self.assertEqual([10, 25, 30], results)
+
+    def test_map_with_payload_no_calls(self):
+        self.assertEqual([], parallel.map_with_payload(_scale, 10, [], [], workers=2))
+
+    def test_map_batches(self):
+        """Verify that batches cover every iteration and don't depend on the workers"""
+        batches = parallel.map_batches(_draw, "cells", 250, seed=5)
+        self.assertEqual([100, 100, 50], [len(values) for _, values in batches])
+        self.assertEqual({"cells"}, {payload for payload, _ in batches})
+        self.assertEqual(batches, parallel.map_batches(_draw, "cells", 250, seed=5, workers=2))
@@ -0,0 +1,196 @@
+"""Tests for permutation.py and commands/permutation.py"""
+
+import math
+
+import ddt
+import numpy as np
+
+from chart_review import agree, defines, encoding, permutation
+from chart_review.commands import permutation as permutation_command
+from tests import base
+
+
+class TestPairedTest(base.TestCase):
+    """Test case for paired permutation tests"""
+
+    def setUp(self):
+        super().setUp()
+        all_labels = [base.Label(f"L{i}") for i in range(5)]
+        self.annotations = base.random_annotations(
+            ("alice", "bob", "carla"), all_labels, 40, max_labels=2
+        )
+        self.labels = set(all_labels)
+        self.note_range = set(range(40))
+
+    def chart_cells(self, left: str, right: str) -> tuple[encoding.ChartCells, ...]:
+        people = ["alice", left, right]
+        encoded = encoding.MentionEncoding(self.annotations, self.labels, people)
+        return tuple(
+            encoded.chart_cells("alice", annotator, self.note_range, used_by=people)
+            for annotator in (left, right)
+        )
+
+    def test_swaps_match_swapped_mentions(self):
+        """Verify that a vectorized swap scores the same as actually swapping the mentions"""
+        left, right = self.chart_cells("bob", "carla")
+        swapped = [3, 4, 10, 25, 39]
+        swaps = np.zeros((1, 40), dtype=np.int64)
+        swaps[0, swapped] = 1
+        differences = permutation._differences(left, right, swaps)
+
+        mentions = self.annotations.mentions
+        bob, carla = dict(mentions["bob"]), dict(mentions["carla"])
+        for note_id in swapped:
+            bob[note_id], carla[note_id] = carla[note_id], bob[note_id]
+        swapped_annotations = defines.ProjectAnnotations(
+            mentions={"alice": mentions["alice"], "bob": bob, "carla": carla}
+        )
+
+        def scores(annotator: str) -> dict:
+            label_counts = agree.confusion_counts_by_label(
+                swapped_annotations, "alice", annotator, self.note_range, labels=self.labels
+            )
+            overall = sum(label_counts.values(), agree.ConfusionCounts())
+            return agree.score_matrix(overall)
+
+        bob_scores, carla_scores = scores("bob"), scores("carla")
+        for metric in permutation.METRICS:
+            self.assertAlmostEqual(
+                bob_scores[metric] - carla_scores[metric], differences[metric][0, 0], msg=metric
+            )
+
+    def test_seeded(self):
+        """Verify that a seed gives reproducible p-values, no matter how many workers we use"""
+        left, right = self.chart_cells("bob", "carla")
+        results = permutation.paired_test(left, right, 250, seed=5)
+        self.assertEqual(set(permutation.METRICS), set(results))
+
+        with_workers = permutation.paired_test(left, right, 250, seed=5, workers=2)
+        for metric in permutation.METRICS:
+            np.testing.assert_array_equal(results[metric][1], with_workers[metric][1])
+
+        # The smallest p-value we can see is one over the number of permutations (plus one)
+        pvalues = results["Kappa"][1]
+        self.assertTrue(np.all(pvalues >= 1 / 251))
+        self.assertTrue(np.all(pvalues <= 1))
+
+    def test_same_annotator(self):
+        """Verify that comparing an annotator against a copy of themselves finds no difference"""
+        self.annotations.mentions["bob2"] = self.annotations.mentions["bob"]
+        left, right = self.chart_cells("bob", "bob2")
+        observed, pvalues = permutation.paired_test(left, right, 50, seed=5)["Kappa"]
+        np.testing.assert_array_equal(np.zeros(len(left.keys)), observed)
+        np.testing.assert_array_equal(np.ones(len(left.keys)), pvalues)
+
+
+@ddt.ddt
+class TestPermutationCommand(base.TestCase):
+    """Test case for the permutation command"""
+
+    def test_default_output(self):
+        stdout = self.run_cli(
+            "permutation",
+            "--iterations=2000",
+            "--seed=1",
+            "alice",
+            "bob",
+            "carla",
+            path=f"{self.DATA_DIR}/many-notes",
+        )
+
+        self.assertEqual(
+            """Comparing 50 charts (1–50)
+Truth: alice
+Annotators: bob, carla
+Differences are bob minus carla, over 2000 permutations.
+
+F1 Diff  F1 P-value  Kappa Diff  Kappa P-value  Label
+0.237    0.001       0.396       0.002          *    
+0.308    0.01        0.119       0.01           A    
+0.274    0.051       0.017       0.051          B    
+-0.205   0.233       -0.186      0.417          C    
+""",
+            stdout,
+        )
+
+    def test_pvalue_formatting(self):
+        """Verify that p-values too small to round are shown in scientific notation"""
+        self.assertEqual("0.012", permutation_command._pvalue_to_str(0.01234))
+        self.assertEqual("2.00e-04", permutation_command._pvalue_to_str(1 / 5001))
+        self.assertEqual("-", permutation_command._pvalue_to_str(math.nan))
+
+    @ddt.data(None, 2)
+    def test_csv(self, workers):
+        """Verify that seeded p-values are reproducible, regardless of worker count"""
+        workers_args = [f"--workers={workers}"] if workers else []
+        stdout = self.run_cli(
+            "permutation",
+            "--csv",
+            "--iterations=2000",
+            "--seed=1",
+            *workers_args,
+            "alice",
+            "bob",
+            "carla",
+            path=f"{self.DATA_DIR}/many-notes",
+        )
+
+        self.assertEqual(
+            [
+                "f1_diff,f1_p-value,kappa_diff,kappa_p-value,label",
+                "0.237,0.001,0.396,0.002,*",
+                "0.308,0.01,0.119,0.01,A",
+                "0.274,0.051,0.017,0.051,B",
+                "-0.205,0.233,-0.186,0.417,C",
+            ],
+            stdout.splitlines(),
+        )
+
+    def test_sublabels(self):
+        stdout = self.run_cli(
+            "permutation",
+            "--csv",
+            "--iterations=100",
+            "--seed=1",
+            "alice",
+            "bob",
+            "carla",
+            path=f"{self.DATA_DIR}/sublabels",
+        )
+
+        self.assertEqual(
+            [
+                "f1_diff,f1_p-value,kappa_diff,kappa_p-value,label",
+                "-0.067,1.0,-0.12,1.0,*",
+                ",,0.0,1.0,Deceased",
+                "0.0,1.0,0.0,1.0,Deceased → *",
+                "0.0,1.0,0.0,1.0,Deceased → False",
+                ",,-1.333,1.0,Deceased → Datetime → *",
+                ",,-1.0,1.0,Deceased → Datetime → 11/12/25",
+                ",,,,Deceased → Datetime → 11/13/25",
+                "0.0,1.0,0.0,1.0,Fungal → *",
+                "0.0,1.0,0.0,1.0,Fungal → Confirmed",
+                ",,,,Infection",
+                ",,1.333,1.0,Infection → *",
+                ",,,,Infection → Confirmed",
+                ",,1.0,1.0,Infection → Suspected",
+            ],
+            stdout.splitlines(),
+        )
+
+    def test_bad_args(self):
+        path = f"{self.DATA_DIR}/cold"
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("permutation", "--iterations=0", "jill", "jane", "john", path=path)
+        self.assertEqual("--iterations needs at least one permutation.\n", stderr.getvalue())
+
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("permutation", "jill", "nope", "john", path=path)
+        self.assertEqual("Unrecognized annotator 'nope'\n", stderr.getvalue())
+
+        with self.capture_stderr() as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_cli("permutation", "jill", "john", "john", path=path)
+        self.assertEqual("Can’t compare the same annotator with themselves.\n", stderr.getvalue())
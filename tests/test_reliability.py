@@ -0,0 +1,84 @@
+"""Tests for reliability.py"""
+
+import math
+
+import numpy as np
+
+from chart_review import defines, reliability
+from tests import base
+
+
+class TestReliability(base.TestCase):
+    """Test case for multi-rater agreement scores"""
+
+    def test_fleiss_kappa(self):
+        """Verify we match the worked example from Wikipedia (14 raters, 5 categories)"""
+        counts = np.array(
+            [
+                [0, 0, 0, 0, 14],
+                [0, 2, 6, 4, 2],
+                [0, 0, 3, 5, 6],
+                [0, 3, 9, 2, 0],
+                [2, 2, 8, 1, 1],
+                [7, 7, 0, 0, 0],
+                [3, 2, 6, 3, 0],
+                [2, 5, 3, 2, 2],
+                [6, 5, 2, 1, 0],
+                [0, 2, 2, 3, 7],
+            ]
+        )
+        self.assertAlmostEqual(0.210, reliability.fleiss_kappa(counts), places=3)
+
+    def test_krippendorff_alpha(self):
+        """Verify we match Krippendorff's own nominal example (4 observers, missing data)"""
+        ratings = [
+            [1, 2, 3, 3, 2, 1, 4, 1, 2, None, None, None],
+            [1, 2, 3, 3, 2, 2, 4, 1, 2, 5, None, 3],
+            [None, 3, 3, 3, 2, 3, 4, 2, 2, 5, 1, None],
+            [1, 2, 3, 3, 2, 4, 4, 1, 2, 5, 1, None],
+        ]
+        counts = np.zeros((12, 6), dtype=int)
+        for observer in ratings:
+            for unit, value in enumerate(observer):
+                if value is not None:
+                    counts[unit, value] += 1
+        self.assertAlmostEqual(0.743, reliability.krippendorff_alpha(counts), places=3)
+
+    def test_undefined_scores(self):
+        """Verify that unanimous or unpairable ratings give NaN rather than an error"""
+        unanimous = np.array([[3, 0], [3, 0]])
+        self.assertTrue(math.isnan(reliability.fleiss_kappa(unanimous)))
+        self.assertTrue(math.isnan(reliability.krippendorff_alpha(unanimous)))
+
+        lonely = np.array([[1, 0], [0, 1]])  # only one rater per chart
+        self.assertTrue(math.isnan(reliability.fleiss_kappa(lonely)))
+        self.assertTrue(math.isnan(reliability.krippendorff_alpha(lonely)))
+
+    def test_rater_counts(self):
+        annotations = defines.ProjectAnnotations(
+            mentions={
+                "alice": {1: base.labels({"A", "B|Color|Red"}), 2: base.labels({"B|Color|Blue"})},
+                "bob": {1: base.labels({"A", "B|Color|Red", "B|Color|Blue"})},
+                "carla": {2: base.labels({"A"})},
+            },
+        )
+        note_ranges = {"alice": {1, 2}, "bob": {1, 2}, "carla": {2, 3}}
+        labels = base.labels({"A", "B|Color|Red", "B|Color|Blue"})
+
+        counts = reliability.rater_counts(annotations, note_ranges, labels)
+
+        # Rows are charts 1-3, columns are no & yes
+        np.testing.assert_array_equal([[0, 2], [2, 1], [1, 0]], counts[base.Label("A")])
+        np.testing.assert_array_equal(
+            [[1, 1], [2, 1], [1, 0]], counts[base.Label("B", "Color", "Blue")]
+        )
+        self.assertEqual((9, 2), counts[None].shape)
+
+        # Nominal categories: nothing, {Red}, {Blue}, {Red, Blue}
+        wildcard = counts[base.Label("B", "Color", "*")]
+        self.assertEqual((3, 4), wildcard.shape)
+        self.assertEqual([0, 2, 1], list(wildcard[:, 0]))  # raters that picked nothing
+        self.assertEqual([2, 3, 1], list(wildcard.sum(axis=1)))  # raters per chart
+        self.assertEqual(  # each value combination, by chart (column order doesn't matter)
+            [[0, 1, 0], [1, 0, 0], [1, 0, 0]], sorted(wildcard[:, 1:].T.tolist())
+        )
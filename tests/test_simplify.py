@@ -1,11 +1,26 @@
 """Tests for simplify.py"""
 
+from unittest import mock
+
 import ddt
 
 from chart_review import defines, simplify
 from tests import base
 
 
+def simplify_mentions(annotations: defines.ProjectAnnotations, **kwargs) -> None:
+    """Simplifies every annotator's mentions & the project labels in place (like CohortReader)"""
+    simplifier = simplify.MentionSimplifier(**kwargs)
+    for annotator, mentions in annotations.mentions.items():
+        mentions, scores = simplifier.simplify_mentions(
+            mentions, annotations.scores.get(annotator, {})
+        )
+        annotations.mentions[annotator] = mentions
+        if annotator in annotations.scores:
+            annotations.scores[annotator] = scores
+    simplifier.simplify_project_labels(annotations.labels)
+
+
 @ddt.ddt
 class TestSimplify(base.TestCase):
     """Test case for annotation simplification"""
@@ -26,7 +41,7 @@ class TestSimplify(base.TestCase):
                 "katherine": {1: base.labels(input_labels)},
             },
         )
-        simplify.simplify_mentions(
+        simplify_mentions(
             annotations,
             implied_labels={
                 base.LabelMatcher("Cat"): base.labels({"Animal", "Pet"}),
@@ -52,7 +67,7 @@ class TestSimplify(base.TestCase):
                 },
             },
         )
-        simplify.simplify_mentions(
+        simplify_mentions(
             annotations,
             implied_labels={},
             grouped_labels={base.Label("Painted"): base.LabelMatcher("Blue", "Green", "Red")},
@@ -77,7 +92,7 @@ class TestSimplify(base.TestCase):
     def test_sublabel_implied_matching(self, labels, config, add_to_expected):
         labels = base.labels(labels)
         annotations = defines.ProjectAnnotations(labels=labels, mentions={"alice": {1: labels}})
-        simplify.simplify_mentions(
+        simplify_mentions(
             annotations,
             implied_labels={base.LabelMatcher(*config): base.labels({"Implied"})},
             grouped_labels={},
@@ -99,10 +114,138 @@ class TestSimplify(base.TestCase):
             labels=all_labels,
             mentions={"alice": {1: all_labels}},
         )
-        simplify.simplify_mentions(
+        simplify_mentions(
             annotations,
             implied_labels={},
             grouped_labels={base.Label("Group"): base.LabelMatcher(*config)},
         )
         self.assertEqual(annotations.mentions["alice"][1], base.labels(expected))
         self.assertEqual(annotations.labels, base.labels(expected))
+
+    def test_scores_follow_conversions(self):
+        """Verify that confidence scores are carried over to implied and grouped labels."""
+        annotations = defines.ProjectAnnotations(
+            labels=base.labels({"Cat", "Dog", "Fish"}),
+            mentions={
+                "nlp": {
+                    1: base.labels({"Cat", "Dog"}),
+                    2: base.labels({"Cat", "Fish"}),
+                },
+            },
+            scores={
+                "nlp": {
+                    1: {base.Label("Cat"): 0.25, base.Label("Dog"): 0.75},
+                    2: {base.Label("Cat"): 0.5},  # Fish is unscored
+                },
+            },
+        )
+        simplify_mentions(
+            annotations,
+            implied_labels={
+                base.LabelMatcher("Cat"): base.labels({"Whiskers"}),
+                base.LabelMatcher("Fish"): base.labels({"Whiskers"}),
+            },
+            grouped_labels={base.Label("Pet"): base.LabelMatcher("Cat", "Dog")},
+        )
+        self.assertEqual(
+            {
+                1: {base.Label("Pet"): 0.75, base.Label("Whiskers"): 0.25},
+                2: {base.Label("Pet"): 0.5},  # Whiskers is implied by unscored Fish
+            },
+            annotations.scores["nlp"],
+        )
+
+    def test_implied_closure(self):
+        """Verify that we precompile the full chain of implied labels, including wildcards."""
+        closure = simplify.ImpliedLabelClosure(
+            {
+                base.LabelMatcher("Heart|*"): base.labels({"Cardiac"}),
+                base.LabelMatcher("Cardiac"): base.labels({"Organ", "Cardiac"}),
+                base.LabelMatcher("Organ"): base.labels({"Body"}),
+            },
+            vocabulary=base.labels({"Heart|Type|Attack", "Lung"}),
+        )
+        self.assertEqual(
+            base.labels({"Heart|Type|Attack", "Cardiac", "Organ", "Body"}),
+            closure.expand(base.Label("Heart", "Type", "Attack")),
+        )
+        self.assertEqual(base.labels({"Lung"}), closure.expand(base.Label("Lung")))
+        # Not in the original vocabulary, but we can still handle it
+        self.assertEqual(
+            base.labels({"Heart", "Cardiac", "Organ", "Body"}), closure.expand(base.Label("Heart"))
+        )
+
+    def test_simplifier_vocabulary(self):
+        """Verify that the vocabulary is compiled up front, so known labels skip all matching"""
+        simplifier = simplify.MentionSimplifier(
+            implied_labels={base.LabelMatcher("Heart|*"): base.labels({"Cardiac"})},
+            grouped_labels={base.Label("Organ"): base.LabelMatcher("Cardiac", "Lung")},
+            vocabulary=base.labels({"Heart|Type|Attack", "Lung"}),
+        )
+        with mock.patch.object(defines.LabelMatcher, "is_match", side_effect=AssertionError):
+            self.assertEqual(
+                base.labels({"Heart|Type|Attack", "Organ"}),
+                simplifier.simplify_labels(base.labels({"Heart|Type|Attack", "Lung"})),
+            )
+
+    def test_group_map(self):
+        """Verify that we precompile each label's group, with the first matching group winning."""
+        groups = simplify.GroupedLabelMap(
+            {
+                base.Label("Heart"): base.LabelMatcher("Heart|*", "Attack"),
+                base.Label("Attack"): base.LabelMatcher("Attack", "Heart|Type|Attack"),
+            },
+            vocabulary=base.labels({"Heart|Type|Attack", "Lung"}),
+        )
+        self.assertEqual(base.Label("Heart"), groups.convert(base.Label("Heart", "Type", "Attack")))
+        self.assertEqual(base.Label("Lung"), groups.convert(base.Label("Lung")))
+        # Not in the original vocabulary, but we can still handle it
+        self.assertEqual(base.Label("Heart"), groups.convert(base.Label("Attack")))
+        # Whether a label is grouped at all decides if it stays a project label
+        self.assertTrue(groups.is_grouped(base.Label("Attack")))
+        self.assertFalse(groups.is_grouped(base.Label("Lung")))
+
+    def test_groups_apply_in_order(self):
+        """Verify that a later group can absorb an earlier group, since groups apply in turn"""
+        annotations = defines.ProjectAnnotations(
+            labels=base.labels({"Heart|Type|Attack", "Lung", "Other"}),
+            mentions={
+                "alice": {1: base.labels({"Heart|Type|Attack", "Other"}), 2: base.labels({"Lung"})},
+                "bob": {1: base.labels({"Other"})},
+            },
+        )
+        simplify_mentions(
+            annotations,
+            implied_labels={},
+            grouped_labels={
+                base.Label("Heart"): base.LabelMatcher("Heart|*"),
+                base.Label("Organ"): base.LabelMatcher("Heart", "Lung"),
+            },
+        )
+        self.assertEqual(
+            {
+                "alice": {1: base.labels({"Organ", "Other"}), 2: base.labels({"Organ"})},
+                "bob": {1: base.labels({"Other"})},
+            },
+            annotations.mentions,
+        )
+        # The "Heart" group label is itself grouped away, so it isn't a project label
+        self.assertEqual(base.labels({"Organ", "Other"}), annotations.labels)
+
+    def test_group_label_matched_by_earlier_group(self):
+        """Verify that groups are not re-applied: an earlier group can't absorb a later one"""
+        annotations = defines.ProjectAnnotations(
+            labels=base.labels({"Heart|Type|Attack"}),
+            mentions={"alice": {1: base.labels({"Heart|Type|Attack"})}},
+        )
+        simplify_mentions(
+            annotations,
+            implied_labels={},
+            grouped_labels={
+                base.Label("Organ"): base.LabelMatcher("Heart"),
+                base.Label("Heart"): base.LabelMatcher("Heart|*"),
+            },
+        )
+        self.assertEqual({"alice": {1: base.labels({"Heart"})}}, annotations.mentions)
+        # But any label that a group matches is still dropped from the project labels
+        self.assertEqual(base.labels({"Organ"}), annotations.labels)
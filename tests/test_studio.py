@@ -92,6 +92,12 @@ class TestStudio(base.TestCase):
                                     "result": [{"value": {"labels": ["LabelB"]}}],
                                 },
                             ],
+                            "predictions": [
+                                {
+                                    "model_version": "v1",
+                                    "result": [{"value": {"labels": ["LabelF"]}}],
+                                },
+                            ],
                             "data": {
                                 "docref_mappings": {"A": "anonA", "B": "anonB"},
                             },
@@ -114,6 +120,16 @@ class TestStudio(base.TestCase):
                                     "result": [{"value": {"labels": ["LabelD"]}}],
                                 },
                             ],
+                            "predictions": [
+                                {
+                                    "model_version": "v1",
+                                    "result": [{"value": {"labels": ["LabelG"]}}],
+                                },
+                                {
+                                    "model_version": "v2",
+                                    "result": [{"value": {"labels": ["LabelH"]}}],
+                                },
+                            ],
                             "data": {
                                 "docref_mappings": {"A": "anonA", "B": "anonB"},
                             },
@@ -166,6 +182,19 @@ class TestStudio(base.TestCase):
                                 "result": [{"value": {"labels": ["LabelD"]}}],
                             },
                         ],
+                        "predictions": [
+                            {
+                                "model_version": "v1",
+                                "result": [
+                                    {"value": {"labels": ["LabelF"]}},
+                                    {"value": {"labels": ["LabelG"]}},
+                                ],
+                            },
+                            {
+                                "model_version": "v2",
+                                "result": [{"value": {"labels": ["LabelH"]}}],
+                            },
+                        ],
                         "data": {
                             "docref_mappings": {"A": "anonA", "B": "anonB"},
                         },